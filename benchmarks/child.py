@@ -0,0 +1,58 @@
+"""
+Child process wrapper used by the benchmark runner.
+
+Runs one MyGit command line in-process with object store reads counted,
+then writes the counters as JSON.
+
+Usage:
+    python3 benchmarks/child.py COUNTERS_FILE COMMAND [ARGS...]
+
+COMMAND "@layout" loads and lays out the commit graph of visualize.py
+without drawing it (so matplotlib isn't needed).
+"""
+import os
+import sys
+import json
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+
+def main():
+    counters_path = sys.argv[1]
+    argv = sys.argv[2:]
+    os.environ["MYGIT_NO_DAEMON"] = "1"
+
+    from git_object import GitObject
+
+    counters = {"objects_read": 0, "exit_status": 0}
+    read_uncached = GitObject._read_uncached
+
+    def counting_read(object_hash):
+        counters["objects_read"] += 1
+        return read_uncached(object_hash)
+
+    GitObject._read_uncached = staticmethod(counting_read)
+
+    try:
+        if argv[0] == "@layout":
+            import visualize
+            graph = visualize.CommitGraph()
+            graph.load()
+            graph.layout()
+        else:
+            import main as mygit
+            mygit.run_command(argv)
+    except SystemExit as e:
+        counters["exit_status"] = e.code if isinstance(e.code, int) else 1
+    finally:
+        sys.stdout.flush()
+        with open(counters_path, "w") as f:
+            json.dump(counters, f)
+
+    return counters["exit_status"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
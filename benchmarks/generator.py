@@ -0,0 +1,341 @@
+"""
+Deterministic synthetic repository generator.
+
+Repositories are built straight into the object store (no subprocess per
+commit) from a seeded random generator and fixed commit timestamps, so the
+same RepositorySpec always produces byte-identical objects and refs.
+
+Usage:
+    python3 -m benchmarks.generator DIRECTORY [--preset small] [--files N] ...
+"""
+import os
+import sys
+import math
+import random
+import argparse
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+# First commit timestamp and spacing between commits
+EPOCH = 1_600_000_000
+COMMIT_INTERVAL = 60
+
+WORDS = (
+    "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi "
+    "omicron pi rho sigma tau upsilon phi chi psi omega return import class def "
+    "value index object tree commit branch merge"
+).split()
+
+
+class RepositorySpec:
+    """
+    Shape of a generated repository.
+
+    Attributes:
+        files: Number of files in the first commit
+        mean_file_size: Mean file size in bytes
+        size_distribution: 'fixed', 'uniform' (0..2*mean) or 'lognormal'
+        binary_ratio: Fraction of files holding incompressible random bytes
+        depth: Maximum directory depth
+        fanout: Subdirectories per directory
+        commits: Number of commits on main
+        changes_per_commit: Files modified by each commit
+        branch_interval: Fork a feature branch every N main commits (0 = never)
+        branch_length: Commits on each feature branch
+        merge_branches: Merge feature branches back into main
+        seed: Random seed
+    """
+
+    FIELDS = (
+        "files", "mean_file_size", "size_distribution", "binary_ratio", "depth",
+        "fanout", "commits", "changes_per_commit", "branch_interval",
+        "branch_length", "merge_branches", "seed"
+    )
+
+    def __init__(self, files=200, mean_file_size=2048, size_distribution="lognormal",
+                 binary_ratio=0.05, depth=3, fanout=4, commits=50, changes_per_commit=5,
+                 branch_interval=10, branch_length=3, merge_branches=True, seed=1):
+        self.files = files
+        self.mean_file_size = mean_file_size
+        self.size_distribution = size_distribution
+        self.binary_ratio = binary_ratio
+        self.depth = depth
+        self.fanout = fanout
+        self.commits = commits
+        self.changes_per_commit = changes_per_commit
+        self.branch_interval = branch_interval
+        self.branch_length = branch_length
+        self.merge_branches = merge_branches
+        self.seed = seed
+
+    def to_dict(self):
+        """Return the spec as a JSON-serialisable dictionary."""
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def copy(self, **overrides):
+        """Return a copy of the spec with some fields replaced."""
+        values = self.to_dict()
+        values.update(overrides)
+        return RepositorySpec(**values)
+
+
+PRESETS = {
+    "small": RepositorySpec(files=200, commits=50, branch_interval=10),
+    "medium": RepositorySpec(files=2000, commits=200, changes_per_commit=20, branch_interval=20, branch_length=5),
+    "large": RepositorySpec(files=20000, commits=1000, changes_per_commit=50, branch_interval=50, branch_length=10),
+}
+
+
+class _Builder:
+    """Builds commits from path -> blob hash snapshots, reusing unchanged subtrees."""
+
+    def __init__(self, repo_root, spec):
+        from git_object import GitObject
+        from commit_graph import CommitGraphFile
+
+        self.GitObject = GitObject
+        self.repo_root = repo_root
+        self.spec = spec
+        self.random = random.Random(spec.seed)
+        self.graph = CommitGraphFile.load(os.path.join(repo_root, ".mygit", "commit-graph"))
+        self.tree_cache = {}
+        self.timestamp = EPOCH
+        self.commit_count = 0
+        self.directories = self._make_directories()
+
+    def _make_directories(self):
+        directories = [""]
+        level = [""]
+        for _ in range(self.spec.depth):
+            next_level = []
+            for parent in level:
+                for number in range(self.spec.fanout):
+                    next_level.append(f"{parent}d{number}/")
+            directories.extend(next_level)
+            level = next_level
+        return directories
+
+    def _file_size(self):
+        mean = self.spec.mean_file_size
+        distribution = self.spec.size_distribution
+        if distribution == "fixed":
+            return mean
+        if distribution == "uniform":
+            return self.random.randint(0, 2 * mean)
+        # Log-normal with the requested mean: most files small, a few large
+        sigma = 1.0
+        mu = max(0.0, math.log(max(mean, 1)) - sigma * sigma / 2)
+        return int(self.random.lognormvariate(mu, sigma))
+
+    def file_content(self, path, version):
+        """Generate the content of one version of a file."""
+        size = self._file_size()
+        if self.random.random() < self.spec.binary_ratio:
+            return self.random.randbytes(size)
+        # Words average about 5 bytes plus a separator
+        words = self.random.choices(WORDS, k=size // 6 + 8)
+        lines = [f"# {path} version {version}"]
+        lines.extend(" ".join(words[i:i + 8]) for i in range(0, len(words), 8))
+        return ("\n".join(lines) + "\n").encode("utf-8")[:max(size, 1)]
+
+    def write_blob(self, content):
+        return self.GitObject.write_object("blob", content)
+
+    def write_tree(self, snapshot):
+        """Write the tree objects of a path -> blob hash snapshot and return the root hash."""
+        directories = {}
+        for path, blob_hash in snapshot.items():
+            directory, _, name = path.rpartition("/")
+            directories.setdefault(directory, {})[name] = (b"100644", blob_hash)
+            # Register the ancestor directories, stopping at one already known
+            while directory:
+                parent, _, child = directory.rpartition("/")
+                siblings = directories.setdefault(parent, {})
+                if child in siblings:
+                    break
+                siblings[child] = (b"40000", None)
+                directory = parent
+
+        def build(directory):
+            entries = directories.get(directory, {})
+            tree_entries = []
+            for name in sorted(entries):
+                mode, object_hash = entries[name]
+                if mode == b"40000":
+                    object_hash = build(f"{directory}/{name}" if directory else name)
+                tree_entries.append((name, mode, object_hash))
+            key = tuple(tree_entries)
+            cached = self.tree_cache.get(key)
+            if cached is not None:
+                return cached
+            data = b"".join(
+                mode + b" " + name.encode("utf-8") + b"\x00" + bytes.fromhex(object_hash)
+                for name, mode, object_hash in tree_entries
+            )
+            tree_hash = self.GitObject.write_object("tree", data)
+            self.tree_cache[key] = tree_hash
+            return tree_hash
+
+        return build("")
+
+    def write_commit(self, tree_hash, parents, message):
+        self.commit_count += 1
+        self.timestamp += COMMIT_INTERVAL
+        # Fixed timezone so the objects don't depend on the local one
+        author = f"Bench <bench@example.com> {self.timestamp} +0000"
+        lines = [f"tree {tree_hash}"]
+        lines.extend(f"parent {parent}" for parent in parents)
+        lines.extend([f"author {author}", f"committer {author}", "", message, ""])
+        commit_hash = self.GitObject.write_object("commit", "\n".join(lines).encode("utf-8"))
+        self.graph.add_commit(commit_hash, tree_hash, parents, self.timestamp)
+        return commit_hash
+
+    def modify(self, snapshot, count, label):
+        """Return a copy of a snapshot with count files rewritten."""
+        snapshot = dict(snapshot)
+        paths = sorted(snapshot)
+        for path in self.random.sample(paths, min(count, len(paths))):
+            snapshot[path] = self.write_blob(self.file_content(path, label))
+        return snapshot
+
+
+def generate_repository(repo_root, spec):
+    """
+    Generate a repository according to a spec.
+
+    main gets spec.commits commits. Every spec.branch_interval commits a
+    branch feature-N is forked with spec.branch_length commits and, if
+    spec.merge_branches is set, merged back into main. A final branch
+    'topic' is forked from the middle of main and left unmerged, so merge
+    and rebase have real work to do. The worktree and HEAD are left on main.
+
+    Args:
+        repo_root: Directory to create the repository in (must not contain .mygit)
+        spec: RepositorySpec describing the repository
+
+    Returns:
+        Dictionary with the number of commits, files and branches created
+    """
+    from git_object import GitObject
+    from repository import Repository, set_repository
+
+    repo_root = os.path.abspath(repo_root)
+    os.makedirs(os.path.join(repo_root, ".mygit", "objects"))
+    os.makedirs(os.path.join(repo_root, ".mygit", "refs", "heads"))
+
+    # Objects go to the new repository, whatever the current directory is
+    previous_repo = set_repository(Repository(repo_root))
+    try:
+        # One write batch: a single sync instead of one per object
+        with GitObject.batch():
+            builder = _Builder(repo_root, spec)
+            branches = {}
+
+            snapshot = {}
+            for number in range(spec.files):
+                path = f"{builder.random.choice(builder.directories)}f{number}.txt"
+                snapshot[path] = builder.write_blob(builder.file_content(path, 0))
+
+            head = builder.write_commit(builder.write_tree(snapshot), [], "initial commit")
+            history = [(head, snapshot)]
+
+            for number in range(1, spec.commits):
+                snapshot = builder.modify(snapshot, spec.changes_per_commit, f"main-{number}")
+                head = builder.write_commit(builder.write_tree(snapshot), [head], f"main commit {number}")
+                history.append((head, snapshot))
+
+                if spec.branch_interval and number % spec.branch_interval == 0:
+                    branch_name = f"feature-{len(branches)}"
+                    branch_head, branch_snapshot = head, snapshot
+                    for step in range(spec.branch_length):
+                        branch_snapshot = builder.modify(branch_snapshot, spec.changes_per_commit, f"{branch_name}-{step}")
+                        branch_head = builder.write_commit(
+                            builder.write_tree(branch_snapshot), [branch_head], f"{branch_name} commit {step}"
+                        )
+                    branches[branch_name] = branch_head
+
+                    if spec.merge_branches:
+                        # Merge result: main's files with the branch's changes on top
+                        snapshot = dict(snapshot)
+                        snapshot.update({
+                            path: blob_hash for path, blob_hash in branch_snapshot.items()
+                            if history[-1][1].get(path) != blob_hash
+                        })
+                        head = builder.write_commit(
+                            builder.write_tree(snapshot), [head, branch_head], f"merge {branch_name}"
+                        )
+                        history.append((head, snapshot))
+
+            topic_head, topic_snapshot = history[len(history) // 2]
+            for step in range(max(spec.branch_length, 1)):
+                topic_snapshot = builder.modify(topic_snapshot, spec.changes_per_commit, f"topic-{step}")
+                topic_head = builder.write_commit(builder.write_tree(topic_snapshot), [topic_head], f"topic commit {step}")
+            branches["topic"] = topic_head
+            branches["main"] = head
+
+            builder.graph.save()
+    finally:
+        set_repository(previous_repo)
+
+    for branch_name, commit_hash in branches.items():
+        with open(os.path.join(repo_root, ".mygit", "refs", "heads", branch_name), "w") as f:
+            f.write(commit_hash)
+    with open(os.path.join(repo_root, ".mygit", "HEAD"), "w") as f:
+        f.write("ref: refs/heads/main\n")
+    with open(os.path.join(repo_root, "ignore.txt"), "w") as f:
+        f.write(".mygit\nignore.txt\n")
+
+    _write_worktree(repo_root, snapshot)
+
+    return {
+        "commits": builder.commit_count,
+        "files": len(snapshot),
+        "branches": len(branches),
+    }
+
+
+def _write_worktree(repo_root, snapshot):
+    """Write the files of a snapshot into the working directory."""
+    from git_object import GitObject
+    from repository import Repository, set_repository
+
+    previous_repo = set_repository(Repository(repo_root))
+    try:
+        for path, blob_hash in snapshot.items():
+            file_path = os.path.join(repo_root, path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as f:
+                f.write(GitObject.read_object(blob_hash))
+    finally:
+        set_repository(previous_repo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic MyGit repository")
+    parser.add_argument("directory", help="Directory to create the repository in")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small", help="Base spec to start from")
+    for field in RepositorySpec.FIELDS:
+        default = getattr(PRESETS["small"], field)
+        option = "--" + field.replace("_", "-")
+        if isinstance(default, bool):
+            parser.add_argument(option, type=lambda value: value.lower() in ("1", "true", "yes"), default=None)
+        else:
+            parser.add_argument(option, type=type(default), default=None)
+    args = parser.parse_args(argv)
+
+    overrides = {
+        field: getattr(args, field) for field in RepositorySpec.FIELDS
+        if getattr(args, field) is not None
+    }
+    spec = PRESETS[args.preset].copy(**overrides)
+    summary = generate_repository(args.directory, spec)
+    print(f"Generated {summary['commits']} commits, {summary['files']} files, "
+          f"{summary['branches']} branches in {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
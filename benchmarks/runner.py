@@ -0,0 +1,324 @@
+"""
+Benchmark runner for the core MyGit commands.
+
+Each command runs in a fresh copy of a generated repository (see
+generator.py) in its own process. For every run the runner records wall
+time, peak RSS (from os.wait4) and the number of objects read from and
+written to the object store. Results are written as JSON and can be
+compared against a stored baseline.
+
+Usage:
+    python3 -m benchmarks.runner run [--sizes small,medium] [--runs 3] [-o results.json] [--baseline base.json]
+    python3 -m benchmarks.runner compare BASELINE CURRENT [--threshold 0.1]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+from benchmarks.generator import PRESETS, generate_repository
+
+
+CHILD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "child.py")
+RESULTS_VERSION = 1
+
+
+def _run_untimed(repo_root, argv):
+    """Run a command as part of a benchmark's setup."""
+    subprocess.run(
+        [sys.executable, CHILD_PATH, os.devnull] + argv,
+        cwd=repo_root,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def _warm_index(repo_root):
+    _run_untimed(repo_root, ["write-tree"])
+
+
+def _touch_files(repo_root, fraction=0.01):
+    """Warm the index, then rewrite a deterministic subset of worktree files."""
+    _warm_index(repo_root)
+    paths = []
+    for directory, directories, files in os.walk(repo_root):
+        directories[:] = sorted(d for d in directories if d != ".mygit")
+        paths.extend(os.path.join(directory, name) for name in sorted(files) if name != "ignore.txt")
+    for path in paths[::max(1, int(1 / fraction))]:
+        with open(path, "ab") as f:
+            f.write(b"benchmark change\n")
+
+
+def _switch_to_topic(repo_root):
+    with open(os.path.join(repo_root, ".mygit", "HEAD"), "w") as f:
+        f.write("ref: refs/heads/topic\n")
+
+
+# name -> (command line, setup run on the fresh copy before timing)
+BENCHMARKS = {
+    "write-tree-cold": (["write-tree"], None),
+    "write-tree-warm": (["write-tree"], _warm_index),
+    "commit": (["commit", "-m", "benchmark"], _touch_files),
+    "log": (["log"], None),
+    "checkout": (["checkout", "topic"], _warm_index),
+    "merge-base": (["merge-base", "main", "topic"], None),
+    "merge": (["merge", "topic"], None),
+    "rebase": (["rebase", "main"], _switch_to_topic),
+    "graph-layout": (["@layout"], None),
+}
+
+
+def _loose_objects(repo_root):
+    """Return the set of loose object hashes of a repository."""
+    objects = set()
+    objects_dir = os.path.join(repo_root, ".mygit", "objects")
+    for prefix in os.listdir(objects_dir):
+        if len(prefix) == 2:
+            objects.update(prefix + rest for rest in os.listdir(os.path.join(objects_dir, prefix)))
+    return objects
+
+
+def run_once(repo_root, argv):
+    """
+    Run one command in a child process and measure it.
+
+    Args:
+        repo_root: Repository to run the command in
+        argv: Command line (without the program name)
+
+    Returns:
+        Dictionary with wall_ms, peak_rss_kb, objects_read, objects_written
+        and exit_status
+    """
+    before = _loose_objects(repo_root)
+    counters_path = os.path.join(os.path.dirname(repo_root), "counters.json")
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, CHILD_PATH, counters_path] + argv,
+        cwd=repo_root,
+        stdout=subprocess.DEVNULL,
+    )
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_ms = (time.perf_counter() - start) * 1000
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    counters = {"objects_read": None}
+    if os.path.exists(counters_path):
+        with open(counters_path) as f:
+            counters = json.load(f)
+        os.remove(counters_path)
+
+    peak_rss_kb = rusage.ru_maxrss
+    if sys.platform == "darwin":
+        # macOS reports bytes, Linux kilobytes
+        peak_rss_kb //= 1024
+
+    return {
+        "wall_ms": wall_ms,
+        "peak_rss_kb": peak_rss_kb,
+        "objects_read": counters["objects_read"],
+        "objects_written": len(_loose_objects(repo_root) - before),
+        "exit_status": process.returncode,
+    }
+
+
+def _spec_key(spec):
+    return hashlib.sha1(json.dumps(spec.to_dict(), sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def prepare_template(spec, work_dir, cache_dir=None):
+    """
+    Generate the repository for a spec, reusing a cached copy if available.
+
+    Returns:
+        Path to the template repository (never modified by benchmarks)
+    """
+    if cache_dir:
+        template = os.path.join(cache_dir, f"repo-{_spec_key(spec)}")
+        if not os.path.isdir(os.path.join(template, ".mygit")):
+            shutil.rmtree(template, ignore_errors=True)
+            generate_repository(template, spec)
+        return template
+
+    template = os.path.join(work_dir, "template")
+    generate_repository(template, spec)
+    return template
+
+
+def run_benchmarks(sizes, names, runs=3, cache_dir=None, log=None):
+    """
+    Run benchmarks against generated repositories.
+
+    Args:
+        sizes: Preset names from generator.PRESETS
+        names: Benchmark names from BENCHMARKS
+        runs: Runs per benchmark; the median wall time is reported
+        cache_dir: Directory keeping generated repositories between invocations
+        log: Optional function receiving progress lines
+
+    Returns:
+        Results dictionary: {"version", "python", "platform", "sizes": {size:
+        {"spec": {...}, "benchmarks": {name: {"wall_ms", "wall_ms_runs",
+        "peak_rss_kb", "objects_read", "objects_written", "exit_status"}}}}}
+    """
+    results = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": {},
+    }
+
+    for size in sizes:
+        spec = PRESETS[size]
+        with tempfile.TemporaryDirectory(prefix="mygit-bench-") as work_dir:
+            template = prepare_template(spec, work_dir, cache_dir)
+            size_results = {"spec": spec.to_dict(), "benchmarks": {}}
+            results["sizes"][size] = size_results
+
+            for name in names:
+                argv, setup = BENCHMARKS[name]
+                samples = []
+                for _ in range(runs):
+                    repo_root = os.path.join(work_dir, "run", "repo")
+                    shutil.rmtree(os.path.dirname(repo_root), ignore_errors=True)
+                    shutil.copytree(template, repo_root, symlinks=True)
+                    if setup is not None:
+                        setup(repo_root)
+                    samples.append(run_once(repo_root, argv))
+
+                result = {
+                    "wall_ms": round(statistics.median(s["wall_ms"] for s in samples), 3),
+                    "wall_ms_runs": [round(s["wall_ms"], 3) for s in samples],
+                    "peak_rss_kb": max(s["peak_rss_kb"] for s in samples),
+                    "objects_read": samples[-1]["objects_read"],
+                    "objects_written": samples[-1]["objects_written"],
+                    "exit_status": samples[-1]["exit_status"],
+                }
+                size_results["benchmarks"][name] = result
+                if log:
+                    log(f"{size:8} {name:16} {result['wall_ms']:10.1f} ms "
+                        f"{result['peak_rss_kb']:8} KiB  read {result['objects_read']}  "
+                        f"written {result['objects_written']}")
+
+    return results
+
+
+def compare_results(baseline, current, threshold=0.10, min_delta_ms=5.0):
+    """
+    Compare two result sets.
+
+    A benchmark regresses if its median wall time grew by more than
+    threshold (and by at least min_delta_ms, to ignore noise on fast
+    commands), if it reads or writes more objects (these counts are
+    deterministic), or if it started failing.
+
+    Args:
+        baseline: Results dictionary from run_benchmarks
+        current: Results dictionary from run_benchmarks
+        threshold: Allowed relative wall-time increase
+        min_delta_ms: Smallest wall-time increase that counts
+
+    Returns:
+        Tuple of (lines, regressions): a report line per benchmark present
+        in both and a list of regression messages
+    """
+    lines = []
+    regressions = []
+
+    for size, size_results in current["sizes"].items():
+        baseline_size = baseline["sizes"].get(size)
+        if baseline_size is None:
+            continue
+        if baseline_size["spec"] != size_results["spec"]:
+            regressions.append(f"{size}: repository spec differs from the baseline")
+            continue
+
+        for name, result in size_results["benchmarks"].items():
+            old = baseline_size["benchmarks"].get(name)
+            if old is None:
+                continue
+            ratio = result["wall_ms"] / old["wall_ms"] if old["wall_ms"] else 1.0
+            lines.append(f"{size:8} {name:16} {old['wall_ms']:10.1f} -> {result['wall_ms']:10.1f} ms  x{ratio:.2f}")
+
+            label = f"{size}/{name}"
+            if result["wall_ms"] - old["wall_ms"] > max(old["wall_ms"] * threshold, min_delta_ms):
+                regressions.append(f"{label}: wall time {old['wall_ms']:.1f} -> {result['wall_ms']:.1f} ms")
+            for counter in ("objects_read", "objects_written"):
+                if old[counter] is not None and result[counter] is not None and result[counter] > old[counter]:
+                    regressions.append(f"{label}: {counter} {old[counter]} -> {result[counter]}")
+            if result["exit_status"] != 0 and old["exit_status"] == 0:
+                regressions.append(f"{label}: exited with status {result['exit_status']}")
+
+    return lines, regressions
+
+
+def _report_comparison(baseline, current, args):
+    lines, regressions = compare_results(baseline, current, args.threshold, args.min_delta_ms)
+    for line in lines:
+        print(line)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark MyGit commands on generated repositories")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    sp_run = subparsers.add_parser("run", help="Run benchmarks and write JSON results")
+    sp_run.add_argument("--sizes", default="small", help=f"Comma-separated presets ({', '.join(PRESETS)})")
+    sp_run.add_argument("--benchmarks", default=",".join(BENCHMARKS), help="Comma-separated benchmark names")
+    sp_run.add_argument("--runs", type=int, default=3, help="Runs per benchmark (median is reported)")
+    sp_run.add_argument("--cache-dir", help="Keep generated repositories here between invocations")
+    sp_run.add_argument("-o", "--output", help="Write results to this JSON file")
+    sp_run.add_argument("--baseline", help="Compare against this results file and fail on regressions")
+
+    sp_compare = subparsers.add_parser("compare", help="Compare two result files")
+    sp_compare.add_argument("baseline", help="Baseline results file")
+    sp_compare.add_argument("current", help="Current results file")
+
+    for sp in (sp_run, sp_compare):
+        sp.add_argument("--threshold", type=float, default=0.10, help="Allowed relative wall-time increase")
+        sp.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore wall-time increases below this")
+
+    args = parser.parse_args(argv)
+
+    if args.action == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        return _report_comparison(baseline, current, args)
+
+    sizes = [size for size in args.sizes.split(",") if size]
+    names = [name for name in args.benchmarks.split(",") if name]
+    for name in sizes:
+        if name not in PRESETS:
+            parser.error(f"unknown size '{name}'")
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark '{name}'")
+
+    results = run_benchmarks(sizes, names, args.runs, args.cache_dir, log=print)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return _report_comparison(baseline, results, args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
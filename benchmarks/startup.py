@@ -0,0 +1,152 @@
+"""
+Cold-start benchmark for main.py based on ``python -X importtime``.
+
+Runs a few representative commands in a scratch repository, parses the
+import-time report and fails (exit status 1) if a command imports a module
+it shouldn't need or if total import time exceeds the budget.
+
+Usage:
+    python3 -m benchmarks.startup [--budget-ms 60] [--runs 5] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_PATH = os.path.join(REPO_DIR, "main.py")
+
+# Modules that must stay unloaded for each command
+FORBIDDEN_IMPORTS = {
+    "cat-file": {"tree", "commit", "branch", "merge", "diff", "visualize", "matplotlib", "socket", "json"},
+    "hash-object": {"tree", "commit", "branch", "merge", "diff", "visualize", "matplotlib"},
+    "log": {"tree", "branch", "merge", "diff", "visualize", "matplotlib"},
+    "--help": {"blob", "git_object", "tree", "commit", "help", "branch", "merge", "diff", "visualize", "matplotlib"},
+}
+
+
+def parse_importtime(stderr):
+    """
+    Parse ``-X importtime`` output.
+
+    Returns:
+        Tuple of (modules, total_us): the set of imported module names and
+        the summed cumulative time of top-level imports in microseconds
+    """
+    modules = set()
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        modules.add(name.strip())
+        if not name.startswith("  "):
+            # Top-level entry (indentation marks nested imports)
+            total_us += int(cumulative_us.strip())
+    return modules, total_us
+
+
+def _run(argv, cwd):
+    env = dict(os.environ, MYGIT_NO_DAEMON="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", MAIN_PATH] + argv,
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    return result
+
+
+def _make_repository(directory):
+    """Create a tiny repository and return the hash of one blob in it."""
+    subprocess.run([sys.executable, MAIN_PATH, "init"], cwd=directory, check=True,
+                   capture_output=True, env=dict(os.environ, MYGIT_NO_DAEMON="1"))
+    with open(os.path.join(directory, "ignore.txt"), "w") as f:
+        f.write(".mygit\nignore.txt\n")
+    with open(os.path.join(directory, "file.txt"), "w") as f:
+        f.write("hello\n")
+    result = subprocess.run([sys.executable, MAIN_PATH, "hash-object", "file.txt"], cwd=directory,
+                            check=True, capture_output=True, text=True,
+                            env=dict(os.environ, MYGIT_NO_DAEMON="1"))
+    return result.stdout.strip()
+
+
+def run_benchmark(runs=5, budget_ms=60.0):
+    """
+    Measure import time of representative commands.
+
+    Args:
+        runs: Number of runs per command (the median is reported)
+        budget_ms: Maximum allowed median import time per command
+
+    Returns:
+        Tuple of (results, failures): per-command result dictionaries and
+        a list of failure messages
+    """
+    results = {}
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        blob_hash = _make_repository(directory)
+        commands = {
+            "cat-file": ["cat-file", blob_hash],
+            "hash-object": ["hash-object", "file.txt"],
+            "log": ["log"],
+            "--help": ["--help"],
+        }
+
+        for name, argv in commands.items():
+            timings = []
+            modules = set()
+            for _ in range(runs):
+                result = _run(argv, directory)
+                if result.returncode != 0:
+                    failures.append(f"{name}: exited with status {result.returncode}")
+                    break
+                modules, total_us = parse_importtime(result.stderr)
+                timings.append(total_us / 1000.0)
+            if not timings:
+                continue
+
+            median_ms = statistics.median(timings)
+            unexpected = sorted(FORBIDDEN_IMPORTS.get(name, set()) & modules)
+            results[name] = {
+                "import_ms": round(median_ms, 2),
+                "modules": len(modules),
+                "unexpected_imports": unexpected,
+            }
+            if unexpected:
+                failures.append(f"{name}: imports {', '.join(unexpected)}")
+            if median_ms > budget_ms:
+                failures.append(f"{name}: import time {median_ms:.1f} ms exceeds budget of {budget_ms:.1f} ms")
+
+    return results, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check MyGit cold-start import time")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command (median is used)")
+    parser.add_argument("--budget-ms", type=float, default=60.0, help="Maximum median import time per command")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    results, failures = run_benchmark(args.runs, args.budget_ms)
+
+    if args.json:
+        print(json.dumps({"results": results, "failures": failures}, indent=2))
+    else:
+        for name, result in results.items():
+            print(f"{name:12} {result['import_ms']:8.2f} ms  {result['modules']:4} modules")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
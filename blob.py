@@ -1,11 +1,22 @@
 import os
+import re
+import zlib
 from git_object import GitObject
 
 
+# Full object names accepted by cat-file --batch
+OBJECT_NAME_PATTERN = re.compile(rb"[0-9a-f]{40}")
+
+# Files larger than this are hashed and compressed in chunks
+STREAMING_THRESHOLD = 1024 * 1024
+
+
 def hash_file_to_blob(file_path, write=True):
     """
     Hash a file and optionally store it as a blob object.
     
+    Large files are streamed so memory use stays bounded.
+    
     Args:
         file_path: Path to the file to hash
         write: Whether to write the blob to .mygit/objects (default: True)
@@ -14,6 +25,9 @@ def hash_file_to_blob(file_path, write=True):
         SHA-1 hash of the blob object
     """
     with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > STREAMING_THRESHOLD:
+            return GitObject.write_object_stream("blob", f, size, write)
         file_content = f.read()
     
     return GitObject.write_object("blob", file_content, write)
@@ -36,6 +50,51 @@ def read_git_object(object_hash):
         exit(1)
 
 
+def cat_file_batch(input_stream, output_stream, contents=True, flush=True):
+    """
+    Stream many objects through one process.
+    
+    Reads one object hash per line from input_stream and writes a
+    "<hash> <type> <size>" line for each, followed by the content and a
+    newline when contents is True. Lines that aren't a full 40-character
+    hash, and unknown or corrupt objects, produce "<input> missing".
+    Pack handles and the object cache are shared by every request.
+    
+    Args:
+        input_stream: Binary stream of newline-separated object hashes
+        output_stream: Binary stream to write records to
+        contents: Include object content (--batch) or only the header (--batch-check)
+        flush: Flush after every record so callers can read replies interactively
+    """
+    for line in input_stream:
+        name = line.strip()
+        if not name:
+            continue
+        if not OBJECT_NAME_PATTERN.fullmatch(name):
+            output_stream.write(name + b" missing\n")
+            if flush:
+                output_stream.flush()
+            continue
+        
+        object_hash = name.decode("ascii")
+        try:
+            if contents:
+                object_type, content = GitObject.read_raw_object(object_hash)
+                output_stream.write(f"{object_hash} {object_type} {len(content)}\n".encode("ascii"))
+                output_stream.write(content)
+                output_stream.write(b"\n")
+            else:
+                object_type, size = GitObject.read_object_header(object_hash)
+                output_stream.write(f"{object_hash} {object_type} {size}\n".encode("ascii"))
+        except (FileNotFoundError, ValueError, zlib.error):
+            output_stream.write(name + b" missing\n")
+        
+        if flush:
+            output_stream.flush()
+    
+    output_stream.flush()
+
+
 # Legacy function names for backward compatibility (to be removed after refactoring)
 def write_object(object_type, data, write=True):
     """Legacy function - use GitObject.write_object() instead."""
@@ -4,11 +4,18 @@ from help import (
     get_ignore_patterns,
     get_current_branch,
     get_branch_commit_id,
+    get_head_commit_id,
     update_branch_reference,
     update_head_reference
 )
+from refs import branch_ref
+from ignore import as_ignore_rules
+from repository import get_repository
+from git_object import GitObject
 from blob import read_git_object
-from tree import parse_tree_object
+from tree import parse_tree_object, diff_trees
+from commit_graph import get_commit_graph
+import perf
 
 
 def create_branch(branch_name):
@@ -21,45 +28,33 @@ def create_branch(branch_name):
     Returns:
         Success or error message string
     """
-    repo_root = find_repo_root()
-    branch_path = os.path.join(repo_root, ".mygit", "refs", "heads", branch_name)
-    
-    # Get current commit hash from HEAD
-    head_ref_path = os.path.join(repo_root, ".mygit", "HEAD")
-    with open(head_ref_path, "r") as f:
-        head_ref = f.read()
-    
-    # Extract the actual branch reference path
-    commit_ref_path = os.path.join(repo_root, ".mygit", head_ref.split(" ")[1].split("\n")[0])
-    
-    with open(commit_ref_path, "r") as f:
-        commit_hash = f.read().strip()
+    store = get_repository().refs
     
     # Check if branch already exists
-    if os.path.exists(branch_path):
+    if store.ref_exists(branch_ref(branch_name)):
         return f"fatal: A branch named '{branch_name}' already exists."
     
-    # Create the new branch
-    os.makedirs(os.path.dirname(branch_path), exist_ok=True)
-    with open(branch_path, "w") as f:
-        f.write(commit_hash)
+    # Create the new branch at the current commit
+    store.update_ref(branch_ref(branch_name), get_head_commit_id() or "")
     
     return f"Created branch '{branch_name}'"
 
 
-def delete_working_directory_files(tree_id, current_directory, ignore_patterns):
+def delete_working_directory_files(tree_id, current_directory, ignore_patterns, prefix=""):
     """
     Recursively delete files from working directory based on a tree object.
     
     Args:
         tree_id: SHA-1 hash of the tree object
         current_directory: Current directory path
-        ignore_patterns: List of patterns to ignore
+        ignore_patterns: IgnoreRules (or a list of patterns) for paths to keep
+        prefix: Path of current_directory relative to the repository root (default: "")
     """
+    ignore_patterns = as_ignore_rules(ignore_patterns)
     entries = parse_tree_object(tree_id)
     
     for mode, name, object_hash in entries:
-        if name in ignore_patterns:
+        if ignore_patterns.match(prefix + name, mode == "40000"):
             continue
         
         file_path = os.path.join(current_directory, name)
@@ -71,7 +66,7 @@ def delete_working_directory_files(tree_id, current_directory, ignore_patterns):
         elif mode == "40000":
             # Directory
             if os.path.exists(file_path):
-                delete_working_directory_files(object_hash, file_path, ignore_patterns)
+                delete_working_directory_files(object_hash, file_path, ignore_patterns, prefix + name + "/")
                 try:
                     os.rmdir(file_path)
                 except OSError:
@@ -79,79 +74,153 @@ def delete_working_directory_files(tree_id, current_directory, ignore_patterns):
                     pass
 
 
-def restore_working_directory_files(tree_id, current_directory, ignore_patterns):
+def restore_working_directory_files(tree_id, current_directory, ignore_patterns, index=None, prefix=""):
     """
     Recursively restore files to working directory from a tree object.
     
     Args:
         tree_id: SHA-1 hash of the tree object
         current_directory: Current directory path
-        ignore_patterns: List of patterns to ignore
+        ignore_patterns: IgnoreRules (or a list of patterns) for paths to skip
+        index: Index to record the written files in (default: None)
+        prefix: Path of current_directory relative to the repository root (default: "")
     """
+    ignore_patterns = as_ignore_rules(ignore_patterns)
     entries = parse_tree_object(tree_id)
     
     for mode, name, object_hash in entries:
-        if name in ignore_patterns:
+        if ignore_patterns.match(prefix + name, mode == "40000"):
             continue
         
         file_path = os.path.join(current_directory, name)
         
         if mode == "100644":
             # Regular file - restore content
-            file_content = read_git_object(object_hash)
-            with open(file_path, "wb") as f:
-                f.write(file_content)
+            write_working_file(file_path, object_hash, index, prefix + name)
         elif mode == "40000":
             # Directory - create and recurse
             os.makedirs(file_path, exist_ok=True)
-            restore_working_directory_files(object_hash, file_path, ignore_patterns)
+            restore_working_directory_files(object_hash, file_path, ignore_patterns, index, prefix + name + "/")
+
+
+def write_working_file(file_path, object_hash, index=None, index_path=None):
+    """
+    Write a blob to the working directory.
+    
+    Args:
+        file_path: Destination path
+        object_hash: SHA-1 hash of the blob
+        index: Index to record the file's new stat data in (default: None)
+        index_path: Path of the file relative to the repository root
+    """
+    file_content = read_git_object(object_hash)
+    with open(file_path, "wb") as f:
+        f.write(file_content)
+    
+    if index is not None:
+        # The hash is already known, so the next commit doesn't need to reread the file
+        index.update(index_path, os.stat(file_path), object_hash)
+
+
+def get_commit_tree_id(commit_id):
+    """
+    Get the root tree of a commit.
+    
+    Args:
+        commit_id: SHA-1 hash of the commit
+        
+    Returns:
+        SHA-1 hash of the tree object, or None if it can't be found
+    """
+    tree_id = get_commit_graph().get_tree(commit_id)
+    if tree_id:
+        return tree_id
+    
+    try:
+        commit_content = read_git_object(commit_id).decode("utf-8")
+    except Exception:
+        return None
+    
+    for line in commit_content.split("\n"):
+        if line.startswith("tree "):
+            return line.split(" ")[1]
+    return None
+
+
+def apply_tree_changes(old_tree_id, new_tree_id, repo_root, ignore_patterns, index=None):
+    """
+    Update the working directory from one tree to another.
+    
+    Only paths that differ between the trees are touched; unchanged files
+    keep their content and mtime.
+    
+    Args:
+        old_tree_id: SHA-1 hash of the tree currently checked out (None if none)
+        new_tree_id: SHA-1 hash of the tree to switch to
+        repo_root: Path to the repository root
+        ignore_patterns: IgnoreRules (or a list of patterns) for paths to skip
+        index: Index to keep in step with the working directory (default: None)
+    """
+    ignore_patterns = as_ignore_rules(ignore_patterns)
+    for path, old_mode, old_hash, new_mode, new_hash in diff_trees(old_tree_id, new_tree_id):
+        if ignore_patterns.is_ignored(path, "40000" in (old_mode, new_mode)):
+            continue
+        
+        file_path = os.path.join(repo_root, *path.split("/"))
+        
+        # Remove what the old tree had at this path unless it stays a directory
+        if old_mode == "100644":
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        elif old_mode == "40000" and new_mode != "40000":
+            if os.path.exists(file_path):
+                delete_working_directory_files(old_hash, file_path, ignore_patterns, path + "/")
+                try:
+                    os.rmdir(file_path)
+                except OSError:
+                    # Directory might not be empty due to ignored files
+                    pass
+        if old_mode is not None and index is not None:
+            index.remove(path)
+        
+        if new_mode == "100644":
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            write_working_file(file_path, new_hash, index, path)
+        elif new_mode == "40000":
+            os.makedirs(file_path, exist_ok=True)
+            restore_working_directory_files(new_hash, file_path, ignore_patterns, index, path + "/")
 
 
 def switch_to_commit(commit_id,prev_branch,ignore_patterns=None):
     """
     Switch the working directory to match a specific commit.
     
+    The trees of the previous and the target commit are diffed and only
+    the added, removed and modified paths are written.
+    
     Args:
         commit_id: SHA-1 hash of the commit to switch to
-        ignore_patterns: List of patterns to ignore (default: from ignore.txt)
+        prev_branch: Branch whose commit is currently checked out
+        ignore_patterns: IgnoreRules (or a list of patterns) for paths to
+            skip (default: the repository's rules)
     """
     repo_root = find_repo_root()
     
     if ignore_patterns is None:
         ignore_patterns = get_ignore_patterns()
     
-    # Delete contents of the previous commit tree
-    previous_commit_id = get_branch_commit_id(prev_branch)
-    
-    if previous_commit_id:
-        try:
-            previous_commit_content = read_git_object(previous_commit_id).decode("utf-8")
-            previous_tree_id = None
-            
-            for line in previous_commit_content.split("\n"):
-                if line.startswith("tree "):
-                    previous_tree_id = line.split(" ")[1]
-                    break
-            
-            if previous_tree_id:
-                delete_working_directory_files(previous_tree_id, repo_root, ignore_patterns)
-        except Exception:
-            # Previous commit might not exist or be invalid
-            pass
-    
-    # Extract tree from new commit and restore files
-    commit_content = read_git_object(commit_id).decode("utf-8")
-    tree_id = None
+    # Tree of the previous commit (None if there is nothing checked out yet)
+    previous_commit_id = get_branch_commit_id(prev_branch) if prev_branch else None
+    previous_tree_id = get_commit_tree_id(previous_commit_id) if previous_commit_id else None
     
-    for line in commit_content.split("\n"):
-        if line.startswith("tree "):
-            tree_id = line.split(" ")[1]
-            break
-    
-    if tree_id:
-        restore_working_directory_files(tree_id, repo_root, ignore_patterns)
-    else:
+    tree_id = get_commit_tree_id(commit_id.strip())
+    if not tree_id:
         raise ValueError(f"Could not find tree in commit {commit_id}")
+    
+    index = get_repository().load_index()
+    with perf.phase("apply tree changes"):
+        apply_tree_changes(previous_tree_id, tree_id, repo_root, ignore_patterns, index)
+    index.save()
 
 
 def checkout(target_ref, create_branch_flag=False):
@@ -170,17 +239,17 @@ def checkout(target_ref, create_branch_flag=False):
     # Check if target_ref is a commit hash (40-character hex string)
     is_commit_hash = (
         len(target_ref) == 40 and
-        os.path.exists(os.path.join(repo_root, ".mygit", "objects", target_ref[:2], target_ref[2:]))
+        GitObject.object_exists(target_ref)
     )
     
     if is_commit_hash:
         # Checkout a specific commit (detached HEAD)
-        switch_to_commit(target_ref)
+        switch_to_commit(target_ref, get_current_branch())
         update_branch_reference(target_ref)
     else:
         # Checkout a branch
-        branch_ref_path = os.path.join(repo_root, ".mygit", "refs", "heads", target_ref)
-        branch_exists = os.path.exists(branch_ref_path)
+        store = get_repository().refs
+        branch_exists = store.ref_exists(branch_ref(target_ref))
         
         if create_branch_flag and not branch_exists:
             print(create_branch(target_ref))
@@ -189,8 +258,7 @@ def checkout(target_ref, create_branch_flag=False):
             prev_branch = get_current_branch()
             update_head_reference(f"ref: refs/heads/{target_ref}\n")
             if branch_exists:
-                with open(branch_ref_path,"r") as f:
-                    switch_to_commit(f.read(),prev_branch)
+                switch_to_commit(store.read_ref(branch_ref(target_ref)) or "", prev_branch)
             return f"switched to branch {target_ref}" if create_branch_flag else None
         else:
             return "this branch dont exist"
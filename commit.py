@@ -1,6 +1,8 @@
 import time
 from datetime import datetime
 from git_object import GitObject
+from commit_graph import get_commit_graph
+import perf
 from tree import write_tree_from_directory
 from help import (
     update_branch_reference,
@@ -57,7 +59,8 @@ def create_commit_object(tree_object_id, message, parent_commit_ids=None,
             lines.append(f"parent {parent_commit_id}")
     
     # Add author and committer information
-    author = format_author(author_name, author_email)
+    timestamp = int(time.time())
+    author = format_author(author_name, author_email, timestamp)
     lines.append(f"author {author}")
     lines.append(f"committer {author}")
     
@@ -69,18 +72,27 @@ def create_commit_object(tree_object_id, message, parent_commit_ids=None,
     # Create commit object
     commit_data = "\n".join(lines).encode("utf-8")
     
-    return GitObject.write_object("commit", commit_data)
+    commit_id = GitObject.write_object("commit", commit_data)
+    
+    # Keep the commit-graph in step so ancestry walks don't need to parse objects
+    with perf.phase("commit-graph update"):
+        graph = get_commit_graph()
+        graph.add_commit(commit_id, tree_object_id, parent_commit_ids or [], timestamp)
+        graph.save()
+    
+    return commit_id
 
 
-def commit_changes(message, ignore_patterns, author_name="You", author_email="you@example.com"):
+def commit_changes(message, ignore_patterns, author_name="You", author_email="you@example.com", jobs=1):
     """
     Create a new commit with current changes.
     
     Args:
         message: Commit message
-        ignore_patterns: List of file/directory patterns to ignore
+        ignore_patterns: IgnoreRules (or a list of patterns) for paths to skip
         author_name: Name of the author
         author_email: Email of the author
+        jobs: Number of threads hashing files in parallel (default: 1)
         
     Returns:
         Success or error message string
@@ -99,7 +111,7 @@ def commit_changes(message, ignore_patterns, author_name="You", author_email="yo
         current_tree_id = get_tree_from_commit(current_branch)
     
     # Create tree from current working directory
-    tree_object_id = write_tree_from_directory("", ignore_patterns)
+    tree_object_id = write_tree_from_directory("", ignore_patterns, jobs)
     
     # Check if there are any changes
     if tree_object_id == current_tree_id:
@@ -135,6 +147,10 @@ def get_parent_commit_id(commit_id):
     Returns:
         Parent commit ID as string, or None if no parent (initial commit).
     """
+    parents = get_commit_graph().get_parents(commit_id)
+    if parents is not None:
+        return parents
+    
     try:
         data = GitObject.read_object(commit_id)
         content = data.decode("utf-8")
@@ -0,0 +1,371 @@
+import os
+import struct
+from git_object import GitObject
+from repository import get_repository
+import perf
+
+
+GRAPH_SIGNATURE = b"CGPH"
+GRAPH_VERSION = 1
+GRAPH_HEADER = GRAPH_SIGNATURE + struct.pack(">I", GRAPH_VERSION)
+
+# commit hash, tree hash, commit timestamp, generation, parent count
+RECORD_FORMAT = ">20s20sqIH"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+
+def parse_commit_header(data):
+    """
+    Extract the graph fields from raw commit content.
+
+    Args:
+        data: Commit object content as bytes
+
+    Returns:
+        Tuple of (tree_id, parent_ids, commit_timestamp)
+    """
+    tree_id = None
+    parents = []
+    timestamp = 0
+
+    for line in data.decode("utf-8", errors="replace").split("\n"):
+        if line == "":
+            break
+        if line.startswith("tree "):
+            tree_id = line.split(" ")[1]
+        elif line.startswith("parent "):
+            parents.append(line.split(" ")[1])
+        elif line.startswith("committer "):
+            # Format: Name <email> timestamp timezone
+            parts = line.rsplit(" ", 2)
+            if len(parts) == 3 and parts[1].lstrip("-").isdigit():
+                timestamp = int(parts[1])
+
+    return tree_id, parents, timestamp
+
+
+class CommitGraphFile:
+    """
+    Commit ancestry cache stored in .mygit/commit-graph.
+
+    Each record holds a commit hash, its root tree hash, its commit
+    timestamp, its generation number (1 for root commits, otherwise one
+    more than the largest parent generation) and its parents as integer
+    positions of earlier records. Parents are always recorded before their
+    children, so new commits are simply appended to the file.
+    """
+
+    def __init__(self, graph_path):
+        self.graph_path = graph_path
+        self.commit_ids = []
+        self.positions = {}
+        self.tree_ids = []
+        self.timestamps = []
+        self.generations = []
+        self.parents = []
+        self._saved_count = 0
+        self._saved_length = 0
+        self._stat_key = None
+        self._unreadable = set()
+
+    @classmethod
+    def load(cls, graph_path):
+        """
+        Load a commit-graph file.
+
+        A truncated trailing record (e.g. from an interrupted write) is ignored.
+
+        Args:
+            graph_path: Path to the commit-graph file
+
+        Returns:
+            CommitGraphFile object (empty if the file doesn't exist or is invalid)
+        """
+        graph = cls(graph_path)
+
+        try:
+            with open(graph_path, "rb") as f:
+                data = f.read()
+                graph._stat_key = _stat_key(os.fstat(f.fileno()))
+        except FileNotFoundError:
+            return graph
+
+        if data[:len(GRAPH_HEADER)] != GRAPH_HEADER:
+            return graph
+
+        offset = len(GRAPH_HEADER)
+        while offset + RECORD_SIZE <= len(data):
+            commit_id, tree_id, timestamp, generation, parent_count = struct.unpack_from(
+                RECORD_FORMAT, data, offset
+            )
+            end = offset + RECORD_SIZE + 4 * parent_count
+            if end > len(data):
+                break
+            parent_positions = struct.unpack_from(f">{parent_count}I", data, offset + RECORD_SIZE)
+            graph._append(commit_id.hex(), tree_id.hex(), timestamp, generation, parent_positions)
+            offset = end
+
+        graph._saved_count = len(graph.commit_ids)
+        graph._saved_length = offset
+        return graph
+
+    def _append(self, commit_id, tree_id, timestamp, generation, parent_positions):
+        self.positions[commit_id] = len(self.commit_ids)
+        self.commit_ids.append(commit_id)
+        self.tree_ids.append(tree_id)
+        self.timestamps.append(timestamp)
+        self.generations.append(generation)
+        self.parents.append(tuple(parent_positions))
+
+    def contains(self, commit_id):
+        """Return True if the commit is recorded in the graph."""
+        return commit_id in self.positions
+
+    def add_commit(self, commit_id, tree_id, parent_ids, timestamp):
+        """
+        Record a commit whose data is already known (e.g. just created).
+
+        Parents missing from the graph are loaded from the object store first.
+
+        Args:
+            commit_id: SHA-1 hash of the commit
+            tree_id: SHA-1 hash of the commit's root tree
+            parent_ids: List of parent commit hashes
+            timestamp: Commit timestamp
+
+        Returns:
+            Position of the commit, or None if an ancestor could not be read
+        """
+        if commit_id in self.positions:
+            return self.positions[commit_id]
+
+        for parent_id in parent_ids:
+            if self.ensure_commit(parent_id) is None:
+                return None
+
+        parent_positions = [self.positions[parent_id] for parent_id in parent_ids]
+        generation = 1 + max((self.generations[p] for p in parent_positions), default=0)
+        self._append(commit_id, tree_id, timestamp, generation, parent_positions)
+        return self.positions[commit_id]
+
+    def ensure_commit(self, commit_id):
+        """
+        Make sure a commit and all of its ancestors are recorded.
+
+        Commits missing from the graph are parsed from the object store,
+        parents first, without recursion so long histories are fine.
+
+        Args:
+            commit_id: SHA-1 hash of the commit
+
+        Returns:
+            Position of the commit, or None if it or an ancestor could not be read
+        """
+        if commit_id in self.positions:
+            return self.positions[commit_id]
+        if commit_id in self._unreadable:
+            return None
+
+        parsed = {}
+        stack = [commit_id]
+        while stack:
+            current = stack[-1]
+            if current in self.positions:
+                stack.pop()
+                continue
+
+            if current not in parsed and current not in self._unreadable:
+                if perf.enabled:
+                    perf.count("commits_parsed")
+                try:
+                    parsed[current] = parse_commit_header(GitObject.read_object(current))
+                except Exception:
+                    parsed[current] = (None, [], 0)
+            if current in self._unreadable or parsed[current][0] is None:
+                # Not a readable commit: remember so callers fall back quickly
+                self._unreadable.update(stack)
+                return None
+            tree_id, parent_ids, timestamp = parsed[current]
+
+            missing = [parent_id for parent_id in parent_ids if parent_id not in self.positions]
+            if missing:
+                stack.extend(missing)
+                continue
+
+            self.add_commit(current, tree_id, parent_ids, timestamp)
+            stack.pop()
+
+        return self.positions[commit_id]
+
+    def get_parents(self, commit_id):
+        """
+        Get the parents of a commit, loading it into the graph if needed.
+
+        Args:
+            commit_id: SHA-1 hash of the commit
+
+        Returns:
+            List of parent commit hashes, or None if the commit can't be read
+        """
+        position = self.ensure_commit(commit_id)
+        if position is None:
+            return None
+        return [self.commit_ids[p] for p in self.parents[position]]
+
+    def get_tree(self, commit_id):
+        """Return the root tree hash of a commit, or None if it can't be read."""
+        position = self.ensure_commit(commit_id)
+        return None if position is None else self.tree_ids[position]
+
+    def get_timestamp(self, commit_id):
+        """Return the commit timestamp, or None if the commit can't be read."""
+        position = self.ensure_commit(commit_id)
+        return None if position is None else self.timestamps[position]
+
+    def get_generation(self, commit_id):
+        """Return the generation number, or None if the commit can't be read."""
+        position = self.ensure_commit(commit_id)
+        return None if position is None else self.generations[position]
+
+    def save(self):
+        """
+        Append newly recorded commits to the commit-graph file.
+
+        The graph is only a cache, so if another process changed the file
+        (or holds its lock) since it was loaded, nothing is written and the
+        missing records are simply derived again later.
+        """
+        if self._saved_count == len(self.commit_ids):
+            return
+
+        GitObject.flush_objects()
+        lock_path = self.graph_path + ".lock"
+        try:
+            lock_fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        except FileExistsError:
+            return
+
+        try:
+            if _current_stat_key(self.graph_path) != self._stat_key:
+                return
+
+            data = self._pack_records(self._saved_count)
+
+            if self._saved_length == 0:
+                # New or unreadable file: start over with a fresh header
+                data = GRAPH_HEADER + data
+
+            mode = "r+b" if self._stat_key is not None else "wb"
+            with open(self.graph_path, mode) as f:
+                # Overwrite any truncated record left behind by an interrupted write
+                f.seek(self._saved_length)
+                f.write(data)
+                f.truncate()
+                f.flush()
+                self._stat_key = _stat_key(os.fstat(f.fileno()))
+
+            self._saved_count = len(self.commit_ids)
+            self._saved_length += len(data)
+        finally:
+            os.close(lock_fd)
+            os.remove(lock_path)
+
+
+    def _pack_records(self, start):
+        """Serialize the records from position start onwards."""
+        parts = []
+        for position in range(start, len(self.commit_ids)):
+            parent_positions = self.parents[position]
+            parts.append(struct.pack(
+                RECORD_FORMAT,
+                bytes.fromhex(self.commit_ids[position]),
+                bytes.fromhex(self.tree_ids[position]),
+                self.timestamps[position],
+                self.generations[position],
+                len(parent_positions)
+            ))
+            parts.append(struct.pack(f">{len(parent_positions)}I", *parent_positions))
+        return b"".join(parts)
+
+    def rewrite(self, keep):
+        """
+        Replace the commit-graph file with only the given commits.
+
+        Used after unreachable commits were pruned. Commits are kept in
+        their current order, so parents still come before their children;
+        a commit whose parent is dropped is dropped too.
+
+        Args:
+            keep: Set of commit hashes to keep
+
+        Returns:
+            True if the file was rewritten, False if another process holds its lock
+        """
+        graph = CommitGraphFile(self.graph_path)
+        for position, commit_id in enumerate(self.commit_ids):
+            if commit_id not in keep:
+                continue
+            parent_ids = [self.commit_ids[p] for p in self.parents[position]]
+            if any(parent_id not in graph.positions for parent_id in parent_ids):
+                continue
+            graph._append(
+                commit_id,
+                self.tree_ids[position],
+                self.timestamps[position],
+                self.generations[position],
+                [graph.positions[parent_id] for parent_id in parent_ids]
+            )
+
+        GitObject.flush_objects()
+        lock_path = self.graph_path + ".lock"
+        try:
+            lock_fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        except FileExistsError:
+            return False
+
+        try:
+            # The lock file doubles as the new file and is renamed over the old one
+            with os.fdopen(lock_fd, "wb") as f:
+                f.write(GRAPH_HEADER + graph._pack_records(0))
+        except BaseException:
+            os.remove(lock_path)
+            raise
+        os.replace(lock_path, self.graph_path)
+        return True
+
+
+def _stat_key(stat_result):
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+
+def _current_stat_key(path):
+    try:
+        return _stat_key(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+
+# Graph loaded by this process, reused while the file on disk is unchanged
+_loaded_graph = None
+
+
+def get_commit_graph():
+    """
+    Get the commit graph of the current repository.
+
+    Returns:
+        CommitGraphFile object, loaded once per process and reloaded if
+        another process changed the file
+    """
+    global _loaded_graph
+    graph_path = get_repository().commit_graph_path
+
+    if (
+        _loaded_graph is None or
+        _loaded_graph.graph_path != graph_path or
+        _current_stat_key(graph_path) != _loaded_graph._stat_key
+    ):
+        with perf.phase("commit-graph load"):
+            _loaded_graph = CommitGraphFile.load(graph_path)
+
+    return _loaded_graph
@@ -0,0 +1,112 @@
+import os
+from repository import get_repository
+
+
+# zlib's own default (currently level 6)
+DEFAULT_COMPRESSION = -1
+
+OBJECT_TYPES = ("blob", "tree", "commit")
+
+
+def load_config(config_path):
+    """
+    Parse a config file.
+
+    The file is INI-style, e.g.:
+
+        [core]
+        compression = 6
+
+        [compression]
+        blob = 1
+        adaptive = true
+
+    Args:
+        config_path: Path to the file
+
+    Returns:
+        configparser.ConfigParser (empty if the file doesn't exist or is invalid)
+    """
+    import configparser
+    config = configparser.ConfigParser()
+    try:
+        config.read(config_path)
+    except configparser.Error as e:
+        print(f"warning: ignoring invalid {config_path}: {e}")
+        config = configparser.ConfigParser()
+    return config
+
+
+def _current_repository():
+    try:
+        return get_repository()
+    except FileNotFoundError:
+        return None
+
+
+def get_config():
+    """
+    Get the configuration of the current repository.
+
+    Returns:
+        configparser.ConfigParser, loaded once per repository (empty outside
+        a repository)
+    """
+    repo = _current_repository()
+    if repo is None:
+        return load_config(os.devnull)
+    return repo.config
+
+
+def invalidate_config():
+    """Forget the loaded config so the next access rereads the file."""
+    repo = _current_repository()
+    if repo is not None:
+        repo.invalidate()
+
+
+def get_int(section, option, default):
+    """Read an integer setting, falling back to default if missing or invalid."""
+    try:
+        return get_config().getint(section, option, fallback=default)
+    except ValueError:
+        return default
+
+
+def get_bool(section, option, default):
+    """Read a boolean setting, falling back to default if missing or invalid."""
+    try:
+        return get_config().getboolean(section, option, fallback=default)
+    except ValueError:
+        return default
+
+
+def _valid_level(level, default):
+    return level if -1 <= level <= 9 else default
+
+
+def get_compression_settings():
+    """
+    Get the zlib compression settings.
+
+    core.compression sets the level for every object type; compression.blob,
+    compression.tree and compression.commit override it per type.
+    compression.adaptive (default true) lets incompressible blobs be stored
+    at a lower level.
+
+    Returns:
+        Tuple of ({object_type: level}, adaptive)
+    """
+    repo = _current_repository()
+    if repo is not None and repo.compression_settings is not None:
+        return repo.compression_settings
+
+    default_level = _valid_level(get_int("core", "compression", DEFAULT_COMPRESSION), DEFAULT_COMPRESSION)
+    levels = {
+        object_type: _valid_level(get_int("compression", object_type, default_level), default_level)
+        for object_type in OBJECT_TYPES
+    }
+    settings = levels, get_bool("compression", "adaptive", True)
+    if repo is not None:
+        repo.compression_settings = settings
+    return settings
@@ -0,0 +1,422 @@
+import io
+import os
+import sys
+import struct
+
+# socket, json and traceback are imported where they are used: this module is
+# loaded by every CLI invocation, and most of them never reach a daemon.
+
+
+SOCKET_NAME = "daemon.sock"
+
+# Frame kinds: request, stdout data, stderr data, exit status
+FRAME_REQUEST = b"q"
+FRAME_STDOUT = b"o"
+FRAME_STDERR = b"e"
+FRAME_EXIT = b"x"
+
+# Exit status telling the client to run the command itself
+EXIT_FALLBACK = -1
+
+# Commands that are never forwarded: they create the repository, control the
+# daemon itself, or read stdin, which is not forwarded over the socket
+LOCAL_COMMANDS = {"init", "daemon"}
+STDIN_OPTIONS = {"--batch", "--batch-check"}
+
+# Client environment applied to each forwarded command: time zone for dates
+# in commits and logs, and durability of object writes
+FORWARDED_ENVIRONMENT = ("TZ", "MYGIT_FSYNC")
+
+# Seconds a client has to send its request before the daemon moves on
+REQUEST_TIMEOUT = 5
+
+
+def send_frame(connection, kind, payload=b""):
+    """
+    Send one frame: 1-byte kind, 4-byte big-endian length, payload.
+
+    Args:
+        connection: Connected socket
+        kind: One of the FRAME_* constants
+        payload: Frame payload as bytes
+    """
+    connection.sendall(kind + struct.pack(">I", len(payload)) + payload)
+
+
+def _recv_exactly(connection, size):
+    parts = []
+    while size:
+        chunk = connection.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError("daemon connection closed")
+        parts.append(chunk)
+        size -= len(chunk)
+    return b"".join(parts)
+
+
+def recv_frame(connection):
+    """
+    Receive one frame.
+
+    Args:
+        connection: Connected socket
+
+    Returns:
+        Tuple of (kind, payload)
+    """
+    header = _recv_exactly(connection, 5)
+    kind = header[:1]
+    size = struct.unpack(">I", header[1:])[0]
+    return kind, _recv_exactly(connection, size)
+
+
+def get_socket_path(repo):
+    """Return the path of the daemon socket of a Repository."""
+    return os.path.join(repo.mygit_dir, SOCKET_NAME)
+
+
+def _connect(socket_path):
+    import socket
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        client.close()
+        raise
+    return client
+
+
+def should_forward(argv):
+    """
+    Decide whether a command line may be served by the daemon.
+
+    Args:
+        argv: Command-line arguments without the program name
+
+    Returns:
+        True if the command can be forwarded
+    """
+    if os.environ.get("MYGIT_NO_DAEMON") or os.environ.get("MYGIT_PERF"):
+        # MYGIT_PERF only affects this process, so trace the command here
+        return False
+    commands = [arg for arg in argv if not arg.startswith("-")]
+    if not commands or commands[0] in LOCAL_COMMANDS:
+        return False
+    return not STDIN_OPTIONS.intersection(argv)
+
+
+def forward_command(argv):
+    """
+    Run a command through the repository's daemon if one is running.
+
+    Args:
+        argv: Command-line arguments without the program name
+
+    Returns:
+        Exit status of the command, or None if it has to run in-process
+    """
+    if not should_forward(argv):
+        return None
+
+    from repository import get_repository
+    try:
+        socket_path = get_socket_path(get_repository())
+    except FileNotFoundError:
+        return None
+    if not os.path.exists(socket_path):
+        return None
+
+    import json
+    try:
+        client = _connect(socket_path)
+    except OSError:
+        # Stale socket left by a daemon that is gone
+        return None
+
+    request = json.dumps({
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": {name: os.environ.get(name) for name in FORWARDED_ENVIRONMENT}
+    }).encode("utf-8")
+    try:
+        with client:
+            send_frame(client, FRAME_REQUEST, request)
+            while True:
+                kind, payload = recv_frame(client)
+                if kind == FRAME_STDOUT:
+                    try:
+                        sys.stdout.buffer.write(payload)
+                        sys.stdout.buffer.flush()
+                    except BrokenPipeError:
+                        # Our reader went away (e.g. piped into head): closing
+                        # the connection stops the command, and it must not
+                        # be run again here
+                        devnull = os.open(os.devnull, os.O_WRONLY)
+                        os.dup2(devnull, sys.stdout.fileno())
+                        return 0
+                elif kind == FRAME_STDERR:
+                    sys.stderr.buffer.write(payload)
+                    sys.stderr.buffer.flush()
+                elif kind == FRAME_EXIT:
+                    status = struct.unpack(">i", payload)[0]
+                    return None if status == EXIT_FALLBACK else status
+    except (OSError, ConnectionError):
+        return None
+
+
+class _FrameWriter(io.RawIOBase):
+    """
+    Raw binary stream sending everything written to it as frames of one
+    kind, so a command's output reaches the client while it runs.
+
+    Once the client is gone, the first write raises BrokenPipeError (so a
+    streaming command like log stops walking) and later writes are dropped.
+    before_write, if set, is called before every frame (stderr uses it to
+    flush pending stdout first, keeping the two in order).
+    """
+
+    def __init__(self, connection, kind, before_write=None):
+        super().__init__()
+        self.connection = connection
+        self.kind = kind
+        self.before_write = before_write
+        self.broken = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.broken:
+            return len(data)
+        if self.before_write is not None:
+            self.before_write()
+        try:
+            send_frame(self.connection, self.kind, bytes(data))
+        except OSError:
+            self.broken = True
+            raise BrokenPipeError("daemon client went away")
+        return len(data)
+
+
+def _apply_environment(environment):
+    """
+    Set the client's environment for one command.
+
+    Returns:
+        Previous values, to pass back to this function afterwards
+    """
+    import time
+    from git_object import GitObject, fsync_mode_from_environment
+
+    previous = {}
+    previous_tz = os.environ.get("TZ")
+    for name, value in environment.items():
+        if name not in FORWARDED_ENVIRONMENT:
+            continue
+        previous[name] = os.environ.get(name)
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    if os.environ.get("TZ") != previous_tz:
+        time.tzset()
+    GitObject.writer.fsync_mode = fsync_mode_from_environment()
+    return previous
+
+
+def _run_request(request, repo, run_command, connection):
+    """
+    Run one forwarded command, streaming its stdout/stderr to the client.
+
+    Returns:
+        Exit status of the command
+    """
+    import io
+    import traceback
+    from repository import find_root, set_repository
+
+    cwd = request["cwd"]
+    try:
+        os.chdir(cwd)
+        if find_root(cwd) != repo.root:
+            # Another repository: let the client handle it
+            return EXIT_FALLBACK
+    except (OSError, FileNotFoundError):
+        return EXIT_FALLBACK
+    # Commands run from a subdirectory still share the daemon's warm repository
+    set_repository(repo)
+    previous_environment = _apply_environment(request.get("env", {}))
+
+    # stdout goes out in frames of up to 8 KiB while the command runs;
+    # stderr is sent line by line
+    stdout = io.TextIOWrapper(io.BufferedWriter(_FrameWriter(connection, FRAME_STDOUT)), encoding="utf-8")
+    stderr_writer = _FrameWriter(connection, FRAME_STDERR, before_write=stdout.flush)
+    stderr = io.TextIOWrapper(io.BufferedWriter(stderr_writer), encoding="utf-8", line_buffering=True)
+    saved_streams = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = stdout, stderr
+    status = 0
+    try:
+        run_command(request["argv"])
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            status = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            status = 1
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdout, sys.stderr = saved_streams
+        for stream in (stdout, stderr):
+            try:
+                stream.flush()
+            except BrokenPipeError:
+                pass
+        _apply_environment(previous_environment)
+
+    return status
+
+
+def serve(run_command, repo_root=None, fsmonitor=None):
+    """
+    Serve commands for one repository over a Unix domain socket.
+
+    Requests are handled one at a time in this process, so imported
+    modules, the object cache, open pack files and the commit-graph stay
+    warm between commands. With the filesystem monitor, write-tree and
+    commit only look at the worktree paths changed since the last one.
+
+    Args:
+        run_command: Function running a command line (list of arguments)
+        repo_root: Path to the repository root (default: discovered from cwd)
+        fsmonitor: Watch the worktree (default: None, core.fsmonitor from
+            the config)
+    """
+    import json
+    import socket
+    from git_object import GitObject
+    from repository import Repository, get_repository, set_repository
+
+    repo = Repository(repo_root) if repo_root else get_repository()
+    set_repository(repo)
+    socket_path = get_socket_path(repo)
+
+    if os.path.exists(socket_path):
+        try:
+            _connect(socket_path).close()
+            print("fatal: a daemon is already running for this repository")
+            return
+        except OSError:
+            os.remove(socket_path)
+
+    if fsmonitor is None:
+        from config import get_bool
+        fsmonitor = get_bool("core", "fsmonitor", False)
+    if fsmonitor:
+        from fsmonitor import start_monitor
+        repo.fsmonitor = start_monitor(repo.root)
+        if repo.fsmonitor is None:
+            print("warning: inotify is unavailable; running without a filesystem monitor")
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    print(f"mygit daemon listening on {socket_path}")
+    sys.stdout.flush()
+
+    pack_dir_mtime = None
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                # A client that connects and sends nothing must not hold up
+                # everyone else
+                connection.settimeout(REQUEST_TIMEOUT)
+                try:
+                    kind, payload = recv_frame(connection)
+                except (OSError, ConnectionError):
+                    continue
+                if kind != FRAME_REQUEST:
+                    continue
+                connection.settimeout(None)
+                request = json.loads(payload.decode("utf-8"))
+
+                if request.get("argv") == ["daemon", "--stop"]:
+                    send_frame(connection, FRAME_STDOUT, b"daemon stopped\n")
+                    send_frame(connection, FRAME_EXIT, struct.pack(">i", 0))
+                    break
+
+                # Pick up packs written by other processes since the last request
+                try:
+                    mtime = os.stat(repo.pack_dir).st_mtime_ns
+                except FileNotFoundError:
+                    mtime = None
+                if mtime != pack_dir_mtime:
+                    GitObject.reload_packs()
+                    pack_dir_mtime = mtime
+                # The config and ignore rules are tiny: reread them for every command
+                repo.invalidate()
+
+                status = _run_request(request, repo, run_command, connection)
+                try:
+                    send_frame(connection, FRAME_EXIT, struct.pack(">i", status))
+                except OSError:
+                    pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        if repo.fsmonitor is not None:
+            repo.fsmonitor.stop()
+            repo.fsmonitor = None
+
+
+def stop_daemon():
+    """
+    Ask the running daemon of the current repository to exit.
+
+    Returns:
+        Status message string
+    """
+    from repository import get_repository
+
+    socket_path = get_socket_path(get_repository())
+    try:
+        client = _connect(socket_path)
+    except OSError:
+        return "no daemon running"
+
+    import json
+    with client:
+        request = json.dumps({"argv": ["daemon", "--stop"], "cwd": os.getcwd()}).encode("utf-8")
+        send_frame(client, FRAME_REQUEST, request)
+        try:
+            while recv_frame(client)[0] != FRAME_EXIT:
+                pass
+        except ConnectionError:
+            pass
+    return "daemon stopped"
+
+
+def daemon_status():
+    """
+    Report whether a daemon is serving the current repository.
+
+    Returns:
+        Status message string
+    """
+    from repository import get_repository
+
+    socket_path = get_socket_path(get_repository())
+    try:
+        _connect(socket_path).close()
+    except OSError:
+        return "no daemon running"
+    return f"daemon running on {socket_path}"
@@ -0,0 +1,339 @@
+import os
+import difflib
+from git_object import GitObject
+from blob import hash_file_to_blob
+from tree import parse_tree_object, diff_trees, get_monitored_changes
+from repository import get_repository
+from commit_graph import get_commit_graph
+from ignore import as_ignore_rules
+from help import find_repo_root, get_ignore_patterns, get_head_commit_id, resolve_start_commit
+import perf
+
+
+def _iter_tree_files(tree_id, prefix):
+    """Yield (path, hash) for every file below a tree."""
+    for mode, name, object_hash in parse_tree_object(tree_id):
+        if mode == "40000":
+            yield from _iter_tree_files(object_hash, prefix + name + "/")
+        else:
+            yield prefix + name, object_hash
+
+
+def diff_tree_to_tree(old_tree_id, new_tree_id):
+    """
+    List the files that differ between two trees.
+
+    Subtrees with the same hash on both sides are skipped without being read.
+
+    Args:
+        old_tree_id: SHA-1 hash of the old tree (None for an empty tree)
+        new_tree_id: SHA-1 hash of the new tree (None for an empty tree)
+
+    Returns:
+        List of (status, path, old_hash, new_hash) sorted by path, where
+        status is 'A' (added), 'D' (deleted) or 'M' (modified)
+    """
+    changes = []
+
+    for path, old_mode, old_hash, new_mode, new_hash in diff_trees(old_tree_id, new_tree_id):
+        # A file replaced by a directory (or the reverse) is a delete plus adds
+        if old_mode == "40000":
+            for file_path, file_hash in _iter_tree_files(old_hash, path + "/"):
+                changes.append(("D", file_path, file_hash, None))
+        elif old_mode is not None and new_mode is not None and new_mode != "40000":
+            changes.append(("M", path, old_hash, new_hash))
+            continue
+        elif old_mode is not None:
+            changes.append(("D", path, old_hash, None))
+
+        if new_mode == "40000":
+            for file_path, file_hash in _iter_tree_files(new_hash, path + "/"):
+                changes.append(("A", file_path, None, file_hash))
+        elif new_mode is not None:
+            changes.append(("A", path, None, new_hash))
+
+    changes.sort(key=lambda change: change[1])
+    return changes
+
+
+def diff_tree_to_worktree(tree_id, repo_root=None, ignore_patterns=None):
+    """
+    List the files that differ between a tree and the working directory.
+
+    Nothing is written to the object store: unchanged files are recognised
+    from their cached stat data in the index, and other files are only
+    hashed in memory. When a filesystem monitor vouches that a directory
+    hasn't changed and its cache-tree entry matches the tree, the
+    directory is skipped without being opened.
+
+    Args:
+        tree_id: SHA-1 hash of the tree (None for an empty tree)
+        repo_root: Path to the repository root (default: discovered)
+        ignore_patterns: IgnoreRules (or a list of patterns) for paths to
+            skip (default: the repository's rules)
+
+    Returns:
+        List of (status, path, old_hash, new_hash) sorted by path; new_hash
+        is the worktree blob hash, or None for deleted files
+    """
+    if repo_root is None:
+        repo_root = find_repo_root()
+    if ignore_patterns is None:
+        ignore_patterns = get_ignore_patterns()
+
+    index = get_repository().load_index()
+    monitored = get_monitored_changes(index)
+    changes = []
+    _diff_directory(tree_id, repo_root, "", as_ignore_rules(ignore_patterns), index, changes, monitored)
+    changes.sort(key=lambda change: change[1])
+    return changes
+
+
+def _diff_directory(tree_id, directory_path, prefix, ignore_patterns, index, changes, monitored=None):
+    """
+    Compare one tree level against one worktree directory (None if missing).
+
+    monitored is (changed paths, their parent directories) from a
+    filesystem monitor, or None when every path has to be checked.
+    """
+    if monitored is not None and tree_id and directory_path is not None:
+        changed_paths, changed_parents = monitored
+        directory = prefix.rstrip("/")
+        if (
+            directory not in changed_parents
+            and index.get_unchanged_tree(directory) == tree_id
+        ):
+            # Same tree as the cache-tree and nothing below it changed
+            if perf.enabled:
+                perf.count("cached_trees_skipped")
+            return
+
+    tree_entries = {}
+    if tree_id:
+        for mode, name, object_hash in parse_tree_object(tree_id):
+            tree_entries[name] = (mode, object_hash)
+
+    worktree_entries = {}
+    if directory_path is not None:
+        if perf.enabled:
+            perf.count("directories_scanned")
+        with os.scandir(directory_path) as entries:
+            for child in entries:
+                if ignore_patterns.match(prefix + child.name, child.is_dir()):
+                    continue
+                if child.is_file():
+                    worktree_entries[child.name] = ("100644", child)
+                elif child.is_dir():
+                    worktree_entries[child.name] = ("40000", child)
+
+    for name in sorted(set(tree_entries) | set(worktree_entries)):
+        path = prefix + name
+        old_mode, old_hash = tree_entries.get(name, (None, None))
+        new_mode, child = worktree_entries.get(name, (None, None))
+
+        if old_mode == "40000" or new_mode == "40000":
+            # A file on the other side (if any) is deleted or added separately
+            if old_mode == "100644":
+                changes.append(("D", path, old_hash, None))
+            if new_mode == "100644":
+                changes.append(("A", path, None, _worktree_blob_id(child, path, index)))
+            _diff_directory(
+                old_hash if old_mode == "40000" else None,
+                child.path if new_mode == "40000" else None,
+                path + "/",
+                ignore_patterns,
+                index,
+                changes,
+                _child_monitored(monitored, path, child if new_mode == "40000" else None)
+            )
+        elif new_mode is None:
+            changes.append(("D", path, old_hash, None))
+        else:
+            new_hash = _worktree_blob_id(child, path, index)
+            if old_mode is None:
+                changes.append(("A", path, None, new_hash))
+            elif new_hash != old_hash:
+                changes.append(("M", path, old_hash, new_hash))
+
+
+def _child_monitored(monitored, path, child):
+    """Monitor changes to pass down to a subdirectory (None to check everything)."""
+    if monitored is None or path in monitored[0] or (child is not None and child.is_symlink()):
+        # A changed directory may have been replaced as a whole, and
+        # changes behind a symlink aren't monitored
+        return None
+    return monitored
+
+
+def _worktree_blob_id(child, path, index):
+    """Hash a worktree file without storing it, trusting the index when possible."""
+    object_id = index.get_object_id(path, child.stat())
+    if object_id is None:
+        object_id = hash_file_to_blob(child.path, write=False)
+    return object_id
+
+
+def resolve_tree(revision):
+    """
+    Resolve HEAD, a branch name, a commit hash or a tree hash to a tree hash.
+
+    Args:
+        revision: "HEAD", branch name, commit hash or tree hash
+
+    Returns:
+        SHA-1 hash of the tree
+
+    Raises:
+        ValueError: If the revision can't be resolved
+    """
+    object_hash = resolve_start_commit(revision)
+    if not object_hash:
+        raise ValueError(f"bad revision '{revision}'")
+    try:
+        object_type, _ = GitObject.read_raw_object(object_hash)
+    except (FileNotFoundError, ValueError):
+        raise ValueError(f"bad revision '{revision}'")
+
+    if object_type == "tree":
+        return object_hash
+    if object_type == "commit":
+        return get_commit_graph().get_tree(object_hash)
+    raise ValueError(f"'{revision}' is not a commit or tree")
+
+
+def _read_side(repo_root, path, object_hash, from_worktree=False):
+    """Return the bytes of one side of a change (b'' if it doesn't exist)."""
+    if object_hash is None:
+        return b""
+    if from_worktree:
+        # Worktree blobs are only hashed in memory, so read the file itself
+        with open(os.path.join(repo_root, *path.split("/")), "rb") as f:
+            return f.read()
+    return GitObject.read_object(object_hash)
+
+
+def _is_binary(data):
+    return b"\x00" in data[:8000]
+
+
+def format_name_status(changes):
+    """Format changes as 'status<TAB>path' lines."""
+    return "\n".join(f"{status}\t{path}" for status, path, _, _ in changes)
+
+
+def _count_lines(repo_root, change, worktree):
+    """Return (insertions, deletions, binary) for one change."""
+    _, path, old_hash, new_hash = change
+    old_data = _read_side(repo_root, path, old_hash)
+    new_data = _read_side(repo_root, path, new_hash, worktree)
+    if _is_binary(old_data) or _is_binary(new_data):
+        return 0, 0, True
+
+    insertions = deletions = 0
+    old_lines = old_data.decode("utf-8", errors="replace").splitlines()
+    new_lines = new_data.decode("utf-8", errors="replace").splitlines()
+    for line in difflib.unified_diff(old_lines, new_lines, lineterm="", n=0):
+        if line.startswith("+") and not line.startswith("+++"):
+            insertions += 1
+        elif line.startswith("-") and not line.startswith("---"):
+            deletions += 1
+    return insertions, deletions, False
+
+
+def format_stat(changes, repo_root, worktree=False):
+    """Format changes as a diffstat with a summary line."""
+    if not changes:
+        return ""
+
+    counts = [_count_lines(repo_root, change, worktree) for change in changes]
+    width = max(len(change[1]) for change in changes)
+    lines = []
+    total_insertions = total_deletions = 0
+
+    for change, (insertions, deletions, binary) in zip(changes, counts):
+        path = change[1]
+        if binary:
+            lines.append(f" {path.ljust(width)} | Bin")
+            continue
+        total_insertions += insertions
+        total_deletions += deletions
+        graph = "+" * min(insertions, 40) + "-" * min(deletions, 40)
+        lines.append(f" {path.ljust(width)} | {insertions + deletions:>4} {graph}")
+
+    files = len(changes)
+    lines.append(
+        f" {files} file{'s' if files != 1 else ''} changed, "
+        f"{total_insertions} insertion{'s' if total_insertions != 1 else ''}(+), "
+        f"{total_deletions} deletion{'s' if total_deletions != 1 else ''}(-)"
+    )
+    return "\n".join(lines)
+
+
+def format_unified(changes, repo_root, worktree=False, context=3):
+    """Format changes as unified text diffs (new side read from disk if worktree)."""
+    output = []
+
+    for status, path, old_hash, new_hash in changes:
+        output.append(f"diff --git a/{path} b/{path}")
+        if status == "A":
+            output.append("new file mode 100644")
+        elif status == "D":
+            output.append("deleted file mode 100644")
+
+        old_data = _read_side(repo_root, path, old_hash)
+        new_data = _read_side(repo_root, path, new_hash, worktree)
+        if _is_binary(old_data) or _is_binary(new_data):
+            output.append(f"Binary files a/{path} and b/{path} differ")
+            continue
+
+        old_label = f"a/{path}" if old_hash else "/dev/null"
+        new_label = f"b/{path}" if new_hash else "/dev/null"
+        old_lines = old_data.decode("utf-8", errors="replace").splitlines()
+        new_lines = new_data.decode("utf-8", errors="replace").splitlines()
+        output.extend(difflib.unified_diff(
+            old_lines, new_lines, old_label, new_label, lineterm="", n=context
+        ))
+
+    return "\n".join(output)
+
+
+def my_git_diff(revisions=None, output_format="patch"):
+    """
+    Show changes between commits, or between a commit and the working directory.
+
+    Args:
+        revisions: Up to two branch names / commit hashes. With none, HEAD is
+            compared against the working directory; with one, that revision is
+            compared against the working directory (default: None)
+        output_format: 'patch', 'name-status' or 'stat' (default: 'patch')
+
+    Returns:
+        Formatted diff string, or an error message string
+    """
+    revisions = revisions or []
+    repo_root = find_repo_root()
+
+    if len(revisions) > 2:
+        return "usage: diff [<commit> [<commit>]]"
+    
+    worktree = len(revisions) < 2
+    try:
+        with perf.phase("find changes"):
+            if not worktree:
+                changes = diff_tree_to_tree(resolve_tree(revisions[0]), resolve_tree(revisions[1]))
+            else:
+                if revisions:
+                    tree_id = resolve_tree(revisions[0])
+                else:
+                    head_commit = get_head_commit_id()
+                    tree_id = get_commit_graph().get_tree(head_commit) if head_commit else None
+                changes = diff_tree_to_worktree(tree_id, repo_root)
+    except ValueError as e:
+        return f"fatal: {e}"
+
+    with perf.phase("format"):
+        if output_format == "name-status":
+            return format_name_status(changes)
+        if output_format == "stat":
+            return format_stat(changes, repo_root, worktree)
+        return format_unified(changes, repo_root, worktree)
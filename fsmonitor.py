@@ -0,0 +1,301 @@
+import os
+import struct
+import threading
+
+# ctypes is imported by the inotify backend only: the monitor runs in the
+# daemon, and the CLI just checks whether one is attached to the repository.
+
+
+# Distinct paths the journal holds before it gives up and asks for a full scan
+MAX_JOURNAL_PATHS = 100000
+
+# Names never watched: the object store changes on every command
+UNWATCHED_NAMES = frozenset([".mygit"])
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONTFOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONTFOLLOW
+)
+
+# wd, mask, cookie, name length
+EVENT_FORMAT = "iIII"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+
+
+class FileSystemMonitor:
+    """
+    Journal of the worktree paths changed while the monitor runs.
+
+    Every change is recorded with an increasing sequence number. A token
+    ("<monitor id>:<sequence>") names a point in the journal; changes_since
+    returns the paths changed after it, or None when the journal can't
+    answer (a token from another monitor, or events lost to an overflow),
+    in which case the caller has to scan the whole worktree.
+
+    Paths are '/'-separated and relative to the worktree root. A recorded
+    directory means anything below it may have changed.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._id = os.urandom(8).hex()
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._journal = {}  # path -> sequence of its last change
+        self._lost_sequence = 0  # changes up to here are unknown
+
+    def start(self):
+        """Start watching."""
+
+    def stop(self):
+        """Stop watching and release resources."""
+
+    def sync(self):
+        """Record every change made before this call (with the lock held)."""
+
+    def _record(self, path):
+        self._sequence += 1
+        self._journal[path] = self._sequence
+        if len(self._journal) > MAX_JOURNAL_PATHS:
+            self._record_overflow()
+
+    def _record_overflow(self):
+        """Forget the journal: tokens from before now need a full scan."""
+        self._sequence += 1
+        self._lost_sequence = self._sequence
+        self._journal.clear()
+
+    def token(self):
+        """Return a token for the current point in the journal."""
+        with self._lock:
+            self.sync()
+            return f"{self._id}:{self._sequence}"
+
+    def changes_since(self, token):
+        """
+        Get the paths changed since a token.
+
+        Args:
+            token: Token from token(), or None
+
+        Returns:
+            Set of changed paths, or None if a full scan is needed
+        """
+        if not token:
+            return None
+        monitor_id, _, sequence = token.partition(":")
+        if monitor_id != self._id or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+
+        with self._lock:
+            self.sync()
+            if sequence < self._lost_sequence:
+                return None
+            return {path for path, changed in self._journal.items() if changed > sequence}
+
+
+class InotifyMonitor(FileSystemMonitor):
+    """
+    Monitor using Linux inotify through ctypes.
+
+    Every worktree directory gets a watch; new directories are watched as
+    they appear and recorded as a whole, since files can be created in them
+    before the watch is in place. A background thread drains the event
+    queue so it doesn't overflow between commands, and sync() drains it
+    again before answering, so changes made just before a command are
+    never missed. A directory renamed inside the worktree keeps its
+    watches, which are moved to the new path; one moved out of the
+    worktree loses them. A queue overflow resets the watches and forces a
+    full scan.
+    """
+
+    def __init__(self, root):
+        super().__init__(root)
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._ctypes = ctypes
+        self._inotify_add_watch = libc.inotify_add_watch
+        self._inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._inotify_rm_watch = libc.inotify_rm_watch
+        self._inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._watches = {}  # wd -> directory path ("" for the root)
+        self._stop_read, self._stop_write = os.pipe()
+        self._thread = None
+
+    def _add_watches(self, directory):
+        """Watch a directory and every directory below it."""
+        stack = [directory]
+        while stack:
+            directory = stack.pop()
+            path = os.path.join(self.root, *directory.split("/")) if directory else self.root
+            wd = self._inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                errno = self._ctypes.get_errno()
+                if errno in (2, 20):  # ENOENT, ENOTDIR: gone already
+                    continue
+                raise OSError(errno, os.strerror(errno), path)
+            self._watches[wd] = directory
+            try:
+                with os.scandir(path) as children:
+                    for child in children:
+                        if child.name not in UNWATCHED_NAMES and child.is_dir(follow_symlinks=False):
+                            stack.append(directory + "/" + child.name if directory else child.name)
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+
+    def _remove_watches(self, directory):
+        """Stop watching a directory and every directory below it."""
+        prefix = directory + "/"
+        for wd, path in list(self._watches.items()):
+            if path == directory or path.startswith(prefix):
+                self._inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+
+    def _rename_watches(self, old_directory, new_directory):
+        """Point the watches of a renamed directory tree at its new path."""
+        prefix = old_directory + "/"
+        for wd, path in self._watches.items():
+            if path == old_directory:
+                self._watches[wd] = new_directory
+            elif path.startswith(prefix):
+                self._watches[wd] = new_directory + path[len(old_directory):]
+
+    def _reset(self):
+        """Rewatch the whole worktree after events were lost."""
+        for wd in list(self._watches):
+            self._inotify_rm_watch(self._fd, wd)
+        self._watches.clear()
+        self._record_overflow()
+        self._add_watches("")
+
+    def start(self):
+        with self._lock:
+            self._add_watches("")
+        self._thread = threading.Thread(target=self._run, name="fsmonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            os.write(self._stop_write, b"x")
+            self._thread.join()
+            self._thread = None
+        os.close(self._fd)
+        os.close(self._stop_read)
+        os.close(self._stop_write)
+
+    def _run(self):
+        import select
+        while True:
+            readable, _, _ = select.select([self._fd, self._stop_read], [], [])
+            if self._stop_read in readable:
+                return
+            with self._lock:
+                self.sync()
+
+    def sync(self):
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return
+            self._process(data)
+
+    def _process(self, data):
+        """Record the events in one read from the inotify file descriptor."""
+        offset = 0
+        reset = False
+        moved_from = {}  # cookie -> directory moved away, until its IN_MOVED_TO
+        while offset < len(data):
+            wd, mask, cookie, length = struct.unpack_from(EVENT_FORMAT, data, offset)
+            offset += EVENT_SIZE
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                reset = True
+                continue
+            directory = self._watches.get(wd)
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if directory is None or mask & IN_MOVE_SELF:
+                # A moved directory is handled through its parent's events
+                continue
+
+            if not name:
+                # Event on the watched directory itself
+                if directory:
+                    self._record(directory)
+                continue
+            if name in UNWATCHED_NAMES and not directory:
+                continue
+            path = directory + "/" + name if directory else name
+            self._record(path)
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    moved_from[cookie] = path
+                elif mask & IN_MOVED_TO and cookie in moved_from:
+                    self._rename_watches(moved_from.pop(cookie), path)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_watches(path)
+
+        # The kernel queues both halves of a rename together, so a directory
+        # without its IN_MOVED_TO left the worktree
+        for path in moved_from.values():
+            self._remove_watches(path)
+        if reset:
+            self._reset()
+
+
+def start_monitor(root):
+    """
+    Start watching a worktree with inotify.
+
+    Without inotify there is no monitor: polling the worktree would cost
+    as much as the stat scan it is meant to save.
+
+    Args:
+        root: Path to the worktree root
+
+    Returns:
+        Running FileSystemMonitor, or None if inotify is unavailable
+    """
+    try:
+        monitor = InotifyMonitor(root)
+    except (OSError, AttributeError):
+        # No inotify (not Linux)
+        monitor = None
+    if monitor is not None:
+        try:
+            monitor.start()
+            return monitor
+        except OSError:
+            # Out of watches (fs.inotify.max_user_watches)
+            monitor.stop()
+    return None
@@ -1,6 +1,340 @@
 import os
+import sys
 import zlib
 import hashlib
+import itertools
+from collections import OrderedDict
+import perf
+from config import get_compression_settings, DEFAULT_COMPRESSION
+from pack import PackFile, find_pack_files
+from repository import get_repository
+
+
+# Chunk size used when streaming large objects through sha1 and zlib
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+# Default byte budget of the decompressed object cache
+DEFAULT_CACHE_LIMIT = 64 * 1024 * 1024
+
+# Adaptive compression: blobs at least this large are sampled first, and
+# stored at level 0 / 1 if level-1 zlib barely shrinks the sample
+ADAPTIVE_MIN_SIZE = 4096
+ADAPTIVE_SAMPLE_SIZE = 64 * 1024
+INCOMPRESSIBLE_RATIO = 0.95
+POORLY_COMPRESSIBLE_RATIO = 0.85
+
+# How new loose objects are made durable: 'batch' syncs once per batch
+# before the objects are renamed into place, 'off' never syncs
+FSYNC_MODES = ("batch", "off")
+DEFAULT_FSYNC_MODE = "batch"
+
+
+class ObjectCache:
+    """
+    LRU cache of decompressed objects, bounded by the total size of their content.
+    
+    Objects are immutable (their key is their hash), so entries never need
+    invalidation; the least recently used ones are evicted once the byte
+    budget is exceeded.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, object_hash):
+        """Return the cached (object_type, content), or None on a miss."""
+        entry = self._entries.get(object_hash)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(object_hash)
+        self.hits += 1
+        return entry
+
+    def put(self, object_hash, entry):
+        """Cache an (object_type, content) pair, evicting old entries as needed."""
+        entry_size = len(entry[1])
+        if self.limit <= 0 or entry_size > self.limit or object_hash in self._entries:
+            return
+        self._entries[object_hash] = entry
+        self.size += entry_size
+        while self.size > self.limit:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted[1])
+
+    def set_limit(self, limit):
+        """Change the byte budget, evicting entries if it shrank."""
+        self.limit = limit
+        while self.size > self.limit:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted[1])
+
+    def clear(self):
+        """Drop every cached object."""
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        """Return the cache counters as a dictionary."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "limit": self.limit,
+        }
+
+
+def _cache_limit_from_environment():
+    """Read the cache budget in bytes from MYGIT_OBJECT_CACHE_SIZE, if set."""
+    value = os.environ.get("MYGIT_OBJECT_CACHE_SIZE")
+    if value:
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    return DEFAULT_CACHE_LIMIT
+
+
+def choose_compression_level(object_type, sample):
+    """
+    Pick the zlib level for an object.
+
+    The level comes from the repository config. With adaptive compression,
+    a blob whose leading sample is already compressed data (images,
+    archives, media...) is stored at level 0 or 1 instead of spending CPU
+    for nothing; any level produces a normal zlib stream, so readers don't
+    change.
+
+    Args:
+        object_type: Type of object ('blob', 'tree', or 'commit')
+        sample: Start of the object content (bytes)
+
+    Returns:
+        zlib compression level
+    """
+    levels, adaptive = get_compression_settings()
+    level = levels.get(object_type, DEFAULT_COMPRESSION)
+
+    if not adaptive or object_type != "blob" or len(sample) < ADAPTIVE_MIN_SIZE or level in (0, 1):
+        return level
+
+    sample = sample[:ADAPTIVE_SAMPLE_SIZE]
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+    if ratio >= INCOMPRESSIBLE_RATIO:
+        if perf.enabled:
+            perf.count("blobs_stored_uncompressed")
+        return 0
+    if ratio >= POORLY_COMPRESSIBLE_RATIO:
+        if perf.enabled:
+            perf.count("blobs_compressed_fast")
+        return 1
+    return level
+
+
+def fsync_mode_from_environment():
+    """Read the fsync mode from MYGIT_FSYNC, if set to a known mode."""
+    value = os.environ.get("MYGIT_FSYNC")
+    return value if value in FSYNC_MODES else DEFAULT_FSYNC_MODE
+
+
+def sync_paths(paths):
+    """Flush the given files (or directories) to stable storage, one fsync each."""
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            # Directories can't be opened on some platforms
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            # Some filesystems refuse fsync on directories
+            pass
+        finally:
+            os.close(fd)
+        if perf.enabled:
+            perf.count("fsync_calls")
+
+
+# libc syncfs(2), looked up on first use (False where it doesn't exist)
+_syncfs = None
+
+
+def _sync_filesystem(path):
+    """
+    Flush the filesystem holding a path with one syncfs(2) call.
+
+    Unlike sync(), only that filesystem is flushed, so a batch of objects
+    costs one call instead of one fsync per object.
+
+    Returns:
+        True if the filesystem was synced, False if syncfs is unavailable
+    """
+    global _syncfs
+    if _syncfs is None:
+        _syncfs = False
+        if sys.platform.startswith("linux"):
+            try:
+                import ctypes
+                import ctypes.util
+                libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+                _syncfs = libc.syncfs
+                _syncfs.argtypes = [ctypes.c_int]
+            except (OSError, AttributeError):
+                _syncfs = False
+    if not _syncfs:
+        return False
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        if _syncfs(fd) != 0:
+            return False
+    finally:
+        os.close(fd)
+    if perf.enabled:
+        perf.count("fsync_calls")
+    return True
+
+
+class LooseObjectWriter:
+    """
+    Transactional writer for loose objects.
+
+    Every object is written to a temporary file next to its final path, so
+    a crash never leaves a truncated object under a real object name.
+    Fanout directories already known to exist are not created again.
+
+    Outside a batch each object is synced and renamed into place at once.
+    Inside a batch (see GitObject.batch()) the renames are deferred: the
+    temporary files are synced together and renamed when the batch is
+    flushed, which happens at the end of the batch and before anything
+    that refers to objects (refs, the index, the commit-graph) is written.
+    Objects that are pending in a batch are still found by readers. If
+    the batch fails, its pending objects are discarded.
+    """
+
+    def __init__(self, fsync_mode=DEFAULT_FSYNC_MODE):
+        self.fsync_mode = fsync_mode
+        self.depth = 0
+        self.pending = {}
+        self._directories = set()
+        self._counter = itertools.count()
+
+    def __enter__(self):
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if self.depth == 0:
+            if exc_type is None:
+                self.flush()
+            else:
+                self.discard()
+        return False
+
+    def ensure_directory(self, directory):
+        """Create a fanout directory unless it is already known to exist."""
+        if directory not in self._directories:
+            os.makedirs(directory, exist_ok=True)
+            self._directories.add(directory)
+
+    def reset_directories(self):
+        """Forget which directories exist (e.g. after objects were pruned)."""
+        self._directories.clear()
+
+    def write(self, object_hash, object_path, compressed_data):
+        """
+        Store the compressed bytes of a loose object.
+
+        Args:
+            object_hash: SHA-1 hash of the object
+            object_path: Final path of the loose object
+            compressed_data: zlib-compressed header and content
+        """
+        directory = os.path.dirname(object_path)
+        self.ensure_directory(directory)
+        temp_path = os.path.join(directory, f"tmp_obj_{os.getpid()}_{next(self._counter)}")
+        try:
+            temp_file = open(temp_path, "xb")
+        except FileNotFoundError:
+            # Directory removed since it was cached (or another repository)
+            os.makedirs(directory, exist_ok=True)
+            temp_file = open(temp_path, "xb")
+        with temp_file:
+            temp_file.write(compressed_data)
+        self.add_file(object_hash, object_path, temp_path)
+
+    def add_file(self, object_hash, object_path, temp_path):
+        """
+        Move a finished temporary file into place as a loose object.
+
+        Args:
+            object_hash: SHA-1 hash of the object
+            object_path: Final path of the loose object
+            temp_path: Temporary file holding the compressed object
+        """
+        if self.depth:
+            self.pending[object_hash] = (temp_path, object_path)
+            return
+
+        directory = os.path.dirname(object_path)
+        if self.fsync_mode != "off":
+            sync_paths([temp_path])
+        self.ensure_directory(directory)
+        os.replace(temp_path, object_path)
+        if self.fsync_mode != "off":
+            # Make the rename itself durable
+            sync_paths([directory])
+
+    def pending_path(self, object_hash):
+        """Return the temporary file of an object pending in the batch, or None."""
+        entry = self.pending.get(object_hash)
+        return entry[0] if entry is not None else None
+
+    def flush(self):
+        """Sync the pending objects and rename them into place."""
+        if not self.pending:
+            return
+
+        pending = list(self.pending.values())
+        if self.fsync_mode != "off":
+            # One syncfs for the whole batch; fsync each file where it's missing
+            if not _sync_filesystem(os.path.dirname(pending[0][0])):
+                sync_paths([temp_path for temp_path, _ in pending])
+
+        directories = set()
+        for temp_path, object_path in pending:
+            directory = os.path.dirname(object_path)
+            if directory not in directories:
+                self.ensure_directory(directory)
+                directories.add(directory)
+            os.replace(temp_path, object_path)
+        self.pending.clear()
+        if perf.enabled:
+            perf.count("object_batches_flushed")
+
+        if self.fsync_mode != "off":
+            # Make the renames themselves durable
+            sync_paths(sorted(directories))
+
+    def discard(self):
+        """Drop the pending objects of a failed batch."""
+        for temp_path, _ in self.pending.values():
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+        self.pending.clear()
 
 
 class GitObject:
@@ -9,60 +343,392 @@ class GitObject:
     Provides common functionality for storing, retrieving, and hashing objects.
     """
 
+    # Process-wide cache of decompressed objects shared by every reader
+    cache = ObjectCache(_cache_limit_from_environment())
+
+    # Writer used for every new loose object
+    writer = LooseObjectWriter(fsync_mode_from_environment())
+
+    @staticmethod
+    def objects_directory():
+        """Return the path of the current repository's object store."""
+        return get_repository().objects_dir
+
+    @staticmethod
+    def pack_directory():
+        """Return the path of the directory holding pack files."""
+        return get_repository().pack_dir
+
+    @staticmethod
+    def loose_object_path(object_hash):
+        """Return the path of a loose object: .mygit/objects/[first 2 chars]/[remaining chars]."""
+        return os.path.join(GitObject.objects_directory(), object_hash[:2], object_hash[2:])
+
+    @staticmethod
+    def get_packs():
+        """
+        Get the pack files of the repository, loading their indexes on first use.
+
+        Returns:
+            List of PackFile objects
+        """
+        repo = get_repository()
+        if repo.packs is None:
+            repo.packs = [PackFile(path) for path in find_pack_files(repo.pack_dir)]
+        return repo.packs
+
+    @staticmethod
+    def reload_packs():
+        """Forget the loaded packs so new or removed pack files are picked up."""
+        repo = get_repository()
+        if repo.packs is not None:
+            for pack in repo.packs:
+                pack.close()
+        repo.packs = None
+
+    @staticmethod
+    def iter_loose_objects():
+        """Yield the hash of every loose object in the object store."""
+        objects_dir = GitObject.objects_directory()
+        if not os.path.isdir(objects_dir):
+            return
+        for prefix in sorted(os.listdir(objects_dir)):
+            if len(prefix) != 2:
+                continue
+            for rest in sorted(os.listdir(os.path.join(objects_dir, prefix))):
+                if len(rest) == 38:
+                    yield prefix + rest
+
+    @staticmethod
+    def object_exists(object_hash):
+        """
+        Check whether an object is stored, either packed or loose.
+
+        Args:
+            object_hash: SHA-1 hash of the object
+
+        Returns:
+            True if the object exists
+        """
+        if perf.enabled:
+            perf.count("object_exists_checks")
+        if object_hash in GitObject.writer.pending:
+            return True
+        if os.path.exists(GitObject.loose_object_path(object_hash)):
+            return True
+        return any(pack.contains(object_hash) for pack in GitObject.get_packs())
+
+    @staticmethod
+    def freshen_object(object_hash):
+        """
+        Check whether an object is stored and mark it as recently written.
+
+        gc only prunes unreachable objects older than its grace period, so
+        rewriting an existing object bumps the mtime of its loose file (or
+        pack) to keep it from being pruned before something refers to it.
+
+        Args:
+            object_hash: SHA-1 hash of the object
+
+        Returns:
+            True if the object exists
+        """
+        if perf.enabled:
+            perf.count("object_exists_checks")
+        if object_hash in GitObject.writer.pending:
+            return True
+        try:
+            os.utime(GitObject.loose_object_path(object_hash))
+            return True
+        except FileNotFoundError:
+            pass
+        for pack in GitObject.get_packs():
+            if pack.contains(object_hash):
+                os.utime(pack.pack_path)
+                return True
+        return False
+
     @staticmethod
     def write_object(object_type, data, write=True):
         """
         Write a Git object to the .mygit/objects directory.
-        
+
         Args:
             object_type: Type of object ('blob', 'tree', or 'commit')
             data: Raw object data as bytes
             write: Whether to actually write to disk (default: True)
-            
+
         Returns:
             SHA-1 hash of the object
         """
         # Create header: "type size\0"
         header = f"{object_type} {len(data)}\0".encode("ascii")
         object_data = header + data
-        
+
         # Calculate SHA-1 hash
         object_hash = hashlib.sha1(object_data).hexdigest()
-        
+        if perf.enabled:
+            perf.count("objects_hashed")
+            perf.count("bytes_hashed", len(object_data))
+
         if write:
             # Store in .mygit/objects/[first 2 chars]/[remaining chars]
-            object_path = os.path.join(".mygit", "objects", object_hash[:2], object_hash[2:])
-            
+            object_path = GitObject.loose_object_path(object_hash)
+
             # Only write if object doesn't already exist
-            if not os.path.exists(object_path):
-                os.makedirs(os.path.dirname(object_path), exist_ok=True)
-                with open(object_path, "wb") as f:
-                    f.write(zlib.compress(object_data))
-        
+            if not GitObject.freshen_object(object_hash):
+                with perf.phase("compress"):
+                    level = choose_compression_level(object_type, data)
+                    compressed_data = zlib.compress(object_data, level)
+                GitObject.writer.write(object_hash, object_path, compressed_data)
+                if perf.enabled:
+                    perf.count("objects_written")
+                    perf.count("bytes_compressed", len(object_data))
+                    perf.count("bytes_written", len(compressed_data))
+
         return object_hash
 
     @staticmethod
-    def read_object(object_hash):
+    def write_object_stream(object_type, stream, size, write=True):
         """
-        Read and decompress a Git object from storage.
+        Write a Git object whose content is read from a file-like stream.
+        
+        The content is fed in fixed-size chunks to both SHA-1 and a zlib
+        compressor and written to a temporary file that is renamed into
+        place once the hash is known, so memory use doesn't depend on size.
         
         Args:
-            object_hash: SHA-1 hash of the object
+            object_type: Type of object ('blob', 'tree', or 'commit')
+            stream: Binary file-like object positioned at the start of the content
+            size: Number of bytes of content (used for the header)
+            write: Whether to actually write to disk (default: True)
             
         Returns:
-            Raw object content (without header) as bytes
+            SHA-1 hash of the object
+            
+        Raises:
+            ValueError: If the stream doesn't contain exactly size bytes
         """
-        object_path = os.path.join(".mygit", "objects", object_hash[:2], object_hash[2:])
+        import tempfile
+        
+        header = f"{object_type} {size}\0".encode("ascii")
+        sha = hashlib.sha1(header)
         
+        temp_file = None
+        compressor = None
+        if write:
+            objects_dir = GitObject.objects_directory()
+            GitObject.writer.ensure_directory(objects_dir)
+            temp_fd, temp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=objects_dir)
+            temp_file = os.fdopen(temp_fd, "wb")
+        
+        try:
+            remaining = size
+            while True:
+                chunk = stream.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                sha.update(chunk)
+                if temp_file is not None:
+                    if compressor is None:
+                        # The first chunk doubles as the compression sample
+                        compressor = zlib.compressobj(choose_compression_level(object_type, chunk))
+                        temp_file.write(compressor.compress(header))
+                    temp_file.write(compressor.compress(chunk))
+            
+            if remaining != 0:
+                raise ValueError(f"{object_type} content changed size while being hashed")
+            
+            object_hash = sha.hexdigest()
+            if perf.enabled:
+                perf.count("objects_hashed")
+                perf.count("bytes_hashed", len(header) + size)
+            
+            if temp_file is not None:
+                if compressor is None:
+                    compressor = zlib.compressobj(choose_compression_level(object_type, b""))
+                    temp_file.write(compressor.compress(header))
+                temp_file.write(compressor.flush())
+                temp_file.close()
+                temp_file = None
+                
+                if GitObject.freshen_object(object_hash):
+                    os.remove(temp_path)
+                else:
+                    object_path = GitObject.loose_object_path(object_hash)
+                    GitObject.writer.add_file(object_hash, object_path, temp_path)
+                    if perf.enabled:
+                        perf.count("objects_written")
+                        perf.count("bytes_compressed", len(header) + size)
+        except BaseException:
+            if temp_file is not None:
+                temp_file.close()
+            if write and os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        
+        return object_hash
+
+    @staticmethod
+    def batch():
+        """
+        Group object writes into one transaction.
+
+        Use as a context manager; batches nest. New objects become visible
+        under their real names (after one sync) when the outermost batch
+        ends or GitObject.flush_objects() is called.
+
+        Returns:
+            The LooseObjectWriter, as a context manager
+        """
+        return GitObject.writer
+
+    @staticmethod
+    def flush_objects():
+        """Make every object written so far durable before something refers to it."""
+        GitObject.writer.flush()
+
+    @staticmethod
+    def read_raw_object(object_hash):
+        """
+        Read an object together with its type.
+
+        Packs are searched first, then the loose object store.
+
+        Args:
+            object_hash: SHA-1 hash of the object
+
+        Returns:
+            Tuple of (object_type, content)
+        """
+        cached = GitObject.cache.get(object_hash)
+        if cached is not None:
+            if perf.enabled:
+                perf.count("object_cache_hits")
+            return cached
+        
+        result = GitObject._read_uncached(object_hash)
+        if perf.enabled:
+            perf.count("object_cache_misses")
+            perf.count("objects_read")
+            perf.count("bytes_decompressed", len(result[1]))
+        GitObject.cache.put(object_hash, result)
+        return result
+
+    @staticmethod
+    def _read_uncached(object_hash):
+        """Read an object from the packs or the loose object store."""
+        object_path = GitObject.writer.pending_path(object_hash)
+        if object_path is not None:
+            return GitObject._read_loose(object_path)
+
+        for pack in GitObject.get_packs():
+            result = pack.read(object_hash)
+            if result is not None:
+                if perf.enabled:
+                    perf.count("objects_read_packed")
+                return result
+
+        object_path = GitObject.loose_object_path(object_hash)
+
         if not os.path.exists(object_path):
+            # A concurrent repack may have moved the object into a new pack
+            if get_repository().packs is not None:
+                GitObject.reload_packs()
+                for pack in GitObject.get_packs():
+                    result = pack.read(object_hash)
+                    if result is not None:
+                        return result
             raise FileNotFoundError(f"Object {object_hash} not found")
-        
+
+        return GitObject._read_loose(object_path)
+
+    @staticmethod
+    def _read_loose(object_path):
+        """Read and inflate a loose object file."""
         with open(object_path, "rb") as f:
             compressed_data = f.read()
+        with perf.phase("decompress"):
             decompressed_data = zlib.decompress(compressed_data)
+        if perf.enabled:
+            perf.count("objects_read_loose")
+
+        # Find the null byte separating header from content
+        null_byte_index = decompressed_data.find(b"\x00")
+        object_type = decompressed_data[:null_byte_index].split(b" ")[0].decode("ascii")
+
+        # Return content without header
+        return object_type, decompressed_data[null_byte_index + 1:]
+
+    @staticmethod
+    def read_object_header(object_hash):
+        """
+        Read the type and size of an object without decompressing all of it.
+        
+        Args:
+            object_hash: SHA-1 hash of the object
             
-            # Find the null byte separating header from content
-            null_byte_index = decompressed_data.find(b"\x00")
-            
-            # Return content without header
-            return decompressed_data[null_byte_index + 1:]
+        Returns:
+            Tuple of (object_type, size)
+        """
+        cached = GitObject.cache.get(object_hash)
+        if cached is not None:
+            return cached[0], len(cached[1])
+        
+        for pack in GitObject.get_packs():
+            header = pack.read_header(object_hash)
+            if header is not None:
+                return header
+        
+        object_path = GitObject.loose_object_path(object_hash)
+        if not os.path.exists(object_path):
+            # Fall back to a full read, which also rescans the pack directory
+            object_type, content = GitObject.read_raw_object(object_hash)
+            return object_type, len(content)
+        
+        # The header is at the start of the stream: inflate just enough of it
+        decompressor = zlib.decompressobj()
+        data = b""
+        with open(object_path, "rb") as f:
+            while b"\x00" not in data:
+                chunk = f.read(64)
+                if not chunk:
+                    raise ValueError(f"Corrupt object {object_hash}")
+                data += decompressor.decompress(chunk)
+        
+        object_type, size = data[:data.find(b"\x00")].decode("ascii").split(" ")
+        return object_type, int(size)
+
+    @staticmethod
+    def set_cache_limit(limit):
+        """
+        Set the byte budget of the decompressed object cache.
+        
+        Args:
+            limit: Maximum total size of cached object content in bytes (0 disables caching)
+        """
+        GitObject.cache.set_limit(limit)
+
+    @staticmethod
+    def cache_stats():
+        """
+        Get the object cache counters.
+        
+        Returns:
+            Dictionary with hits, misses, entries, bytes and limit
+        """
+        return GitObject.cache.stats()
+
+    @staticmethod
+    def read_object(object_hash):
+        """
+        Read and decompress a Git object from storage.
+
+        Args:
+            object_hash: SHA-1 hash of the object
+
+        Returns:
+            Raw object content (without header) as bytes
+        """
+        return GitObject.read_raw_object(object_hash)[1]
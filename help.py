@@ -1,12 +1,17 @@
-import os
 from blob import read_git_object
+from commit_graph import get_commit_graph
+from refs import branch_ref, BRANCH_PREFIX
+from repository import get_repository, find_root
+import perf
 
 
 def find_repo_root(path="."):
     """
     Find the root directory of the repository.
     
-    Traverses up from the given path until a .mygit directory is found.
+    The current directory's repository is resolved once per process (see
+    repository.get_repository); other paths are looked up by walking up
+    until a .mygit directory is found.
     
     Args:
         path: Starting path (default: current directory)
@@ -17,35 +22,19 @@ def find_repo_root(path="."):
     Raises:
         FileNotFoundError: If .mygit directory is not found
     """
-    path = os.path.abspath(path)
-    current = path if os.path.isdir(path) else os.path.dirname(path)
-    
-    while True:
-        if os.path.isdir(os.path.join(current, ".mygit")):
-            return current
-        
-        parent = os.path.dirname(current)
-        if parent == current:
-            # Reached filesystem root without finding .mygit
-            raise FileNotFoundError("Could not find .mygit directory")
-        current = parent
+    if path in (".", ""):
+        return get_repository().root
+    return find_root(path)
 
 
 def get_ignore_patterns():
     """
-    Get list of file/directory patterns to ignore from ignore.txt.
+    Get the repository's ignore rules (ignore.txt and .mygitignore files).
     
     Returns:
-        List of pattern strings to ignore
+        IgnoreRules object, compiled once per repository
     """
-    ignore_patterns = []
-    ignore_file_path = os.path.join(find_repo_root(), "ignore.txt")
-    
-    if os.path.exists(ignore_file_path):
-        with open(ignore_file_path, "r") as f:
-            ignore_patterns = f.read().splitlines()
-    
-    return ignore_patterns
+    return get_repository().ignore_rules
 
 
 def update_branch_reference(commit_id, branch_name="main"):
@@ -56,11 +45,7 @@ def update_branch_reference(commit_id, branch_name="main"):
         commit_id: SHA-1 hash of the commit
         branch_name: Name of the branch (default: "main")
     """
-    repo_path = find_repo_root()
-    branch_ref_path = os.path.join(repo_path, ".mygit", "refs", "heads", branch_name)
-    
-    with open(branch_ref_path, "w") as f:
-        f.write(commit_id)
+    get_repository().refs.update_ref(branch_ref(branch_name), commit_id)
 
 
 def get_branch_commit_id(branch_name="main"):
@@ -73,15 +58,7 @@ def get_branch_commit_id(branch_name="main"):
     Returns:
         SHA-1 hash of the commit, or None if branch doesn't exist or is empty
     """
-    repo_path = find_repo_root()
-    branch_ref_path = os.path.join(repo_path, ".mygit", "refs", "heads", branch_name)
-    
-    if not os.path.exists(branch_ref_path):
-        return None
-    
-    with open(branch_ref_path, "r") as f:
-        commit_data = f.read().strip()
-        return commit_data if commit_data else None
+    return get_repository().refs.read_ref(branch_ref(branch_name))
 
 
 def get_tree_from_commit(branch_name="main"):
@@ -104,73 +81,184 @@ def get_tree_from_commit(branch_name="main"):
     return tree_id
 
 
-def get_all_commits(start_node=None):
+def resolve_start_commit(start_node=None):
     """
-    Get all commits reachable from a starting point.
+    Resolve where a history walk starts.
     
     Args:
-        start_node: Branch name or commit hash to start from (default: current HEAD)
+        start_node: Branch name, commit hash or "HEAD" (default: current HEAD)
         
     Returns:
-        List of commit hashes in traversal order
+        Commit hash, or None if there is nothing to walk
     """
-    repo_root = find_repo_root()
+    if start_node is None or start_node == "HEAD":
+        return get_head_commit_id()
     
-    if start_node is None:
-        # Start from current HEAD
-        head_path = os.path.join(repo_root, ".mygit", "HEAD")
-        if not os.path.exists(head_path):
-            return []
-        
-        with open(head_path, "r") as f:
-            head_content = f.read().strip()
+    # Check if start_node is a branch name
+    store = get_repository().refs
+    if store.ref_exists(branch_ref(start_node)):
+        return store.read_ref(branch_ref(start_node))
+    
+    # Assume it's a commit hash
+    return start_node
+
+
+def parse_revision_range(revisions):
+    """
+    Split revision arguments into commits to include and to exclude.
+    
+    "A..B" includes B and excludes A (either side defaults to HEAD), and
+    "^A" excludes A.
+    
+    Args:
+        revisions: List of revision arguments
         
-        if head_content.startswith("ref: "):
-            # HEAD points to a branch
-            ref_path = os.path.join(repo_root, ".mygit", head_content[5:])
-            if not os.path.exists(ref_path):
-                return []
-            with open(ref_path, "r") as f:
-                current_commit_hash = f.read().strip()
-        else:
-            # HEAD points directly to a commit (detached HEAD)
-            current_commit_hash = head_content
-    else:
-        # Check if start_node is a branch name
-        branch_path = os.path.join(repo_root, ".mygit", "refs", "heads", start_node)
-        if os.path.exists(branch_path):
-            with open(branch_path, "r") as f:
-                current_commit_hash = f.read().strip()
+    Returns:
+        Tuple of (include, exclude) lists of branch names or commit hashes;
+        include is None if no positive revision was given (meaning HEAD)
+    """
+    include = []
+    exclude = []
+    for revision in revisions:
+        if ".." in revision:
+            excluded, included = revision.split("..", 1)
+            exclude.append(excluded or "HEAD")
+            include.append(included or "HEAD")
+        elif revision.startswith("^"):
+            exclude.append(revision[1:])
         else:
-            # Assume it's a commit hash
-            current_commit_hash = start_node
-    
-    commits = []
-    queue = [current_commit_hash]
-    visited = set()
-    
-    while queue:
-        commit_hash = queue.pop(0)
-        if not commit_hash or commit_hash in visited or commit_hash == 'None':
-            continue
-        visited.add(commit_hash)
+            include.append(revision)
+    return include or None, exclude
+
+
+def walk_revisions(include, exclude=(), topo_order=False, since=None):
+    """
+    Walk the commits reachable from include but not from exclude.
+    
+    Commits are popped from a priority queue keyed by committer date
+    (newest first), so history is shown in date order across merges and
+    the walk only goes as far as the caller consumes it. With topo_order
+    the queue is keyed by generation number instead, which never shows a
+    parent before all of its children.
+    
+    Excluded commits are walked through the same queue, marking their
+    ancestors uninteresting; the walk ends as soon as only uninteresting
+    commits are left, so "main..feature" stops at the fork point instead
+    of walking all of main.
+    
+    Args:
+        include: Commit hashes to start from
+        exclude: Commit hashes whose ancestors are left out (default: none)
+        topo_order: Order by generation number instead of date (default: False)
+        since: Skip commits older than this Unix timestamp, and don't walk
+            past them (default: None)
         
-        try:
-            raw_content = read_git_object(commit_hash)
-            content = raw_content.decode("utf-8")
-            commits.append(commit_hash)
+    Yields:
+        Commit hashes
+    """
+    import heapq
+    import itertools
+    
+    graph = get_commit_graph()
+    uninteresting = {}  # queued or walked commit -> excluded?
+    walked = set()
+    queue = []
+    counter = itertools.count()
+    interesting = 0  # queued commits that aren't excluded
+    
+    def push(commit_id, excluded):
+        nonlocal interesting
+        timestamp = graph.get_timestamp(commit_id)
+        if timestamp is None:
+            # Missing or not a commit
+            return
+        generation = graph.get_generation(commit_id)
+        key = (-generation, -timestamp) if topo_order else (-timestamp, -generation)
+        heapq.heappush(queue, (key, next(counter), commit_id))
+        uninteresting[commit_id] = excluded
+        if not excluded:
+            interesting += 1
+    
+    def mark_uninteresting(commit_id):
+        nonlocal interesting
+        uninteresting[commit_id] = True
+        if commit_id in walked:
+            # Shown already (only possible with skewed dates); walk it
+            # again so the exclusion still reaches its ancestors
+            walked.discard(commit_id)
+            push(commit_id, True)
+        else:
+            interesting -= 1
+    
+    for commit_id in exclude:
+        if commit_id not in uninteresting:
+            push(commit_id, True)
+    for commit_id in include:
+        if commit_id not in uninteresting:
+            push(commit_id, False)
+    
+    try:
+        while interesting:
+            commit_id = heapq.heappop(queue)[2]
+            if commit_id in walked:
+                continue
+            walked.add(commit_id)
+            excluded = uninteresting[commit_id]
+            if perf.enabled:
+                perf.count("revisions_walked")
             
-            # Find parent commits
-            for line in content.split("\n"):
-                if line.startswith("parent "):
-                    parts = line.split(" ")
-                    if len(parts) > 1:
-                        queue.append(parts[1])
-        except Exception:
-            # Skip if object not found or not a commit
-            continue
+            if not excluded:
+                interesting -= 1
+                if since is not None and graph.get_timestamp(commit_id) < since:
+                    if topo_order:
+                        continue
+                    # Everything still queued is older too
+                    return
+                yield commit_id
+            
+            for parent_id in graph.get_parents(commit_id):
+                state = uninteresting.get(parent_id)
+                if state is None:
+                    push(parent_id, excluded)
+                elif excluded and not state:
+                    mark_uninteresting(parent_id)
+    finally:
+        # Persist any commits that had to be loaded from the object store
+        graph.save()
+
+
+def iter_commits(start_node=None, since=None, exclude=(), topo_order=False):
+    """
+    Walk the commits reachable from a starting point, yielding as it goes.
+    
+    Args:
+        start_node: Branch name or commit hash to start from, or a list of
+            them (default: current HEAD)
+        since: Skip commits older than this Unix timestamp (default: None)
+        exclude: Branch names or commit hashes whose history is left out (default: none)
+        topo_order: Never show a parent before its children (default: False)
+        
+    Yields:
+        Commit hashes, newest first
+    """
+    start_nodes = start_node if isinstance(start_node, list) else [start_node]
+    include = [commit_id for commit_id in map(resolve_start_commit, start_nodes) if commit_id]
+    excluded = [commit_id for commit_id in map(resolve_start_commit, exclude) if commit_id]
+    if include:
+        yield from walk_revisions(include, excluded, topo_order, since)
+
+
+def get_all_commits(start_node=None):
+    """
+    Get all commits reachable from a starting point.
     
-    return commits
+    Args:
+        start_node: Branch name or commit hash to start from (default: current HEAD)
+        
+    Returns:
+        List of commit hashes, newest first
+    """
+    return list(iter_commits(start_node))
 
 
 def get_current_branch():
@@ -180,22 +268,35 @@ def get_current_branch():
     Returns:
         Branch name, or None if in detached HEAD state or no branch exists
     """
-    repo_path = find_repo_root()
-    head_path = os.path.join(repo_path, ".mygit", "HEAD")
-    
-    if not os.path.exists(head_path):
-        return None
+    head_content = get_repository().refs.read_ref("HEAD")
     
-    with open(head_path, "r") as f:
-        head_content = f.read().strip()
-    
-    if head_content.startswith("ref: "):
+    if head_content and head_content.startswith("ref: "):
         # Extract branch name from ref path (e.g., refs/heads/main -> main)
-        return head_content.split("/")[-1]
+        refname = head_content[5:]
+        if refname.startswith(BRANCH_PREFIX):
+            return refname[len(BRANCH_PREFIX):]
+        return refname.split("/")[-1]
     
     return None
 
 
+def get_head_commit_id():
+    """
+    Get the commit HEAD points to, following the current branch.
+    
+    Returns:
+        SHA-1 hash of the commit, or None if there are no commits yet
+    """
+    store = get_repository().refs
+    head_content = store.read_ref("HEAD")
+    
+    if head_content and head_content.startswith("ref: "):
+        return store.read_ref(head_content[5:])
+    
+    # Detached HEAD
+    return head_content
+
+
 def update_head_reference(new_ref):
     """
     Update the HEAD reference.
@@ -203,11 +304,7 @@ def update_head_reference(new_ref):
     Args:
         new_ref: New reference (e.g., "ref: refs/heads/main" or a commit hash)
     """
-    repo_path = find_repo_root()
-    head_path = os.path.join(repo_path, ".mygit", "HEAD")
-    
-    with open(head_path, "w") as f:
-        f.write(new_ref + "\n")
+    get_repository().refs.update_ref("HEAD", new_ref.strip())
 
 
 # Legacy function names for backward compatibility
@@ -241,78 +338,180 @@ def change_head(new_ref):
     return update_head_reference(new_ref)
 
 
-def format_commit_log(start_node=None):
+# Units accepted in relative dates such as "2 weeks ago"
+DATE_UNITS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 60 * 60,
+    "day": 24 * 60 * 60,
+    "week": 7 * 24 * 60 * 60,
+}
+
+
+def parse_date(value):
     """
-    Format commit history as a readable log.
+    Parse a --since/--until date.
+    
+    Accepts a Unix timestamp (optionally prefixed with '@'), an ISO date or
+    date-time ("2024-05-01", "2024-05-01 13:00") in local time, or a
+    relative date such as "3 days ago" or "2.weeks.ago".
     
     Args:
-        start_node: Branch name or commit hash to start from (default: current HEAD)
+        value: Date string
         
     Returns:
-        Formatted string with commit history
+        Unix timestamp
+        
+    Raises:
+        ValueError: If the date can't be parsed
     """
+    import time
     from datetime import datetime
     
-    commits = get_all_commits(start_node)
+    value = value.strip()
+    if value.lstrip("@").isdigit():
+        return int(value.lstrip("@"))
     
-    if not commits:
-        return "No commits found."
+    words = value.replace(".", " ").split()
+    if len(words) == 3 and words[2] == "ago" and words[0].isdigit():
+        unit = words[1].rstrip("s")
+        if unit in DATE_UNITS:
+            return int(time.time()) - int(words[0]) * DATE_UNITS[unit]
     
-    log_lines = []
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise ValueError(f"invalid date '{value}'") from None
+
+
+def format_commit(commit_hash, content):
+    """
+    Format one commit for the log.
     
-    for commit_hash in commits:
-        try:
-            raw_content = read_git_object(commit_hash)
-            content = raw_content.decode("utf-8")
-            
-            # Parse commit data
-            lines = content.split("\n")
-            tree_id = None
-            parent_id = None
-            author_line = None
-            message_lines = []
-            in_message = False
-            
-            for line in lines:
-                if line.startswith("tree "):
-                    tree_id = line.split(" ", 1)[1]
-                elif line.startswith("parent "):
-                    parent_id = line.split(" ", 1)[1]
-                elif line.startswith("author "):
-                    author_line = line[7:]  # Remove "author " prefix
-                elif line == "" and not in_message:
-                    in_message = True
-                elif in_message:
-                    message_lines.append(line)
-            
-            # Format output
-            log_lines.append(f"commit {commit_hash}")
-            
-            if author_line:
-                # Parse author line: "Name <email> timestamp timezone"
-                parts = author_line.rsplit(" ", 2)
-                if len(parts) == 3:
-                    author_info = parts[0]
-                    timestamp = int(parts[1])
-                    timezone = parts[2]
-                    
-                    # Convert timestamp to readable date
-                    dt = datetime.fromtimestamp(timestamp)
-                    date_str = dt.strftime("%a %b %d %H:%M:%S %Y") + f" {timezone}"
-                    
-                    log_lines.append(f"Author: {author_info}")
-                    log_lines.append(f"Date:   {date_str}")
+    Args:
+        commit_hash: SHA-1 hash of the commit
+        content: Commit object content as bytes
+        
+    Returns:
+        Tuple of (formatted text, author line) where the author line is
+        "Name <email> timestamp timezone", or None if the commit has none
+    """
+    from datetime import datetime
+    
+    # Parse commit data
+    lines = content.decode("utf-8").split("\n")
+    author_line = None
+    message_lines = []
+    in_message = False
+    
+    for line in lines:
+        if in_message:
+            message_lines.append(line)
+        elif line.startswith("author "):
+            author_line = line[7:]  # Remove "author " prefix
+        elif line == "":
+            in_message = True
+    
+    # Format output
+    log_lines = [f"commit {commit_hash}"]
+    
+    if author_line:
+        # Parse author line: "Name <email> timestamp timezone"
+        parts = author_line.rsplit(" ", 2)
+        if len(parts) == 3:
+            author_info = parts[0]
+            timestamp = int(parts[1])
+            timezone = parts[2]
             
-            log_lines.append("")
+            # Convert timestamp to readable date
+            dt = datetime.fromtimestamp(timestamp)
+            date_str = dt.strftime("%a %b %d %H:%M:%S %Y") + f" {timezone}"
             
-            # Add commit message (indented)
-            for msg_line in message_lines:
-                if msg_line.strip():  # Skip empty lines at the end
-                    log_lines.append(f"    {msg_line}")
+            log_lines.append(f"Author: {author_info}")
+            log_lines.append(f"Date:   {date_str}")
+    
+    log_lines.append("")
+    
+    # Add commit message (indented)
+    for msg_line in message_lines:
+        if msg_line.strip():  # Skip empty lines at the end
+            log_lines.append(f"    {msg_line}")
+    
+    log_lines.append("")
+    return "\n".join(log_lines), author_line
+
+
+def iter_commit_log(start_node=None, max_count=None, since=None, until=None, author=None,
+                    exclude=(), topo_order=False):
+    """
+    Yield formatted log entries while walking the history.
+    
+    Each stage is lazy: commits are read and formatted only when the next
+    entry is requested, and the walk stops as soon as max_count entries
+    have been produced.
+    
+    Args:
+        start_node: Branch name or commit hash to start from (default: current HEAD)
+        max_count: Stop after this many commits (default: None, no limit)
+        since: Only show commits made at or after this Unix timestamp; older
+            commits end the walk along their line of history (default: None)
+        until: Only show commits made at or before this Unix timestamp (default: None)
+        author: Only show commits whose author name or email contains this
+            text (default: None)
+        exclude: Branch names or commit hashes whose history is left out (default: none)
+        topo_order: Never show a parent before its children (default: False)
+        
+    Yields:
+        Formatted commit entries
+    """
+    if max_count is not None and max_count <= 0:
+        return
+    
+    graph = get_commit_graph()
+    shown = 0
+    
+    commits = iter_commits(start_node, since, exclude, topo_order)
+    try:
+        for commit_hash in commits:
+            # Committer dates come from the commit-graph, without reading the object
+            if until is not None and graph.get_timestamp(commit_hash) > until:
+                continue
             
-            log_lines.append("")
+            try:
+                entry, author_line = format_commit(commit_hash, read_git_object(commit_hash))
+            except Exception:
+                continue
+            if author is not None:
+                # Match "Name <email>" only, not the timestamp and timezone
+                if author_line is None or author not in author_line.rsplit(" ", 2)[0]:
+                    continue
             
-        except Exception:
-            continue
+            yield entry
+            shown += 1
+            if max_count is not None and shown >= max_count:
+                return
+    finally:
+        # Stop the walk now rather than whenever the generator is collected
+        commits.close()
+
+
+def format_commit_log(start_node=None, max_count=None, since=None, until=None, author=None):
+    """
+    Format commit history as a readable log.
     
-    return "\n".join(log_lines)
+    Args:
+        start_node: Branch name or commit hash to start from (default: current HEAD)
+        max_count: Stop after this many commits (default: None, no limit)
+        since: Only show commits made at or after this Unix timestamp (default: None)
+        until: Only show commits made at or before this Unix timestamp (default: None)
+        author: Only show commits whose author name or email contains this
+            text (default: None)
+        
+    Returns:
+        Formatted string with commit history
+    """
+    with perf.phase("walk history"):
+        entries = list(iter_commit_log(start_node, max_count, since, until, author))
+    if not entries:
+        return "No commits found."
+    return "\n".join(entries)
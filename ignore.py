@@ -0,0 +1,303 @@
+import os
+import re
+
+
+# Ignore file read in every directory of the worktree
+IGNORE_FILE_NAME = ".mygitignore"
+
+# Names that are never part of the worktree, whatever the rules say
+ALWAYS_IGNORED = frozenset([".mygit"])
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+
+
+def _translate(pattern):
+    """
+    Translate a gitignore glob into a regular expression (without anchors).
+
+    '*' and '?' don't match '/', '**/' matches any number of leading
+    directories, '/**' everything inside a directory and '/**/' zero or
+    more directories in between.
+    """
+    parts = []
+    i = 0
+    length = len(pattern)
+    while i < length:
+        char = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i) and i + 2 == length and (i == 0 or pattern[i - 1] == "/"):
+            parts.append(".*")
+            i += 2
+        elif char == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif char == "?":
+            parts.append("[^/]")
+            i += 1
+        elif char == "[":
+            start = i + 1
+            negated = pattern[start:start + 1] in ("!", "^")
+            if negated:
+                start += 1
+            # A ']' right after the opening bracket is a literal member
+            end = pattern.find("]", start + 1)
+            if end == -1:
+                parts.append(re.escape(char))
+                i += 1
+                continue
+            members = "".join(c if c == "-" else re.escape(c) for c in pattern[start:end])
+            parts.append("[" + ("^" if negated else "") + members + "]")
+            i = end + 1
+        elif char == "\\" and i + 1 < length:
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(char))
+            i += 1
+    return "".join(parts)
+
+
+def _combine(regexes):
+    """Compile several regexes into one alternation, or None if there are none."""
+    if not regexes:
+        return None
+    return re.compile("(?:" + "|".join(regexes) + r")\Z")
+
+
+class _RuleGroup:
+    """
+    Rules from one ignore file, applying to paths below its directory.
+
+    Without negated rules every rule has the same effect, so the group is
+    compiled into sets of literal names and one combined regex per kind of
+    rule. With negations the last matching rule wins, so rules are kept in
+    order and checked from the end.
+    """
+
+    def __init__(self, lines):
+        rules = []
+        for line in lines:
+            rule = self._parse(line)
+            if rule is not None:
+                rules.append(rule)
+
+        self.ordered = None
+        self.names = set()
+        self.directory_names = set()
+        if any(negated for negated, _, _, _ in rules):
+            self.ordered = [
+                (negated, directory_only, anchored, literal if regex is None else re.compile(regex + r"\Z"))
+                for negated, directory_only, anchored, (literal, regex) in rules
+            ]
+            return
+
+        name_regexes = []
+        directory_name_regexes = []
+        path_regexes = []
+        directory_path_regexes = []
+        for _, directory_only, anchored, (literal, regex) in rules:
+            if literal is not None and not anchored:
+                (self.directory_names if directory_only else self.names).add(literal)
+            elif anchored:
+                (directory_path_regexes if directory_only else path_regexes).append(regex or re.escape(literal))
+            else:
+                (directory_name_regexes if directory_only else name_regexes).append(regex)
+        self.name_regex = _combine(name_regexes)
+        self.directory_name_regex = _combine(directory_name_regexes)
+        self.path_regex = _combine(path_regexes)
+        self.directory_path_regex = _combine(directory_path_regexes)
+
+    @staticmethod
+    def _parse(line):
+        """
+        Parse one line of an ignore file.
+
+        Returns:
+            (negated, directory_only, anchored, (literal, regex)) or None
+            for blank lines and comments; exactly one of literal and regex
+            is set
+        """
+        line = line.rstrip("\r\n")
+        if not line.endswith("\\ "):
+            line = line.rstrip(" ")
+        if not line or line.startswith("#"):
+            return None
+
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        elif line.startswith(("\\!", "\\#")):
+            line = line[1:]
+
+        directory_only = line.endswith("/")
+        line = line.rstrip("/")
+        # A slash anywhere but at the end ties the pattern to this directory
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if not line:
+            return None
+
+        if _GLOB_CHARS.search(line) or "\\" in line:
+            regex = _translate(line)
+            try:
+                re.compile(regex)
+            except re.error:
+                # e.g. a reversed range: match the pattern literally
+                return negated, directory_only, anchored, (line, None)
+            return negated, directory_only, anchored, (None, regex)
+        return negated, directory_only, anchored, (line, None)
+
+    def match(self, relative_path, name, is_directory):
+        """
+        Check a path against the rules.
+
+        Args:
+            relative_path: Path relative to the ignore file's directory
+            name: Last component of the path
+            is_directory: Whether the path is a directory
+
+        Returns:
+            True if ignored, False if re-included by a negated rule, or
+            None if no rule matches
+        """
+        if self.ordered is not None:
+            for negated, directory_only, anchored, matcher in reversed(self.ordered):
+                if directory_only and not is_directory:
+                    continue
+                subject = relative_path if anchored else name
+                if isinstance(matcher, str):
+                    matched = matcher == subject
+                else:
+                    matched = matcher.match(subject) is not None
+                if matched:
+                    return not negated
+            return None
+
+        if name in self.names:
+            return True
+        if self.name_regex is not None and self.name_regex.match(name):
+            return True
+        if self.path_regex is not None and self.path_regex.match(relative_path):
+            return True
+        if is_directory:
+            if name in self.directory_names:
+                return True
+            if self.directory_name_regex is not None and self.directory_name_regex.match(name):
+                return True
+            if self.directory_path_regex is not None and self.directory_path_regex.match(relative_path):
+                return True
+        return None
+
+
+class IgnoreRules:
+    """
+    gitignore-style rules for the worktree.
+
+    Rules come from a list of patterns (e.g. ignore.txt at the repository
+    root) and from a .mygitignore file in any directory, which applies to
+    the paths below that directory and overrides the files above it.
+    Supported syntax: globs ('*', '?', '[...]', '**'), patterns anchored
+    by a '/', directory-only patterns ending in '/', '!' to re-include and
+    '#' comments.
+
+    Per-directory files are read the first time a path in their directory
+    is checked. Walkers check a directory before descending into it and
+    skip it if it is ignored, so nothing inside an ignored directory is
+    ever listed (as in git, files inside it can't be re-included).
+    """
+
+    def __init__(self, patterns=(), root=None):
+        """
+        Args:
+            patterns: Patterns applying to the whole tree
+            root: Worktree root used to find .mygitignore files (default:
+                None, only patterns are used)
+        """
+        self.root = root
+        self._root_group = _RuleGroup(patterns)
+        self._groups = {}  # directory -> tuple of (base prefix, group), deepest first
+        self._ignored_directories = {}
+
+    def _groups_for(self, directory):
+        """Rule groups applying inside a directory ("" for the root), deepest first."""
+        groups = self._groups.get(directory)
+        if groups is not None:
+            return groups
+
+        if directory:
+            parent_groups = self._groups_for(directory.rpartition("/")[0])
+            base = directory + "/"
+        else:
+            parent_groups = (("", self._root_group),)
+            base = ""
+
+        groups = parent_groups
+        if self.root is not None:
+            try:
+                with open(os.path.join(self.root, *directory.split("/"), IGNORE_FILE_NAME), "r") as f:
+                    groups = ((base, _RuleGroup(f.read().splitlines())),) + parent_groups
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+        self._groups[directory] = groups
+        return groups
+
+    def match(self, path, is_directory=False):
+        """
+        Check one path, assuming its parent directories aren't ignored.
+
+        Args:
+            path: '/'-separated path relative to the worktree root
+            is_directory: Whether the path is a directory
+
+        Returns:
+            True if the path is ignored
+        """
+        directory, _, name = path.rpartition("/")
+        if name in ALWAYS_IGNORED:
+            return True
+        for base, group in self._groups_for(directory):
+            result = group.match(path[len(base):], name, is_directory)
+            if result is not None:
+                return result
+        return False
+
+    def is_ignored(self, path, is_directory=False):
+        """
+        Check a path, including whether any of its parent directories is ignored.
+
+        Args:
+            path: '/'-separated path relative to the worktree root
+            is_directory: Whether the path is a directory
+
+        Returns:
+            True if the path is ignored
+        """
+        directory = path.rpartition("/")[0]
+        if directory and self._directory_ignored(directory):
+            return True
+        return self.match(path, is_directory)
+
+    def _directory_ignored(self, directory):
+        ignored = self._ignored_directories.get(directory)
+        if ignored is None:
+            parent = directory.rpartition("/")[0]
+            ignored = (parent != "" and self._directory_ignored(parent)) or self.match(directory, True)
+            self._ignored_directories[directory] = ignored
+        return ignored
+
+
+def as_ignore_rules(ignore_patterns):
+    """
+    Accept either IgnoreRules or a plain list of patterns (older callers).
+
+    Args:
+        ignore_patterns: IgnoreRules, a list of patterns, or None
+
+    Returns:
+        IgnoreRules object
+    """
+    if isinstance(ignore_patterns, IgnoreRules):
+        return ignore_patterns
+    return IgnoreRules(ignore_patterns or ())
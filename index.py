@@ -0,0 +1,359 @@
+import os
+import time
+import struct
+import hashlib
+import perf
+from git_object import GitObject
+
+
+INDEX_SIGNATURE = b"DIRC"
+INDEX_VERSION = 1
+
+# mtime_ns, size, inode, blob hash, path length
+ENTRY_FORMAT = ">qQQ20sH"
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+
+# Cache-tree extension: directory -> tree hash and number of tree entries
+TREE_EXTENSION = b"TREE"
+TREE_FORMAT = ">I20sH"
+TREE_SIZE = struct.calcsize(TREE_FORMAT)
+
+# Filesystem monitor extension: token up to which the entries are known current
+FSMONITOR_EXTENSION = b"FSMN"
+
+
+class IndexEntry:
+    """Cached stat data and blob hash for one file in the working directory."""
+
+    __slots__ = ("path", "mtime_ns", "size", "inode", "object_id")
+
+    def __init__(self, path, mtime_ns, size, inode, object_id):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.inode = inode
+        self.object_id = object_id
+
+    def matches(self, stat_result):
+        """Return True if the file's stat data is unchanged since it was hashed."""
+        return (
+            self.mtime_ns == stat_result.st_mtime_ns and
+            self.size == stat_result.st_size and
+            self.inode == stat_result.st_ino
+        )
+
+
+class Index:
+    """
+    Persistent stat cache stored in .mygit/index.
+
+    Maps each worktree path (relative to the repository root, '/' separated)
+    to the size, mtime and inode it had when it was last hashed, plus the
+    resulting blob hash. Files whose stat data is unchanged reuse the cached
+    hash without being read.
+
+    The cache-tree maps each directory ("" for the root) to the tree hash and
+    entry count it had when last written. Updating or removing a file drops
+    the cached trees of all its parent directories, so only the trees on the
+    path to a change have to be rebuilt.
+
+    The fsmonitor token records the point in a filesystem monitor's journal
+    at which the entries and cache-tree matched the worktree, so the next
+    scan only has to look at the paths changed since.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.entries = {}
+        self.trees = {}
+        self.fsmonitor_token = None
+        self.changed = False
+        self._seen = set()
+        self._seen_directories = set()
+
+    @classmethod
+    def load(cls, index_path):
+        """
+        Load the index of a repository.
+
+        Args:
+            index_path: Path to the index file (Repository.index_path)
+
+        Returns:
+            Index object (empty if no index file exists or it is corrupt)
+        """
+        index = cls(index_path)
+
+        with perf.phase("index load"):
+            try:
+                with open(index.index_path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return index
+            index._parse(data)
+        return index
+
+    def _parse(self, data):
+        """Fill the entries and cache-tree from the bytes of an index file."""
+        if len(data) < 32 or hashlib.sha1(data[:-20]).digest() != data[-20:]:
+            # A damaged cache is not fatal: everything just gets rehashed
+            return
+
+        signature, version, count = struct.unpack(">4sII", data[:12])
+        if signature != INDEX_SIGNATURE or version != INDEX_VERSION:
+            return
+
+        offset = 12
+        for _ in range(count):
+            mtime_ns, size, inode, object_id, path_length = struct.unpack_from(ENTRY_FORMAT, data, offset)
+            offset += ENTRY_SIZE
+            path = data[offset:offset + path_length].decode("utf-8")
+            offset += path_length
+            self.entries[path] = IndexEntry(path, mtime_ns, size, inode, object_id.hex())
+
+        if data[offset:offset + 4] == TREE_EXTENSION:
+            offset += 4
+            tree_count = struct.unpack_from(">I", data, offset)[0]
+            offset += 4
+            for _ in range(tree_count):
+                entry_count, object_id, path_length = struct.unpack_from(TREE_FORMAT, data, offset)
+                offset += TREE_SIZE
+                path = data[offset:offset + path_length].decode("utf-8")
+                offset += path_length
+                self.trees[path] = (object_id.hex(), entry_count)
+
+        if data[offset:offset + 4] == FSMONITOR_EXTENSION:
+            offset += 4
+            token_length = struct.unpack_from(">H", data, offset)[0]
+            offset += 2
+            self.fsmonitor_token = data[offset:offset + token_length].decode("ascii")
+
+    def get_object_id(self, path, stat_result):
+        """
+        Get the cached blob hash for a file if its stat data is unchanged.
+
+        Args:
+            path: Path relative to the repository root
+            stat_result: Current os.stat_result of the file
+
+        Returns:
+            Cached SHA-1 hash, or None if the file has to be rehashed
+        """
+        self._seen.add(path)
+        entry = self.entries.get(path)
+        if entry is not None and entry.matches(stat_result):
+            return entry.object_id
+        return None
+
+    def get_unchanged_object_id(self, path):
+        """
+        Get the cached blob hash for a file known not to have changed.
+
+        Used when a filesystem monitor vouches for the file, so it isn't
+        even stat'ed.
+
+        Args:
+            path: Path relative to the repository root
+
+        Returns:
+            Cached SHA-1 hash, or None if the file isn't in the index
+        """
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        self._seen.add(path)
+        return entry.object_id
+
+    def get_unchanged_tree(self, directory):
+        """
+        Get the cached tree of a directory known not to have changed.
+
+        Every entry below the directory counts as visited.
+
+        Args:
+            directory: Directory path relative to the repository root
+
+        Returns:
+            Cached SHA-1 hash, or None if the directory has to be scanned
+        """
+        cached = self.trees.get(directory)
+        if cached is None:
+            return None
+        self._seen_directories.add(directory + "/")
+        return cached[0]
+
+    def set_fsmonitor_token(self, token):
+        """Record the filesystem monitor token the index is current up to."""
+        if token != self.fsmonitor_token:
+            self.fsmonitor_token = token
+            self.changed = True
+
+    def _was_seen(self, path):
+        if path in self._seen:
+            return True
+        if self._seen_directories:
+            directory = path
+            while "/" in directory:
+                directory = directory.rpartition("/")[0]
+                if directory + "/" in self._seen_directories:
+                    return True
+        return False
+
+    def update(self, path, stat_result, object_id):
+        """
+        Record the blob hash of a file together with its stat data.
+
+        Args:
+            path: Path relative to the repository root
+            stat_result: os.stat_result taken before the file was read
+            object_id: SHA-1 hash of the blob
+        """
+        self._seen.add(path)
+        previous = self.entries.get(path)
+        if previous is None or previous.object_id != object_id:
+            self.invalidate_tree(path)
+        self.entries[path] = IndexEntry(
+            path,
+            stat_result.st_mtime_ns,
+            stat_result.st_size,
+            stat_result.st_ino,
+            object_id
+        )
+        self.changed = True
+
+    def remove(self, path):
+        """
+        Drop the entry for a file, or every entry under a directory.
+
+        Args:
+            path: File or directory path relative to the repository root
+        """
+        self.invalidate_tree(path)
+        if self.entries.pop(path, None) is not None:
+            self.changed = True
+            return
+
+        directory_prefix = path + "/"
+        for entry_path in list(self.entries):
+            if entry_path == path or entry_path.startswith(directory_prefix):
+                del self.entries[entry_path]
+                self.changed = True
+        for tree_path in list(self.trees):
+            if tree_path == path or tree_path.startswith(directory_prefix):
+                del self.trees[tree_path]
+                self.changed = True
+
+    def remove_unseen(self, prefix=""):
+        """
+        Drop entries under prefix that were not visited since the index was loaded.
+
+        Args:
+            prefix: Directory path relative to the repository root ("" for all)
+        """
+        if prefix:
+            prefix = prefix.rstrip("/") + "/"
+        for path in list(self.entries):
+            if path.startswith(prefix) and not self._was_seen(path):
+                del self.entries[path]
+                self.invalidate_tree(path)
+                self.changed = True
+
+    def invalidate_tree(self, path):
+        """
+        Drop the cached trees of every directory containing path.
+
+        Args:
+            path: File path relative to the repository root
+        """
+        directory = path
+        while directory:
+            directory = directory.rpartition("/")[0]
+            if self.trees.pop(directory, None) is not None:
+                self.changed = True
+
+    def get_cached_tree(self, directory, entry_count):
+        """
+        Get the cached tree hash of a directory.
+
+        Args:
+            directory: Directory path relative to the repository root ("" for the root)
+            entry_count: Number of entries the directory's tree has now
+
+        Returns:
+            Cached SHA-1 hash, or None if the directory has to be rebuilt
+        """
+        cached = self.trees.get(directory)
+        if cached is not None and cached[1] == entry_count:
+            return cached[0]
+        return None
+
+    def set_cached_tree(self, directory, object_id, entry_count):
+        """
+        Record the tree hash of a directory.
+
+        Args:
+            directory: Directory path relative to the repository root ("" for the root)
+            object_id: SHA-1 hash of the tree object
+            entry_count: Number of entries in the tree
+        """
+        if self.trees.get(directory) != (object_id, entry_count):
+            self.trees[directory] = (object_id, entry_count)
+            self.changed = True
+
+    def save(self):
+        """
+        Write the index back to disk if it changed.
+
+        Entries modified in the same second the index is written are stored
+        with a zero mtime ("racily clean"): a later write within that second
+        would not change the recorded mtime, so those files are rehashed on
+        the next run instead of trusting the cache.
+        """
+        if not self.changed:
+            return
+
+        # The index names blobs and trees, so they have to be in place first
+        GitObject.flush_objects()
+        with perf.phase("index save"):
+            self._write()
+
+    def _write(self):
+        """Serialise the index and atomically replace the file on disk."""
+        now_seconds = time.time_ns() // 1_000_000_000
+        parts = [struct.pack(">4sII", INDEX_SIGNATURE, INDEX_VERSION, len(self.entries))]
+
+        for path in sorted(self.entries):
+            entry = self.entries[path]
+            mtime_ns = entry.mtime_ns
+            if mtime_ns // 1_000_000_000 >= now_seconds:
+                mtime_ns = 0
+            encoded_path = path.encode("utf-8")
+            parts.append(struct.pack(
+                ENTRY_FORMAT,
+                mtime_ns,
+                entry.size,
+                entry.inode,
+                bytes.fromhex(entry.object_id),
+                len(encoded_path)
+            ))
+            parts.append(encoded_path)
+
+        parts.append(TREE_EXTENSION + struct.pack(">I", len(self.trees)))
+        for directory in sorted(self.trees):
+            object_id, entry_count = self.trees[directory]
+            encoded_path = directory.encode("utf-8")
+            parts.append(struct.pack(TREE_FORMAT, entry_count, bytes.fromhex(object_id), len(encoded_path)))
+            parts.append(encoded_path)
+
+        if self.fsmonitor_token:
+            encoded_token = self.fsmonitor_token.encode("ascii")
+            parts.append(FSMONITOR_EXTENSION + struct.pack(">H", len(encoded_token)) + encoded_token)
+
+        data = b"".join(parts)
+        data += hashlib.sha1(data).digest()
+
+        temp_path = self.index_path + ".lock"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self.index_path)
+        self.changed = False
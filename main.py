@@ -2,12 +2,18 @@
 import sys
 import os
 import argparse
-from blob import hash_file_to_blob, read_git_object
-from tree import write_tree_from_directory, list_tree_contents
-from commit import commit_changes
-from help import find_repo_root, get_ignore_patterns, format_commit_log
-from branch import create_branch, checkout
-from merge import my_git_merge, my_git_rebase
+import perf
+from daemon import forward_command
+
+# Command modules are imported inside each cmd_* handler so that only the
+# code a command actually needs is loaded at startup.
+
+
+def get_job_count(args):
+    """Number of hashing threads requested with --jobs (0 means one per CPU)."""
+    if args.jobs == 0:
+        return os.cpu_count() or 1
+    return args.jobs
 
 
 def cmd_init(args):
@@ -26,11 +32,27 @@ def cmd_init(args):
 
 def cmd_hash_object(args):
     """Hash a file and create a blob object."""
+    from blob import hash_file_to_blob
     print(hash_file_to_blob(args.file))
 
 
 def cmd_cat_file(args):
     """Display the content of a Git object."""
+    from blob import read_git_object, cat_file_batch
+    
+    if args.batch or args.batch_check:
+        cat_file_batch(
+            sys.stdin.buffer,
+            sys.stdout.buffer,
+            contents=args.batch,
+            flush=not args.buffer
+        )
+        return
+    
+    if args.object is None:
+        print("fatal: object name required (or use --batch / --batch-check)")
+        sys.exit(1)
+    
     content = read_git_object(args.object)
     if isinstance(content, bytes):
         sys.stdout.buffer.write(content)
@@ -40,17 +62,18 @@ def cmd_cat_file(args):
 
 def cmd_write_tree(args):
     """Create a tree object from the current directory."""
+    from tree import write_tree_from_directory
+    from help import get_ignore_patterns
+    
     ignore_patterns = get_ignore_patterns()
     path = args.path if args.path else ""
-    print(write_tree_from_directory(path, ignore_patterns))
+    print(write_tree_from_directory(path, ignore_patterns, get_job_count(args)))
 
 
 def cmd_ls_tree(args):
     """List the contents of a tree object."""
-    ignore_patterns = []
-    if os.path.exists("ignore.txt"):
-        with open("ignore.txt", "r") as f:
-            ignore_patterns = f.read().splitlines()
+    from tree import list_tree_contents
+    from help import find_repo_root
     
     path = args.path if args.path else ""
     try:
@@ -62,54 +85,157 @@ def cmd_ls_tree(args):
         # If find_repo_root fails, continue anyway
         pass
     
-    print(list_tree_contents(path, ignore_patterns, args.name_only, args.oid))
+    print(list_tree_contents(path, None, args.name_only, args.oid))
 
 
 def cmd_commit(args):
     """Create a new commit with the current changes."""
-    ignore_patterns = []
-    if os.path.exists("ignore.txt"):
-        with open("ignore.txt", "r") as f:
-            ignore_patterns = f.read().splitlines()
+    from commit import commit_changes
+    from help import get_ignore_patterns
     
     print(commit_changes(
         args.message,
-        ignore_patterns,
+        get_ignore_patterns(),
         author_name=args.author,
-        author_email=args.email
+        author_email=args.email,
+        jobs=get_job_count(args)
     ))
 
 
 def cmd_branch(args):
     """Create a new branch."""
+    from branch import create_branch
     print(create_branch(args.name))
 
 
 def cmd_checkout(args):
     """Switch branches or restore working tree files."""
+    from branch import checkout
     result = checkout(args.name, create_branch_flag=args.b)
     if result:
         print(result)
 
 
 def cmd_log(args):
-    """Show commit history."""
-    print(format_commit_log())
+    """Show commit history, printing each commit as soon as it is found."""
+    from help import iter_commit_log, parse_date, parse_revision_range
+    
+    try:
+        since = parse_date(args.since) if args.since else None
+        until = parse_date(args.until) if args.until else None
+    except ValueError as e:
+        print(f"fatal: {e}")
+        sys.exit(1)
+    
+    include, exclude = parse_revision_range(args.revisions)
+    entries = iter_commit_log(
+        include,
+        args.max_count,
+        since,
+        until,
+        args.author,
+        exclude=exclude,
+        topo_order=args.topo_order
+    )
+    found = False
+    try:
+        for entry in entries:
+            print(entry)
+            found = True
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head): stop walking quietly
+        entries.close()
+        if sys.stdout is sys.__stdout__:
+            # Under the daemon stdout is the client connection, not a file
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+        return
+    if not found:
+        print("No commits found.")
 
 
 def cmd_merge(args):
     """Merge a branch."""
+    from merge import my_git_merge
     print(my_git_merge(args.name))
 
 
 def cmd_rebase(args):
     """Rebase the current branch onto another branch."""
+    from merge import my_git_rebase
     print(my_git_rebase(args.name))
 
 
-def main():
-    """Main entry point for MyGit CLI."""
+def cmd_diff(args):
+    """Show changes between commits or the working directory."""
+    from diff import my_git_diff
+    
+    output_format = "patch"
+    if args.name_status:
+        output_format = "name-status"
+    elif args.stat:
+        output_format = "stat"
+    result = my_git_diff(args.revisions, output_format)
+    if result:
+        print(result)
+
+
+def cmd_merge_base(args):
+    """Find the best common ancestor(s) of two commits."""
+    from merge import my_git_merge_base
+    print(my_git_merge_base(args.commit1, args.commit2, all_bases=args.all))
+
+
+def cmd_repack(args):
+    """Pack loose objects into a pack file."""
+    from pack import repack_objects
+    print(repack_objects(all_packs=args.a))
+
+
+def cmd_pack_refs(args):
+    """Move loose refs into the packed-refs file."""
+    from repository import get_repository
+    
+    count = get_repository().refs.pack_refs()
+    if count is None:
+        print("fatal: packed-refs is locked by another process")
+        sys.exit(1)
+    print(f"Packed {count} refs")
+
+
+def cmd_gc(args):
+    """Prune unreachable objects and optionally repack."""
+    from prune import collect_garbage
+    print(collect_garbage(expire_days=args.expire, repack=args.repack, dry_run=args.dry_run))
+
+
+def cmd_visualize(args):
+    """Draw the commit graph to an image."""
+    import visualize
+    # The graph loader changes into the repository root, so pin the path first
+    output_path = os.path.abspath(args.output) if args.output else None
+    visualize.main(output_path)
+
+
+def cmd_daemon(args):
+    """Serve commands for this repository over a Unix socket."""
+    from daemon import serve, stop_daemon, daemon_status
+    
+    if args.stop:
+        print(stop_daemon())
+    elif args.status:
+        print(daemon_status())
+    else:
+        serve(run_command, fsmonitor=True if args.fsmonitor else None)
+
+
+def build_parser():
+    """Build the argument parser for every MyGit command."""
     parser = argparse.ArgumentParser(description="MyGit - A simple git implementation")
+    parser.add_argument("--perf", action="store_true", help="Report per-phase timings and I/O counters (also MYGIT_PERF=text|json|chrome)")
+    parser.add_argument("--perf-format", choices=perf.FORMATS, help="Format of the --perf report (default: text)")
+    parser.add_argument("--perf-output", help="Write the --perf report to this file instead of stderr")
+    parser.set_defaults(object_batch=True)
     subparsers = parser.add_subparsers(dest="command", required=True)
     
     # init command
@@ -129,8 +255,12 @@ def main():
         "cat-file",
         help="Provide content or type and size information for repository objects"
     )
-    sp_cat.add_argument("object", help="The object to display")
+    sp_cat.add_argument("object", nargs="?", help="The object to display")
     sp_cat.add_argument("-p", action="store_true", help="Pretty-print object content")
+    sp_cat_batch = sp_cat.add_mutually_exclusive_group()
+    sp_cat_batch.add_argument("--batch", action="store_true", help="Print type, size and content of objects named on stdin")
+    sp_cat_batch.add_argument("--batch-check", action="store_true", help="Print type and size of objects named on stdin")
+    sp_cat.add_argument("--buffer", action="store_true", help="Don't flush output after every object in batch mode")
     sp_cat.set_defaults(func=cmd_cat_file)
     
     # write-tree command
@@ -139,6 +269,7 @@ def main():
         help="Create a tree object from the current index"
     )
     sp_write_tree.add_argument("path", nargs="?", default="", help="Path to write tree from")
+    sp_write_tree.add_argument("-j", "--jobs", type=int, default=1, help="Number of files hashed in parallel (0 = one per CPU)")
     sp_write_tree.set_defaults(func=cmd_write_tree)
     
     # ls-tree command
@@ -153,6 +284,7 @@ def main():
     sp_commit.add_argument("-m", "--message", required=True, help="Commit message")
     sp_commit.add_argument("--author", default="You", help="Author name")
     sp_commit.add_argument("--email", default="you@example.com", help="Author email")
+    sp_commit.add_argument("-j", "--jobs", type=int, default=1, help="Number of files hashed in parallel (0 = one per CPU)")
     sp_commit.set_defaults(func=cmd_commit)
     
     # branch command
@@ -171,6 +303,12 @@ def main():
     
     # log command
     sp_log = subparsers.add_parser("log", help="Show commit history")
+    sp_log.add_argument("-n", "--max-count", type=int, default=None, help="Show at most this many commits")
+    sp_log.add_argument("--since", "--after", help="Show commits newer than a date (e.g. 2024-05-01, '2 weeks ago')")
+    sp_log.add_argument("--until", "--before", help="Show commits older than a date")
+    sp_log.add_argument("--author", help="Show commits whose author name or email contains this text")
+    sp_log.add_argument("--topo-order", action="store_true", help="Never show a parent before all of its children")
+    sp_log.add_argument("revisions", nargs="*", help="Branches or commits to start from (default: HEAD); A..B or ^A leaves out A's history")
     sp_log.set_defaults(func=cmd_log)
     
     # merge command
@@ -183,8 +321,104 @@ def main():
     sp_rebase.add_argument("name", help="The name of the branch to rebase onto")
     sp_rebase.set_defaults(func=cmd_rebase)
     
-    args = parser.parse_args()
-    args.func(args)
+    # diff command
+    sp_diff = subparsers.add_parser("diff", help="Show changes between commits or the working directory")
+    sp_diff_format = sp_diff.add_mutually_exclusive_group()
+    sp_diff_format.add_argument("--name-status", action="store_true", help="Show only names and status of changed files")
+    sp_diff_format.add_argument("--stat", action="store_true", help="Show a diffstat")
+    sp_diff.add_argument("revisions", nargs="*", help="Zero, one or two branches/commits to compare")
+    sp_diff.set_defaults(func=cmd_diff)
+    
+    # merge-base command
+    sp_merge_base = subparsers.add_parser("merge-base", help="Find the best common ancestor of two commits")
+    sp_merge_base.add_argument("--all", action="store_true", help="Show all best common ancestors")
+    sp_merge_base.add_argument("commit1", help="First branch or commit")
+    sp_merge_base.add_argument("commit2", help="Second branch or commit")
+    sp_merge_base.set_defaults(func=cmd_merge_base)
+    
+    # repack command
+    sp_repack = subparsers.add_parser("repack", help="Pack loose objects into a pack file")
+    sp_repack.add_argument("-a", action="store_true", help="Also combine existing packs into the new one")
+    sp_repack.set_defaults(func=cmd_repack)
+    
+    # pack-refs command
+    sp_pack_refs = subparsers.add_parser("pack-refs", help="Move loose refs into the sorted packed-refs file")
+    sp_pack_refs.set_defaults(func=cmd_pack_refs)
+    
+    # gc command
+    sp_gc = subparsers.add_parser("gc", help="Remove unreachable objects and optionally repack")
+    sp_gc.add_argument("--expire", type=float, default=None, help="Keep unreachable objects younger than this many days (default: gc.expireDays or 14; 0 = prune all)")
+    sp_gc.add_argument("--repack", action="store_true", help="Pack all reachable objects into a single pack afterwards")
+    sp_gc.add_argument("-n", "--dry-run", action="store_true", help="Only report what would be pruned")
+    sp_gc.set_defaults(func=cmd_gc)
+    
+    # visualize command
+    sp_visualize = subparsers.add_parser("visualize", help="Draw the commit graph as an image (requires matplotlib)")
+    sp_visualize.add_argument("-o", "--output", default=None, help="Image file to write (default: commit_graph_images/a.png in the repository)")
+    sp_visualize.set_defaults(func=cmd_visualize)
+    
+    # daemon command
+    sp_daemon = subparsers.add_parser("daemon", help="Keep repository state warm and serve commands over a socket")
+    sp_daemon_action = sp_daemon.add_mutually_exclusive_group()
+    sp_daemon_action.add_argument("--stop", action="store_true", help="Stop the running daemon")
+    sp_daemon_action.add_argument("--status", action="store_true", help="Show whether a daemon is running")
+    sp_daemon.add_argument("--fsmonitor", action="store_true", help="Watch the worktree so commits only look at changed paths (default: core.fsmonitor)")
+    # Each forwarded command gets its own batch; the server loop must not hold one
+    sp_daemon.set_defaults(func=cmd_daemon, object_batch=False)
+    
+    return parser
+
+
+def run_command(argv):
+    """
+    Parse and run one command line in this process.
+    
+    Args:
+        argv: Command-line arguments without the program name
+    """
+    args = build_parser().parse_args(argv)
+    
+    output_format, output_path = perf.settings_from_environment()
+    if args.perf or args.perf_format:
+        output_format = args.perf_format or output_format or "text"
+    if args.perf_output:
+        output_path = args.perf_output
+    
+    if output_format is None:
+        _run_handler(args)
+        return
+    
+    perf.enable()
+    try:
+        with perf.phase(args.command):
+            _run_handler(args)
+    finally:
+        perf.report(output_format, output_path)
+
+
+def _run_handler(args):
+    """Run a command handler with its object writes grouped into one batch."""
+    if not args.object_batch:
+        args.func(args)
+        return
+    
+    from git_object import GitObject
+    # New objects are synced and renamed into place together when the command
+    # finishes, or earlier when a ref or the index is about to name them
+    with GitObject.batch():
+        args.func(args)
+
+
+def main():
+    """Main entry point for MyGit CLI."""
+    argv = sys.argv[1:]
+    
+    # Let a running daemon serve the command; otherwise run it here
+    exit_code = forward_command(argv)
+    if exit_code is not None:
+        sys.exit(exit_code)
+    
+    run_command(argv)
 
 
 if __name__ == "__main__":
@@ -1,37 +1,136 @@
-import sys
-import os
-import argparse
+import re
+import time
+import heapq
 from commit import (
     get_parent_commit_id,
     get_branch_commit_id,
     update_branch_reference,
     write_commit_2_parents,
-    get_commit_info,
-    create_commit_object
+    format_author
 )
-from help import get_curr_branch,find_repo_root
+from help import get_curr_branch
+from refs import branch_ref
+from repository import get_repository
+from git_object import GitObject
+from commit_graph import get_commit_graph
+import perf
 
-def find_commot_ancestor(commit_id1,commit_id2):
-    all_commit_id_seen = set()
+# Flags painted on commits while searching for merge bases
+PARENT1 = 1
+PARENT2 = 2
+STALE = 4
+
+
+def find_merge_bases(commit_id1, commit_id2, all_bases=False):
+    """
+    Find the best common ancestor(s) of two commits.
+    
+    Both sides are painted down at once from a priority queue ordered by
+    generation number (then commit date), so every commit is popped only
+    after all of its descendants in the walk. A commit reached from both
+    sides is a merge base; its ancestors are marked stale, and the walk
+    stops as soon as only stale commits are left to visit.
+    
+    Args:
+        commit_id1: SHA-1 hash of the first commit
+        commit_id2: SHA-1 hash of the second commit
+        all_bases: Return every best common ancestor instead of just one
+        
+    Returns:
+        List of merge base commit hashes (empty if the histories are unrelated)
+    """
     if commit_id1 == commit_id2:
-        return commit_id1
-    queue = [commit_id1]
-    all_commit_id_seen.add(commit_id1)
-    while queue:
-        curr = get_parent_commit_id(queue.pop(0))
-        if curr:
-            queue.extend(curr)
-            for c in curr:
-                all_commit_id_seen.add(c)
-    queue = [commit_id2]
-    while queue:
-        curr = get_parent_commit_id(queue.pop(0))
-        if commit_id1 in curr:
-            return commit_id1
-        for c in curr:
-            if c in all_commit_id_seen:
-                return c
-        queue.extend(curr)
+        return [commit_id1]
+    
+    graph = get_commit_graph()
+    flags = {}
+    queue = []
+    counter = 0
+    active = 0  # queued commits that are not stale yet
+    
+    def push(commit_id):
+        nonlocal counter, active
+        generation = graph.get_generation(commit_id) or 0
+        timestamp = graph.get_timestamp(commit_id) or 0
+        heapq.heappush(queue, (-generation, -timestamp, counter, commit_id))
+        counter += 1
+        if not flags[commit_id] & STALE:
+            active += 1
+    
+    flags[commit_id1] = PARENT1
+    flags[commit_id2] = PARENT2
+    push(commit_id1)
+    push(commit_id2)
+    
+    bases = []
+    while active:
+        commit_id = heapq.heappop(queue)[3]
+        if perf.enabled:
+            perf.count("merge_base_commits_visited")
+        commit_flags = flags[commit_id]
+        if not commit_flags & STALE:
+            active -= 1
+        
+        if commit_flags == PARENT1 | PARENT2:
+            bases.append(commit_id)
+            if not all_bases:
+                break
+            # Ancestors of a merge base can't be better bases
+            commit_flags |= STALE
+        
+        for parent_id in get_parent_commit_id(commit_id) or []:
+            parent_flags = flags.get(parent_id)
+            if parent_flags is None:
+                flags[parent_id] = commit_flags
+                push(parent_id)
+            elif parent_flags | commit_flags != parent_flags:
+                # Already queued: only the flags change
+                if commit_flags & STALE and not parent_flags & STALE:
+                    active -= 1
+                flags[parent_id] = parent_flags | commit_flags
+    
+    graph.save()
+    return bases
+
+
+def find_merge_base(commit_id1, commit_id2):
+    """
+    Find the best common ancestor of two commits.
+    
+    Args:
+        commit_id1: SHA-1 hash of the first commit
+        commit_id2: SHA-1 hash of the second commit
+        
+    Returns:
+        Merge base commit hash, or None if the histories are unrelated
+    """
+    bases = find_merge_bases(commit_id1, commit_id2)
+    return bases[0] if bases else None
+
+
+def find_commot_ancestor(commit_id1,commit_id2):
+    """Legacy function - use find_merge_base() instead."""
+    return find_merge_base(commit_id1, commit_id2)
+
+
+def my_git_merge_base(commit_ref1, commit_ref2, all_bases=False):
+    """
+    Show the merge base(s) of two branches or commits.
+    
+    Args:
+        commit_ref1: Branch name or commit hash
+        commit_ref2: Branch name or commit hash
+        all_bases: Show every best common ancestor
+        
+    Returns:
+        Merge base hashes, one per line, or an error message string
+    """
+    commit_id1 = get_branch_commit_id(commit_ref1) or commit_ref1
+    commit_id2 = get_branch_commit_id(commit_ref2) or commit_ref2
+    bases = find_merge_bases(commit_id1, commit_id2, all_bases)
+    if not bases:
+        return "no common ancestor"
+    return "\n".join(bases)
 
 def my_git_merge(branch):
     curr_branch = get_curr_branch()
@@ -39,7 +138,7 @@ def my_git_merge(branch):
         return "cant merge the same branch"
     commit_id_1 = get_branch_commit_id(curr_branch)
     commit_id_2 = get_branch_commit_id(branch)
-    common_commit_id = find_commot_ancestor(commit_id_1,commit_id_2)
+    common_commit_id = find_merge_base(commit_id_1,commit_id_2)
     if commit_id_1 == common_commit_id:
         update_branch_reference(commit_id_2)
         return "merged"
@@ -47,6 +146,137 @@ def my_git_merge(branch):
         return "cant merge to an old version"
     return write_commit_2_parents(merge_branch1=curr_branch,merge_branch2=branch,parent_commit_id1=commit_id_1,parent_commit_id2=commit_id_2)
 
+def collect_rebase_commits(tip_id, base_id):
+    """
+    List the commits a rebase replays, in one walk of the commit-graph.
+    
+    First parents are followed from the tip back to the base.
+    
+    Args:
+        tip_id: SHA-1 hash of the branch tip
+        base_id: SHA-1 hash of the merge base (None for unrelated histories)
+        
+    Returns:
+        List of commit hashes, oldest first, or None if a commit can't be read
+    """
+    graph = get_commit_graph()
+    commit_ids = []
+    pointer = tip_id
+    while pointer is not None and pointer != base_id:
+        parents = graph.get_parents(pointer)
+        if parents is None:
+            return None
+        commit_ids.append(pointer)
+        pointer = parents[0] if parents else None
+    commit_ids.reverse()
+    return commit_ids
+
+
+def replay_commits(commit_ids, onto_id, timestamp=None):
+    """
+    Build rebased copies of commits in memory, without writing anything.
+    
+    Each copy keeps the tree, author and message of its original and gets
+    the previous copy (or onto_id) as its only parent; the committer date
+    is set to timestamp.
+    
+    Args:
+        commit_ids: Commit hashes to replay, oldest first
+        onto_id: SHA-1 hash of the commit to replay them onto
+        timestamp: Committer timestamp (default: now)
+        
+    Returns:
+        List of (commit hash, commit data, tree hash) tuples, oldest first
+    
+    Raises:
+        ValueError: If a commit can't be parsed
+    """
+    if timestamp is None:
+        timestamp = int(time.time())
+    
+    replayed = []
+    parent_id = onto_id
+    for commit_id in commit_ids:
+        header, _, message = GitObject.read_object(commit_id).partition(b"\n\n")
+        tree_id = None
+        lines = []
+        for line in header.split(b"\n"):
+            if line.startswith(b"tree "):
+                tree_id = line[5:].decode("ascii")
+                lines.append(line)
+                lines.append(f"parent {parent_id}".encode("ascii"))
+            elif line.startswith(b"committer "):
+                match = re.match(r"(.*) <(.*)> \d+ [+-]\d+", line[10:].decode("utf-8"))
+                if match is None:
+                    raise ValueError(f"bad committer line in commit {commit_id}")
+                lines.append(f"committer {format_author(match.group(1), match.group(2), timestamp)}".encode("utf-8"))
+            elif not line.startswith(b"parent "):
+                lines.append(line)
+        if tree_id is None:
+            raise ValueError(f"no tree in commit {commit_id}")
+        
+        data = b"\n".join(lines) + b"\n\n" + message
+        parent_id = GitObject.write_object("commit", data, write=False)
+        replayed.append((parent_id, data, tree_id))
+    return replayed
+
+
+def rebase_branch(branch_name, onto_id, base_id=None):
+    """
+    Replay the commits of a branch that aren't on onto_id on top of it.
+    
+    The range is collected from the commit-graph, every new commit is built
+    in memory, then all of them are written in one batch and the
+    commit-graph is saved once. The branch ref is moved last, and only if it
+    still points where it did, so a rebase that fails or races with another
+    update leaves the branch as it was.
+    
+    Args:
+        branch_name: Branch to rebase
+        onto_id: SHA-1 hash of the commit to rebase onto
+        base_id: Merge base of the branch and onto_id, if already known
+            (default: None, computed)
+        
+    Returns:
+        SHA-1 hash of the new branch tip
+    
+    Raises:
+        ValueError: If a commit can't be read or the branch moved meanwhile
+    """
+    tip_id = get_branch_commit_id(branch_name)
+    
+    with perf.phase("collect"):
+        if base_id is None:
+            base_id = find_merge_base(tip_id, onto_id)
+        commit_ids = collect_rebase_commits(tip_id, base_id)
+    if commit_ids is None:
+        raise ValueError(f"could not read the history of {branch_name}")
+    
+    timestamp = int(time.time())
+    with perf.phase("replay"):
+        replayed = replay_commits(commit_ids, onto_id, timestamp)
+    if perf.enabled:
+        perf.count("commits_rebased", len(replayed))
+    
+    graph = get_commit_graph()
+    with perf.phase("write"):
+        with GitObject.batch():
+            for _, data, _ in replayed:
+                GitObject.write_object("commit", data)
+        
+        parent_id = onto_id
+        for commit_id, _, tree_id in replayed:
+            graph.add_commit(commit_id, tree_id, [parent_id], timestamp)
+            parent_id = commit_id
+        graph.save()
+    
+    # The original commits are left for gc: other refs may still point at them
+    new_tip_id = replayed[-1][0] if replayed else onto_id
+    if not get_repository().refs.update_ref(branch_ref(branch_name), new_tip_id, old_value=tip_id):
+        raise ValueError(f"{branch_name} was updated during the rebase")
+    return new_tip_id
+
+
 def my_git_rebase(branch):
     curr_branch = get_curr_branch()
     if curr_branch is None:
@@ -60,42 +290,15 @@ def my_git_rebase(branch):
     if not current_commit_id or not target_commit_id:
         return "One or both branches have no commits"
         
-    common_ancestor = find_commot_ancestor(current_commit_id, target_commit_id)
+    common_ancestor = find_merge_base(current_commit_id, target_commit_id)
     
     if common_ancestor == current_commit_id:
         # Fast-forward: current is ancestor of target.
         update_branch_reference(target_commit_id, curr_branch)
         return f"Fast-forwarded {curr_branch} to {branch}"
         
-    # Collect commits to rebase
-    commits_to_rebase = []
-    pointer = current_commit_id
-    while pointer != common_ancestor and pointer is not None:
-        commits_to_rebase.append(pointer)
-        parents = get_parent_commit_id(pointer)
-        if parents:
-            pointer = parents[0]
-        else:
-            break
-            
-    commits_to_rebase.reverse()
-    
-    # Replay commits
-    new_parent = target_commit_id
-    
-    for commit_id in commits_to_rebase:
-        info = get_commit_info(commit_id)
-        if info:
-            new_commit_id = create_commit_object(
-                info['tree_id'],
-                info['message'],
-                [new_parent],
-                info['author_name'],
-                info['author_email']
-            )
-            new_parent = new_commit_id
-            path = os.path.join(find_repo_root(),".mygit","objects")
-            os.remove(os.path.join(path,commit_id[:2],commit_id[2:]))
-    # Update branch ref
-    update_branch_reference(new_parent, curr_branch)
+    try:
+        rebase_branch(curr_branch, target_commit_id, common_ancestor)
+    except ValueError as e:
+        return f"Rebase failed: {e}"
     return f"Successfully rebased {curr_branch} onto {branch}"
@@ -0,0 +1,383 @@
+import os
+import zlib
+import struct
+import hashlib
+
+
+PACK_SIGNATURE = b"PACK"
+PACK_VERSION = 2
+IDX_SIGNATURE = b"\377tOc"
+IDX_VERSION = 2
+
+# Pack entry type codes (same numbering as git)
+TYPE_CODES = {"commit": 1, "tree": 2, "blob": 3}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+FANOUT_SIZE = 256 * 4
+HEADER_SIZE = 8
+LARGE_OFFSET_FLAG = 0x80000000
+
+
+def encode_entry_header(object_type, size):
+    """
+    Encode the variable-length header that precedes each pack entry.
+
+    Args:
+        object_type: Type of object ('blob', 'tree', or 'commit')
+        size: Uncompressed size of the object content
+
+    Returns:
+        Header as bytes
+    """
+    byte = (TYPE_CODES[object_type] << 4) | (size & 0x0F)
+    size >>= 4
+    header = bytearray()
+    while size:
+        header.append(byte | 0x80)
+        byte = size & 0x7F
+        size >>= 7
+    header.append(byte)
+    return bytes(header)
+
+
+def decode_entry_header(data):
+    """
+    Decode a pack entry header.
+
+    Args:
+        data: Bytes starting at the entry header
+
+    Returns:
+        Tuple of (object_type, size, header_length)
+    """
+    byte = data[0]
+    type_code = (byte >> 4) & 0x07
+    size = byte & 0x0F
+    shift = 4
+    index = 1
+    while byte & 0x80:
+        byte = data[index]
+        size |= (byte & 0x7F) << shift
+        shift += 7
+        index += 1
+    return TYPE_NAMES[type_code], size, index
+
+
+class PackFile:
+    """
+    A pack file together with its .idx lookup table.
+
+    The index is a git-style version 2 idx: a 256-entry fanout table
+    followed by the sorted object names, their CRC32s and pack offsets.
+    Lookups are a binary search inside the fanout bucket followed by a
+    single seek into the pack.
+    """
+
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self.idx_path = pack_path[:-len(".pack")] + ".idx"
+        self._pack_file = None
+
+        with open(self.idx_path, "rb") as f:
+            self._idx = f.read()
+
+        if self._idx[:4] != IDX_SIGNATURE:
+            raise ValueError(f"Bad pack index signature in {self.idx_path}")
+        version = struct.unpack(">I", self._idx[4:8])[0]
+        if version != IDX_VERSION:
+            raise ValueError(f"Unsupported pack index version {version}")
+
+        self._fanout = struct.unpack(">256I", self._idx[HEADER_SIZE:HEADER_SIZE + FANOUT_SIZE])
+        self.count = self._fanout[255]
+        self._names_start = HEADER_SIZE + FANOUT_SIZE
+        self._crc_start = self._names_start + 20 * self.count
+        self._offsets_start = self._crc_start + 4 * self.count
+        self._large_offsets_start = self._offsets_start + 4 * self.count
+
+    def _name_at(self, position):
+        start = self._names_start + position * 20
+        return self._idx[start:start + 20]
+
+    def find_position(self, object_hash):
+        """
+        Binary search the index for an object.
+
+        Args:
+            object_hash: SHA-1 hash of the object (hex string)
+
+        Returns:
+            Position of the object in the index, or None if not present
+        """
+        try:
+            binary_hash = bytes.fromhex(object_hash)
+        except ValueError:
+            return None
+        if len(binary_hash) != 20:
+            return None
+        first_byte = binary_hash[0]
+        low = self._fanout[first_byte - 1] if first_byte else 0
+        high = self._fanout[first_byte]
+
+        while low < high:
+            middle = (low + high) // 2
+            name = self._name_at(middle)
+            if name == binary_hash:
+                return middle
+            if name < binary_hash:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _offset_at(self, position):
+        start = self._offsets_start + position * 4
+        offset = struct.unpack(">I", self._idx[start:start + 4])[0]
+        if offset & LARGE_OFFSET_FLAG:
+            start = self._large_offsets_start + (offset & ~LARGE_OFFSET_FLAG) * 8
+            offset = struct.unpack(">Q", self._idx[start:start + 8])[0]
+        return offset
+
+    def contains(self, object_hash):
+        """Return True if the object is stored in this pack."""
+        return self.find_position(object_hash) is not None
+
+    def object_ids(self):
+        """Yield every object hash stored in this pack, in sorted order."""
+        for position in range(self.count):
+            yield self._name_at(position).hex()
+
+    def read_header(self, object_hash):
+        """
+        Read only the type and size of a packed object, without inflating it.
+
+        Args:
+            object_hash: SHA-1 hash of the object
+
+        Returns:
+            Tuple of (object_type, size), or None if not in this pack
+        """
+        position = self.find_position(object_hash)
+        if position is None:
+            return None
+
+        if self._pack_file is None:
+            self._pack_file = open(self.pack_path, "rb")
+
+        self._pack_file.seek(self._offset_at(position))
+        object_type, size, _ = decode_entry_header(self._pack_file.read(32))
+        return object_type, size
+
+    def read(self, object_hash):
+        """
+        Read an object from the pack.
+
+        Args:
+            object_hash: SHA-1 hash of the object
+
+        Returns:
+            Tuple of (object_type, content), or None if not in this pack
+        """
+        position = self.find_position(object_hash)
+        if position is None:
+            return None
+
+        if self._pack_file is None:
+            self._pack_file = open(self.pack_path, "rb")
+
+        pack = self._pack_file
+        pack.seek(self._offset_at(position))
+        chunk = pack.read(4096)
+        object_type, size, header_length = decode_entry_header(chunk)
+
+        decompressor = zlib.decompressobj()
+        parts = [decompressor.decompress(chunk[header_length:])]
+        while not decompressor.eof:
+            chunk = pack.read(65536)
+            if not chunk:
+                raise ValueError(f"Truncated pack entry for {object_hash}")
+            parts.append(decompressor.decompress(chunk))
+        content = b"".join(parts)
+
+        if len(content) != size:
+            raise ValueError(f"Corrupt pack entry for {object_hash}")
+        return object_type, content
+
+    def close(self):
+        """Close the underlying pack file handle."""
+        if self._pack_file is not None:
+            self._pack_file.close()
+            self._pack_file = None
+
+
+def write_pack(pack_dir, objects):
+    """
+    Write a pack file and its index.
+
+    Args:
+        pack_dir: Directory to write the pack into
+        objects: Iterable of (object_hash, object_type, content)
+
+    Returns:
+        Path to the new .pack file, or None if there were no objects
+    """
+    from git_object import choose_compression_level
+
+    os.makedirs(pack_dir, exist_ok=True)
+    temp_pack_path = os.path.join(pack_dir, f"tmp_pack_{os.getpid()}")
+
+    entries = []  # (binary_hash, crc32, offset)
+    pack_hash = hashlib.sha1()
+
+    with open(temp_pack_path, "wb") as f:
+        # Object count is patched in once all entries are written
+        header = PACK_SIGNATURE + struct.pack(">II", PACK_VERSION, 0)
+        f.write(header)
+        offset = len(header)
+
+        for object_hash, object_type, content in objects:
+            level = choose_compression_level(object_type, content)
+            entry = encode_entry_header(object_type, len(content)) + zlib.compress(content, level)
+            f.write(entry)
+            entries.append((bytes.fromhex(object_hash), zlib.crc32(entry), offset))
+            offset += len(entry)
+
+    if not entries:
+        os.remove(temp_pack_path)
+        return None
+
+    with open(temp_pack_path, "r+b") as f:
+        f.seek(8)
+        f.write(struct.pack(">I", len(entries)))
+        f.seek(0)
+        for chunk in iter(lambda: f.read(65536), b""):
+            pack_hash.update(chunk)
+        pack_checksum = pack_hash.digest()
+        f.write(pack_checksum)
+
+    entries.sort()
+    idx_data = _build_index(entries, pack_checksum)
+
+    base_name = os.path.join(pack_dir, f"pack-{pack_checksum.hex()}")
+    pack_path = base_name + ".pack"
+    idx_path = base_name + ".idx"
+
+    # The pack must be in place before the idx makes it visible to readers
+    os.replace(temp_pack_path, pack_path)
+    temp_idx_path = idx_path + ".tmp"
+    with open(temp_idx_path, "wb") as f:
+        f.write(idx_data)
+    os.replace(temp_idx_path, idx_path)
+
+    return pack_path
+
+
+def _build_index(entries, pack_checksum):
+    """Serialize sorted (binary_hash, crc32, offset) entries as a v2 idx."""
+    fanout = [0] * 256
+    for binary_hash, _, _ in entries:
+        fanout[binary_hash[0]] += 1
+    total = 0
+    for i in range(256):
+        total += fanout[i]
+        fanout[i] = total
+
+    parts = [IDX_SIGNATURE, struct.pack(">I", IDX_VERSION), struct.pack(">256I", *fanout)]
+    parts.extend(binary_hash for binary_hash, _, _ in entries)
+    parts.extend(struct.pack(">I", crc & 0xFFFFFFFF) for _, crc, _ in entries)
+
+    large_offsets = []
+    for _, _, offset in entries:
+        if offset < LARGE_OFFSET_FLAG:
+            parts.append(struct.pack(">I", offset))
+        else:
+            parts.append(struct.pack(">I", LARGE_OFFSET_FLAG | len(large_offsets)))
+            large_offsets.append(struct.pack(">Q", offset))
+    parts.extend(large_offsets)
+    parts.append(pack_checksum)
+
+    idx_data = b"".join(parts)
+    return idx_data + hashlib.sha1(idx_data).digest()
+
+
+def find_pack_files(pack_dir):
+    """
+    List pack files that have a matching index.
+
+    Args:
+        pack_dir: Directory containing packs
+
+    Returns:
+        Sorted list of .pack paths
+    """
+    if not os.path.isdir(pack_dir):
+        return []
+
+    packs = []
+    for name in sorted(os.listdir(pack_dir)):
+        if name.endswith(".pack"):
+            pack_path = os.path.join(pack_dir, name)
+            if os.path.exists(pack_path[:-len(".pack")] + ".idx"):
+                packs.append(pack_path)
+    return packs
+
+
+def repack_objects(all_packs=False, keep=None):
+    """
+    Move loose objects into a new pack file.
+
+    Args:
+        all_packs: Also fold every existing pack into the new one (default: False)
+        keep: Set of objects to pack (default: None, pack everything). Loose
+            objects outside it stay loose; objects of folded packs outside
+            it are dropped.
+
+    Returns:
+        Status message string
+    """
+    from git_object import GitObject, sync_paths
+
+    # Objects still pending in a write batch aren't visible as loose files yet
+    GitObject.flush_objects()
+    loose_ids = list(GitObject.iter_loose_objects())
+    old_packs = GitObject.get_packs() if all_packs else []
+    if keep is not None:
+        loose_ids = [object_hash for object_hash in loose_ids if object_hash in keep]
+
+    object_ids = set(loose_ids)
+    for pack in old_packs:
+        object_ids.update(pack.object_ids())
+    if keep is not None:
+        object_ids &= keep
+
+    if not object_ids:
+        return "Nothing to repack"
+
+    def objects():
+        for object_hash in sorted(object_ids):
+            object_type, content = GitObject.read_raw_object(object_hash)
+            yield object_hash, object_type, content
+
+    pack_path = write_pack(GitObject.pack_directory(), objects())
+    if GitObject.writer.fsync_mode != "off":
+        # The new pack must be durable before the only other copies go
+        idx_path = os.path.splitext(pack_path)[0] + ".idx"
+        sync_paths([pack_path, idx_path, GitObject.pack_directory()])
+
+    # Everything is now reachable through the new pack; drop the old copies
+    for object_hash in loose_ids:
+        os.remove(GitObject.loose_object_path(object_hash))
+        try:
+            os.rmdir(os.path.dirname(GitObject.loose_object_path(object_hash)))
+        except OSError:
+            pass
+    GitObject.writer.reset_directories()
+
+    for pack in old_packs:
+        if pack.pack_path == pack_path:
+            continue
+        pack.close()
+        os.remove(pack.idx_path)
+        os.remove(pack.pack_path)
+
+    GitObject.reload_packs()
+    return f"Packed {len(object_ids)} objects into {os.path.basename(pack_path)}"
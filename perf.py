@@ -0,0 +1,257 @@
+"""
+Lightweight performance tracing for MyGit commands.
+
+Tracing is off unless a command is run with --perf or MYGIT_PERF is set.
+While it is off, phase() returns a shared no-op context manager and
+count() returns immediately, and the hottest call sites check the
+module-level `enabled` flag before calling in at all.
+
+Usage:
+    with perf.phase("scan"):
+        ...
+    if perf.enabled:
+        perf.count("objects_read")
+"""
+import os
+import sys
+import time
+
+
+FORMATS = ("text", "json", "chrome")
+
+# Cap on recorded Chrome trace events; phases are still aggregated past it
+MAX_TRACE_EVENTS = 200000
+
+enabled = False
+
+_lock = None
+_local = None
+_root = None
+_counters = {}
+_events = []
+_start_ns = 0
+
+
+class _NullPhase:
+    """Shared context manager returned by phase() while tracing is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Node:
+    """Aggregated timing of one phase at one position in the phase tree."""
+
+    __slots__ = ("name", "total_ns", "calls", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.total_ns = 0
+        self.calls = 0
+        self.children = {}
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "total_ms": round(self.total_ns / 1e6, 3),
+            "calls": self.calls,
+            "children": [child.to_dict() for child in self.children.values()],
+        }
+
+
+class _Phase:
+    """Context manager timing one phase while tracing is enabled."""
+
+    __slots__ = ("name", "node", "start_ns")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = _stack()
+        parent = stack[-1]
+        with _lock:
+            node = parent.children.get(self.name)
+            if node is None:
+                node = parent.children[self.name] = _Node(self.name)
+        stack.append(node)
+        self.node = node
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end_ns = time.perf_counter_ns()
+        _stack().pop()
+        with _lock:
+            self.node.total_ns += end_ns - self.start_ns
+            self.node.calls += 1
+            if len(_events) < MAX_TRACE_EVENTS:
+                _events.append((self.name, self.start_ns, end_ns, _local.thread_id))
+        return False
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        import threading
+        # Phases opened in worker threads hang off the root
+        stack = _local.stack = [_root]
+        _local.thread_id = threading.get_ident()
+    return stack
+
+
+def enable():
+    """Start tracing, discarding anything recorded before."""
+    global enabled, _lock, _local, _root, _counters, _events, _start_ns
+    import threading
+
+    _lock = threading.Lock()
+    _local = threading.local()
+    _root = _Node("total")
+    _counters = {}
+    _events = []
+    _start_ns = time.perf_counter_ns()
+    enabled = True
+
+
+def disable():
+    """Stop tracing. Recorded data stays available for report()."""
+    global enabled
+    if enabled:
+        _root.total_ns = time.perf_counter_ns() - _start_ns
+        _root.calls = 1
+    enabled = False
+
+
+def phase(name):
+    """
+    Time a block of code as a named phase.
+
+    Phases nest: a phase opened inside another one is reported as its child.
+    Repeated phases with the same name and parent are aggregated.
+
+    Args:
+        name: Phase name
+
+    Returns:
+        Context manager (a shared no-op one while tracing is off)
+    """
+    if not enabled:
+        return _NULL_PHASE
+    return _Phase(name)
+
+
+def count(name, amount=1):
+    """
+    Add to a named counter.
+
+    Args:
+        name: Counter name
+        amount: Value to add (default: 1)
+    """
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def counters():
+    """Return a copy of the counters recorded so far."""
+    return dict(_counters)
+
+
+def format_text():
+    """Format the phase tree and counters as an indented text report."""
+    lines = []
+
+    def add(node, depth):
+        label = "  " * depth + node.name
+        calls = f"  ({node.calls} calls)" if node.calls > 1 else ""
+        lines.append(f"{label:<40} {node.total_ns / 1e6:10.3f} ms{calls}")
+        for child in node.children.values():
+            add(child, depth + 1)
+
+    add(_root, 0)
+    if _counters:
+        lines.append("")
+        width = max(len(name) for name in _counters)
+        for name in sorted(_counters):
+            lines.append(f"{name:<{width}}  {_counters[name]}")
+    return "\n".join(lines)
+
+
+def format_json():
+    """Format the phase tree and counters as JSON."""
+    import json
+    return json.dumps({"phases": _root.to_dict(), "counters": counters()}, indent=2)
+
+
+def format_chrome():
+    """Format recorded phases as a Chrome trace-event file (chrome://tracing, Perfetto)."""
+    import json
+
+    pid = os.getpid()
+    trace_events = [
+        {
+            "name": name,
+            "ph": "X",
+            "ts": (start_ns - _start_ns) / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": pid,
+            "tid": thread_id,
+        }
+        for name, start_ns, end_ns, thread_id in _events
+    ]
+    if _counters:
+        trace_events.append({
+            "name": "counters",
+            "ph": "C",
+            "ts": _root.total_ns / 1000,
+            "pid": pid,
+            "args": counters(),
+        })
+    return json.dumps({"traceEvents": trace_events, "displayTimeUnit": "ms"})
+
+
+def report(output_format="text", output_path=None):
+    """
+    Stop tracing and write the report.
+
+    Args:
+        output_format: 'text', 'json' or 'chrome' (default: 'text')
+        output_path: File to write to (default: standard error)
+    """
+    disable()
+    formatter = {"json": format_json, "chrome": format_chrome}.get(output_format, format_text)
+    output = formatter()
+
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(output + "\n")
+    else:
+        sys.stderr.write(output + "\n")
+        sys.stderr.flush()
+
+
+def settings_from_environment():
+    """
+    Read tracing settings from MYGIT_PERF and MYGIT_PERF_OUTPUT.
+
+    MYGIT_PERF may be a format name or any other non-empty value for text.
+
+    Returns:
+        Tuple of (format, output_path), with format None if tracing is off
+    """
+    value = os.environ.get("MYGIT_PERF", "")
+    if not value or value == "0":
+        return None, None
+    output_format = value if value in FORMATS else "text"
+    return output_format, os.environ.get("MYGIT_PERF_OUTPUT") or None
@@ -0,0 +1,238 @@
+import os
+import time
+from git_object import GitObject
+from commit_graph import get_commit_graph
+from repository import get_repository
+import perf
+
+
+# Unreachable objects younger than this are kept: another command may be
+# about to make them reachable
+DEFAULT_EXPIRE_DAYS = 14
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Temporary files left behind by interrupted object and pack writes
+TEMP_PREFIXES = ("tmp_obj_", "tmp_pack_")
+TEMP_SUFFIXES = (".idx.tmp",)
+
+# Temporary files younger than this are never deleted, whatever the grace
+# period: a batch in another command may still be about to rename them
+TEMP_MIN_AGE_SECONDS = 60 * 60
+
+
+def get_ref_tips(repo):
+    """
+    Get every commit a ref (loose or packed) or HEAD points to.
+
+    Args:
+        repo: Repository object
+
+    Returns:
+        Set of commit hashes
+    """
+    store = repo.refs
+    tips = {commit_id for _, commit_id in store.list_refs()}
+
+    # A symbolic HEAD ("ref: refs/heads/main") is covered by its target
+    head = store.read_ref("HEAD")
+    if head and not head.startswith("ref: "):
+        tips.add(head)
+    return tips
+
+
+def mark_reachable(tips, index=None, dry_run=False):
+    """
+    Find every object reachable from a set of commits.
+
+    Commit parents and root trees come from the commit-graph; each tree is
+    read only once, however many commits share it.
+
+    Args:
+        tips: Commit hashes to start from
+        index: Index whose blobs and cached trees are kept too (default: None)
+        dry_run: Don't save commits newly added to the commit-graph
+            (default: False)
+
+    Returns:
+        Tuple of (reachable object hashes, reachable commit hashes)
+    """
+    from tree import parse_tree_object
+
+    graph = get_commit_graph()
+    reachable = set()
+    commits = set()
+    trees = []
+
+    stack = list(tips)
+    while stack:
+        commit_id = stack.pop()
+        if commit_id in commits:
+            continue
+        parents = graph.get_parents(commit_id)
+        if parents is None:
+            # Missing or not a commit: nothing more can be reached from it
+            continue
+        commits.add(commit_id)
+        trees.append(graph.get_tree(commit_id))
+        stack.extend(parents)
+    reachable.update(commits)
+
+    if index is not None:
+        # Written by write-tree/commit but maybe not referenced by a commit yet
+        reachable.update(entry.object_id for entry in index.entries.values())
+        trees.extend(object_id for object_id, _ in index.trees.values())
+
+    while trees:
+        tree_id = trees.pop()
+        if tree_id in reachable:
+            continue
+        reachable.add(tree_id)
+        try:
+            entries = parse_tree_object(tree_id)
+        except Exception:
+            continue
+        for mode, _, object_id in entries:
+            if mode == "40000":
+                trees.append(object_id)
+            else:
+                reachable.add(object_id)
+
+    if not dry_run:
+        graph.save()
+    return reachable, commits
+
+
+def prune_loose_objects(reachable, expire_time, dry_run=False):
+    """
+    Delete unreachable loose objects and stale temporary files.
+
+    Args:
+        reachable: Set of object hashes to keep
+        expire_time: Only files last modified before this time are deleted;
+            temporary files must also be older than TEMP_MIN_AGE_SECONDS
+        dry_run: Only count what would be deleted (default: False)
+
+    Returns:
+        Tuple of (objects pruned, bytes freed, temporary files removed)
+    """
+    objects_dir = GitObject.objects_directory()
+    pruned = 0
+    freed = 0
+    temp_files = 0
+    temp_expire_time = min(expire_time, time.time() - TEMP_MIN_AGE_SECONDS)
+
+    directories = [objects_dir, GitObject.pack_directory()]
+    directories.extend(
+        os.path.join(objects_dir, name)
+        for name in sorted(os.listdir(objects_dir))
+        if len(name) == 2
+    )
+
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        fanout = directory not in (objects_dir, GitObject.pack_directory())
+        with os.scandir(directory) as children:
+            for child in children:
+                if fanout and len(child.name) == 38:
+                    if os.path.basename(directory) + child.name in reachable:
+                        continue
+                    is_temp = False
+                elif child.name.startswith(TEMP_PREFIXES) or child.name.endswith(TEMP_SUFFIXES):
+                    is_temp = True
+                else:
+                    continue
+
+                stat_result = child.stat()
+                if stat_result.st_mtime >= (temp_expire_time if is_temp else expire_time):
+                    continue
+                if not dry_run:
+                    os.remove(child.path)
+                if is_temp:
+                    temp_files += 1
+                else:
+                    pruned += 1
+                    freed += stat_result.st_size
+
+        if fanout and not dry_run:
+            # Keep the fanout bounded: drop directories that are now empty
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+
+    GitObject.writer.reset_directories()
+    if perf.enabled:
+        perf.count("objects_pruned", pruned)
+    return pruned, freed, temp_files
+
+
+def collect_garbage(expire_days=None, repack=False, dry_run=False):
+    """
+    Remove objects that no ref, HEAD or the index can reach.
+
+    Everything reachable from the refs, HEAD and the index is marked first.
+    Unreachable loose objects older than the grace period are then deleted,
+    along with stale temporary files and empty fanout directories, and
+    unreachable commits are dropped from the commit-graph and the refs are
+    packed. With repack, the remaining reachable objects are folded into a
+    single pack.
+
+    Args:
+        expire_days: Grace period in days (default: gc.expireDays from the
+            config, or 14); 0 prunes every unreachable object
+        repack: Pack the surviving objects afterwards (default: False)
+        dry_run: Only report what would be removed (default: False)
+
+    Returns:
+        Status message string
+    """
+    from config import get_int
+
+    repo = get_repository()
+    if expire_days is None:
+        expire_days = get_int("gc", "expiredays", DEFAULT_EXPIRE_DAYS)
+    now = time.time()
+    expire_time = now - expire_days * SECONDS_PER_DAY
+    if expire_days <= 0:
+        # Also catch objects written within the current clock tick
+        expire_time = now + 1
+
+    GitObject.flush_objects()
+
+    with perf.phase("mark"):
+        reachable, commits = mark_reachable(get_ref_tips(repo), repo.load_index(), dry_run)
+
+    with perf.phase("prune"):
+        pruned, freed, temp_files = prune_loose_objects(reachable, expire_time, dry_run)
+
+    verb = "Would prune" if dry_run else "Pruned"
+    messages = [f"{verb} {pruned} unreachable objects ({freed} bytes), {temp_files} temporary files"]
+    if dry_run:
+        return "\n".join(messages)
+
+    # Thousands of loose ref files cost a file read each; one sorted file doesn't
+    packed = repo.refs.pack_refs()
+    if packed is not None:
+        messages.append(f"Packed {packed} refs")
+
+    graph = get_commit_graph()
+    if any(commit_id not in commits for commit_id in graph.commit_ids):
+        with perf.phase("rewrite commit-graph"):
+            graph.rewrite(commits)
+
+    if repack:
+        from pack import repack_objects
+
+        # Packed objects can't be dated one by one, so an unreachable one is
+        # dropped only once its whole pack is past the grace period
+        keep = set(reachable)
+        for pack in GitObject.get_packs():
+            if os.stat(pack.pack_path).st_mtime >= expire_time:
+                keep.update(pack.object_ids())
+        with perf.phase("repack"):
+            messages.append(repack_objects(all_packs=True, keep=keep))
+
+    return "\n".join(messages)
+
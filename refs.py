@@ -0,0 +1,333 @@
+import os
+import bisect
+from git_object import GitObject
+import perf
+
+
+PACKED_REFS_NAME = "packed-refs"
+PACKED_REFS_HEADER = b"# pack-refs with: sorted\n"
+
+BRANCH_PREFIX = "refs/heads/"
+
+
+class PackedRefs:
+    """
+    Refs stored together in .mygit/packed-refs.
+
+    Each line is "<hash> <refname>", sorted by refname, so a single ref is
+    found by binary search over the raw file without parsing the rest.
+    Loose ref files always take precedence over packed entries.
+    """
+
+    def __init__(self, data=b""):
+        self.data = data
+        self._starts = None
+        self._names = None
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a packed-refs file.
+
+        Args:
+            path: Path to the packed-refs file
+
+        Returns:
+            PackedRefs object (empty if the file doesn't exist)
+        """
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return cls()
+        if data.startswith(b"#"):
+            data = data[data.find(b"\n") + 1:]
+        return cls(data)
+
+    def _line_starts(self):
+        """Offsets of every line, computed on first use."""
+        if self._starts is None:
+            starts = [0]
+            find = self.data.find
+            position = find(b"\n")
+            while position != -1 and position + 1 < len(self.data):
+                starts.append(position + 1)
+                position = find(b"\n", position + 1)
+            self._starts = starts if self.data else []
+        return self._starts
+
+    def _line_at(self, start):
+        end = self.data.find(b"\n", start)
+        if end == -1:
+            end = len(self.data)
+        return self.data[start:end]
+
+    def lookup(self, refname):
+        """
+        Find a ref by binary search.
+
+        Args:
+            refname: Full ref name, e.g. "refs/heads/main"
+
+        Returns:
+            Commit hash, or None if the ref isn't packed
+        """
+        target = refname.encode("utf-8")
+        low, high = 0, len(self.data)
+        # Bisect on byte offsets, snapping each probe to the start of its line
+        while low < high:
+            middle = (low + high) // 2
+            start = self.data.rfind(b"\n", 0, middle) + 1
+            line = self._line_at(start)
+            name = line[41:]
+            if name == target:
+                return line[:40].decode("ascii")
+            if name < target:
+                low = start + len(line) + 1
+            else:
+                high = start
+        return None
+
+    def names(self):
+        """Return every packed ref name, sorted."""
+        if self._names is None:
+            self._names = [self._line_at(start)[41:].decode("utf-8") for start in self._line_starts()]
+        return self._names
+
+    def items(self, prefix=""):
+        """
+        List packed refs whose name starts with prefix.
+
+        Returns:
+            List of (refname, commit hash) tuples sorted by name
+        """
+        names = self.names()
+        starts = self._line_starts()
+        position = bisect.bisect_left(names, prefix)
+        items = []
+        while position < len(names) and names[position].startswith(prefix):
+            items.append((names[position], self._line_at(starts[position])[:40].decode("ascii")))
+            position += 1
+        return items
+
+
+def _stat_key(stat_result):
+    return stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino
+
+
+class RefStore:
+    """
+    Per-process cache of the refs of one repository.
+
+    Every loose ref file and the packed-refs file is read once and kept
+    with the stat data it had; later lookups only stat the file and reread
+    it if it changed, so resolving or listing many refs doesn't reopen
+    every file each time.
+    """
+
+    def __init__(self, mygit_dir):
+        self.mygit_dir = mygit_dir
+        self.packed_path = os.path.join(mygit_dir, PACKED_REFS_NAME)
+        self._loose = {}
+        self._packed = None
+        self._packed_key = None
+
+    def _ref_path(self, refname):
+        return os.path.join(self.mygit_dir, *refname.split("/"))
+
+    def packed_refs(self):
+        """Return the packed refs, reloading them if the file changed."""
+        try:
+            key = _stat_key(os.stat(self.packed_path))
+        except FileNotFoundError:
+            key = None
+        if self._packed is None or key != self._packed_key:
+            self._packed = PackedRefs.load(self.packed_path) if key is not None else PackedRefs()
+            self._packed_key = key
+        return self._packed
+
+    def _read_loose(self, refname, path, stat_result):
+        """Return the content of a loose ref file, from the cache if unchanged."""
+        key = _stat_key(stat_result)
+        cached = self._loose.get(refname)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        if perf.enabled:
+            perf.count("ref_files_read")
+        with open(path, "r") as f:
+            value = f.read().strip()
+        self._loose[refname] = (key, value)
+        return value
+
+    def read_ref(self, refname):
+        """
+        Read a ref.
+
+        Args:
+            refname: "HEAD" or a full ref name, e.g. "refs/heads/main"
+
+        Returns:
+            The stored value (a commit hash, or "ref: ..." for HEAD), or
+            None if the ref doesn't exist or is empty
+        """
+        path = self._ref_path(refname)
+        try:
+            stat_result = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            self._loose.pop(refname, None)
+            return self.packed_refs().lookup(refname)
+        return self._read_loose(refname, path, stat_result) or None
+
+    def ref_exists(self, refname):
+        """Return True if the ref exists as a loose file or a packed entry."""
+        return os.path.isfile(self._ref_path(refname)) or self.packed_refs().lookup(refname) is not None
+
+    def list_refs(self, prefix="refs/"):
+        """
+        List refs whose name starts with prefix.
+
+        Args:
+            prefix: Ref name prefix (default: "refs/", every ref)
+
+        Returns:
+            List of (refname, commit hash) tuples sorted by name; refs
+            that exist but don't point at a commit yet are left out
+        """
+        refs = dict(self.packed_refs().items(prefix))
+
+        # Only walk the directory the prefix can match in
+        directory_prefix = prefix if prefix.endswith("/") else prefix.rpartition("/")[0]
+        top = self._ref_path(directory_prefix.rstrip("/") or "refs")
+        for directory, directories, files in os.walk(top):
+            directories.sort()
+            relative = os.path.relpath(directory, self.mygit_dir).replace(os.sep, "/")
+            for name in files:
+                refname = f"{relative}/{name}"
+                if not refname.startswith(prefix) or name.endswith(".lock"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    value = self._read_loose(refname, path, os.stat(path))
+                except FileNotFoundError:
+                    continue
+                if value:
+                    refs[refname] = value
+                else:
+                    refs.pop(refname, None)
+
+        return sorted(refs.items())
+
+    def update_ref(self, refname, value, old_value=None):
+        """
+        Point a ref at a new value.
+
+        The loose file is written to a temporary file and renamed into
+        place, so readers never see a partial ref; it shadows any packed
+        entry for the same name.
+
+        Args:
+            refname: "HEAD" or a full ref name
+            value: Commit hash, or "ref: ..." for a symbolic HEAD
+            old_value: Only update the ref if it still holds this value;
+                the check is made under an exclusive lock (default: None,
+                update unconditionally)
+
+        Returns:
+            True if the ref was updated, False if it no longer held
+            old_value or another process was updating it
+        """
+        # Objects must be in place before a ref can point at them
+        GitObject.flush_objects()
+
+        path = self._ref_path(refname)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".lock"
+        if old_value is None:
+            temp_file = open(temp_path, "w")
+        else:
+            try:
+                temp_file = open(temp_path, "x")
+            except FileExistsError:
+                return False
+            if self.read_ref(refname) != old_value:
+                temp_file.close()
+                os.remove(temp_path)
+                return False
+        with temp_file:
+            temp_file.write(value + "\n")
+        os.replace(temp_path, path)
+        self._loose[refname] = (_stat_key(os.stat(path)), value)
+        return True
+
+    def pack_refs(self):
+        """
+        Move every loose ref under refs/ into the packed-refs file.
+
+        The new file is written under a lock and renamed into place before
+        any loose file is removed, and a loose file is only removed if it
+        still holds the value that was packed.
+
+        Returns:
+            Number of refs in the packed-refs file, or None if another
+            process holds the lock
+        """
+        lock_path = self.packed_path + ".lock"
+        try:
+            lock_fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        except FileExistsError:
+            return None
+
+        try:
+            # Rereads anything changed since it was cached
+            refs = self.list_refs()
+            loose = {
+                refname: self._loose[refname][1]
+                for refname, _ in refs
+                if refname in self._loose and os.path.isfile(self._ref_path(refname))
+            }
+
+            with os.fdopen(lock_fd, "wb") as f:
+                f.write(PACKED_REFS_HEADER)
+                f.write(b"".join(f"{value} {refname}\n".encode("utf-8") for refname, value in refs))
+        except BaseException:
+            os.remove(lock_path)
+            raise
+        os.replace(lock_path, self.packed_path)
+
+        for refname, value in loose.items():
+            path = self._ref_path(refname)
+            try:
+                with open(path, "r") as f:
+                    if f.read().strip() != value:
+                        continue
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._loose.pop(refname, None)
+        return len(refs)
+
+
+# Ref stores of this process by .mygit directory
+_stores = {}
+
+
+def get_ref_store(mygit_dir):
+    """
+    Get the ref cache of a repository.
+
+    Args:
+        mygit_dir: Path to the repository's .mygit directory
+
+    Returns:
+        RefStore object, shared by every caller in this process
+    """
+    mygit_dir = os.path.abspath(mygit_dir)
+    store = _stores.get(mygit_dir)
+    if store is None:
+        store = _stores[mygit_dir] = RefStore(mygit_dir)
+    return store
+
+
+def branch_ref(branch_name):
+    """Return the full ref name of a branch."""
+    return BRANCH_PREFIX + branch_name
@@ -0,0 +1,158 @@
+import os
+
+
+MYGIT_DIR_NAME = ".mygit"
+
+
+def find_root(path="."):
+    """
+    Find the root directory of the repository containing a path.
+
+    Traverses up from the given path until a .mygit directory is found.
+
+    Args:
+        path: Starting path (default: current directory)
+
+    Returns:
+        Absolute path to the repository root
+
+    Raises:
+        FileNotFoundError: If .mygit directory is not found
+    """
+    path = os.path.abspath(path)
+    current = path if os.path.isdir(path) else os.path.dirname(path)
+
+    while True:
+        if os.path.isdir(os.path.join(current, MYGIT_DIR_NAME)):
+            return current
+
+        parent = os.path.dirname(current)
+        if parent == current:
+            # Reached filesystem root without finding .mygit
+            raise FileNotFoundError("Could not find .mygit directory")
+        current = parent
+
+
+class Repository:
+    """
+    One MyGit repository: its root, the paths inside .mygit and the state
+    loaded from them.
+
+    The root is resolved once, every path is absolute (so commands work
+    from any subdirectory), and the config, ignore rules, ref cache and
+    pack files are loaded on first use and kept for the life of the
+    object. Most code uses the process-wide current repository from
+    get_repository().
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.mygit_dir = os.path.join(self.root, MYGIT_DIR_NAME)
+        self.objects_dir = os.path.join(self.mygit_dir, "objects")
+        self.pack_dir = os.path.join(self.objects_dir, "pack")
+        self.index_path = os.path.join(self.mygit_dir, "index")
+        self.config_path = os.path.join(self.mygit_dir, "config")
+        self.commit_graph_path = os.path.join(self.mygit_dir, "commit-graph")
+        self.ignore_path = os.path.join(self.root, "ignore.txt")
+
+        # Open PackFile objects of the object store (see GitObject.get_packs)
+        self.packs = None
+        # FileSystemMonitor watching the worktree, if one runs in this process
+        self.fsmonitor = None
+        # Settings derived from the config (see config.get_compression_settings)
+        self.compression_settings = None
+        self._config = None
+        self._ignore_patterns = None
+        self._ignore_rules = None
+
+    @classmethod
+    def discover(cls, path="."):
+        """
+        Open the repository containing a path.
+
+        Raises:
+            FileNotFoundError: If path is not inside a repository
+        """
+        return cls(find_root(path))
+
+    @property
+    def config(self):
+        """The parsed .mygit/config (a configparser.ConfigParser)."""
+        if self._config is None:
+            from config import load_config
+            self._config = load_config(self.config_path)
+        return self._config
+
+    @property
+    def ignore_patterns(self):
+        """List of names to ignore, from ignore.txt at the repository root."""
+        if self._ignore_patterns is None:
+            try:
+                with open(self.ignore_path, "r") as f:
+                    self._ignore_patterns = f.read().splitlines()
+            except FileNotFoundError:
+                self._ignore_patterns = []
+        return self._ignore_patterns
+
+    @property
+    def ignore_rules(self):
+        """Compiled IgnoreRules from ignore.txt and every .mygitignore file."""
+        if self._ignore_rules is None:
+            from ignore import IgnoreRules
+            self._ignore_rules = IgnoreRules(self.ignore_patterns, self.root)
+        return self._ignore_rules
+
+    @property
+    def refs(self):
+        """The RefStore caching this repository's refs."""
+        from refs import get_ref_store
+        return get_ref_store(self.mygit_dir)
+
+    def load_index(self):
+        """Load the index (stat cache) of the repository."""
+        from index import Index
+        return Index.load(self.index_path)
+
+    def invalidate(self):
+        """Forget the config and ignore rules so they are reread on next use."""
+        self._config = None
+        self._ignore_patterns = None
+        self._ignore_rules = None
+        self.compression_settings = None
+
+
+# Repository the commands of this process operate on
+_current = None
+
+
+def get_repository():
+    """
+    Get the current repository, discovering it from the working directory
+    on first use.
+
+    Returns:
+        Repository object
+
+    Raises:
+        FileNotFoundError: If the working directory is not inside a repository
+    """
+    global _current
+    if _current is None:
+        _current = Repository.discover()
+    return _current
+
+
+def set_repository(repo):
+    """
+    Make a repository the current one (None rediscovers it on next use).
+
+    Args:
+        repo: Repository object, or None
+
+    Returns:
+        The previously current repository (or None)
+    """
+    global _current
+    previous = _current
+    _current = repo
+    return previous
@@ -1,48 +1,210 @@
 import os
+from concurrent.futures import ThreadPoolExecutor, Future
 from git_object import GitObject
 from blob import hash_file_to_blob, read_git_object
-from help import find_repo_root
+from help import find_repo_root, get_ignore_patterns
+from ignore import as_ignore_rules, IGNORE_FILE_NAME
+from repository import get_repository
+import perf
 
 
-def create_tree_object(directory_path, ignore_patterns):
+def create_tree_object(directory_path, ignore_patterns, index=None, prefix="", jobs=1, write=True, changed_paths=None):
     """
     Create a tree object from a directory.
     
     Args:
         directory_path: Path to the directory
-        ignore_patterns: List of file/directory names to ignore
+        ignore_patterns: IgnoreRules (or a list of patterns) for paths to skip
+        index: Index used to skip rehashing unchanged files and rebuilding
+            unchanged subtrees (default: None)
+        prefix: Path of directory_path relative to the repository root,
+            used as the index key prefix (default: "")
+        jobs: Number of threads hashing files in parallel (default: 1)
+        write: Whether to store the blobs and trees (default: True). When
+            False only the hashes are computed and the index is only read.
+        changed_paths: Paths a filesystem monitor reports as changed since
+            the index was current (default: None, everything is checked).
+            Other files are taken from the index without a stat, and
+            unchanged directories with a cached tree aren't opened.
         
     Returns:
         SHA-1 hash of the tree object
     """
-    with os.scandir(directory_path) as entries:
-        tree_entries = []
-        
-        for child in entries:
-            if child.name in ignore_patterns:
+    ignore_patterns = as_ignore_rules(ignore_patterns)
+    changes = None
+    if changed_paths is not None and index is not None:
+        changes = (changed_paths, _parent_directories(changed_paths))
+    if jobs > 1:
+        # hashlib and zlib release the GIL, so file hashing scales with threads
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            with perf.phase("scan"):
+                root = _scan_directory(directory_path, ignore_patterns, index, prefix, executor, write, changes)
+            with perf.phase("build trees"):
+                return _build_tree(root, index, write)[0]
+    
+    with perf.phase("scan"):
+        root = _scan_directory(directory_path, ignore_patterns, index, prefix, None, write, changes)
+    with perf.phase("build trees"):
+        return _build_tree(root, index, write)[0]
+
+
+def _parent_directories(paths):
+    """Return every directory containing one of the paths ("" for the root)."""
+    parents = set()
+    for path in paths:
+        while path:
+            path = path.rpartition("/")[0]
+            if path in parents:
+                break
+            parents.add(path)
+    return parents
+
+
+def _scan_directory(directory_path, ignore_patterns, index, prefix, executor, write=True, changes=None):
+    """
+    Walk a directory and start hashing every file the index can't answer for.
+    
+    Ignored directories are skipped before they are opened. With changes
+    (changed paths and their parent directories, from a filesystem monitor)
+    unchanged files and directories are answered by the index alone.
+    
+    Returns:
+        Tuple of (prefix, entries) where each entry is
+        (name, mode, value, stat_result). value is a blob hash, a Future
+        resolving to one, the hash of an unchanged subtree, or the scanned
+        subdirectory; stat_result is set when the index has to be updated
+        with the hash.
+    """
+    entries = []
+    if perf.enabled:
+        perf.count("directories_scanned")
+    
+    with os.scandir(directory_path) as children:
+        for child in children:
+            child_path = prefix + child.name
+            if ignore_patterns.match(child_path, child.is_dir()):
                 continue
             
+            child_changes = changes
+            if changes is not None:
+                changed_paths, changed_parents = changes
+                if child_path in changed_paths or child.is_symlink():
+                    # A changed directory may have been replaced as a whole,
+                    # and changes behind a symlink aren't monitored
+                    child_changes = None
+                elif child.is_dir():
+                    if child_path not in changed_parents:
+                        tree_id = index.get_unchanged_tree(child_path)
+                        if tree_id is not None:
+                            entries.append((child.name, b"40000", tree_id, None))
+                            continue
+                elif child.is_file():
+                    object_id = index.get_unchanged_object_id(child_path)
+                    if object_id is not None:
+                        if perf.enabled:
+                            perf.count("files_scanned")
+                        entries.append((child.name, b"100644", object_id, None))
+                        continue
+            
             if child.is_file():
-                mode = b"100644"
-                object_id = hash_file_to_blob(child)
+                stat_result = None
+                object_id = None
+                if index is not None:
+                    # Stat before reading so a concurrent write invalidates the entry
+                    stat_result = child.stat()
+                    object_id = index.get_object_id(child_path, stat_result)
+                    if object_id is not None:
+                        stat_result = None
+                if perf.enabled:
+                    perf.count("files_scanned")
+                    if object_id is None:
+                        perf.count("files_hashed")
+                if object_id is None:
+                    if executor is not None:
+                        object_id = executor.submit(hash_file_to_blob, child.path, write)
+                    else:
+                        object_id = hash_file_to_blob(child, write)
+                entries.append((child.name, b"100644", object_id, stat_result))
             elif child.is_dir():
-                mode = b"40000"
-                object_id = create_tree_object(
+                subdirectory = _scan_directory(
                     os.path.join(directory_path, child), 
-                    ignore_patterns
+                    ignore_patterns,
+                    index,
+                    child_path + "/",
+                    executor,
+                    write,
+                    child_changes
                 )
-            
-            # Format: mode + space + name + null byte + hash bytes
-            entry_data = mode + b" " + child.name.encode("utf-8") + b"\x00" + bytes.fromhex(object_id)
-            tree_entries.append([child.name, entry_data])
-        
-        # Sort entries by name
-        tree_entries.sort(key=lambda entry: entry[0])
-        
-        # Concatenate all entry data
-        tree_data = b"".join(entry[1] for entry in tree_entries)
-        
-        return GitObject.write_object("tree", tree_data)
+                entries.append((child.name, b"40000", subdirectory, None))
+    
+    return prefix, entries
+
+
+def _collect_entries(scanned_directory, index, write=True):
+    """
+    Resolve the entries of a scanned directory, building subtrees first.
+    
+    Returns:
+        Tuple of (entries, changed): (name, mode, hash) tuples sorted by
+        name, and whether the directory's cached tree can't be reused
+    """
+    prefix, entries = scanned_directory
+    changed = index is None
+    tree_entries = []
+    
+    for name, mode, value, stat_result in entries:
+        if mode == b"40000":
+            if isinstance(value, str):
+                # Unchanged subtree reused as is
+                object_id = value
+            else:
+                object_id, child_changed = _build_tree(value, index, write)
+                changed = changed or child_changed
+        else:
+            object_id = value.result() if isinstance(value, Future) else value
+            if stat_result is not None:
+                if write:
+                    index.update(prefix + name, stat_result, object_id)
+                else:
+                    # The index isn't updated, so its cached trees are stale
+                    changed = True
+        tree_entries.append((name, mode, object_id))
+    
+    # Sort entries by name
+    tree_entries.sort(key=lambda entry: entry[0])
+    return tree_entries, changed
+
+
+def _build_tree(scanned_directory, index, write=True):
+    """
+    Build the tree object of a scanned directory, bottom-up.
+    
+    Returns:
+        Tuple of (tree hash, changed) where changed tells the parent
+        directory that its cached tree can't be reused
+    """
+    prefix = scanned_directory[0]
+    tree_entries, changed = _collect_entries(scanned_directory, index, write)
+    
+    if index is not None:
+        # Unchanged directory: reuse the cached tree without hashing or writing it
+        tree_key = prefix.rstrip("/")
+        cached_id = index.get_cached_tree(tree_key, len(tree_entries))
+        if cached_id is not None and not changed:
+            return cached_id, False
+    
+    # Format: mode + space + name + null byte + hash bytes
+    tree_data = b"".join(
+        mode + b" " + name.encode("utf-8") + b"\x00" + bytes.fromhex(object_id)
+        for name, mode, object_id in tree_entries
+    )
+    
+    tree_hash = GitObject.write_object("tree", tree_data, write)
+    
+    if index is not None and write:
+        index.set_cached_tree(tree_key, tree_hash, len(tree_entries))
+    
+    return tree_hash, True
 
 
 def parse_tree_object(tree_hash):
@@ -57,6 +219,8 @@ def parse_tree_object(tree_hash):
     """
     entries = []
     tree_data = read_git_object(tree_hash)
+    if perf.enabled:
+        perf.count("trees_parsed")
     
     index = 0
     while index < len(tree_data):
@@ -75,19 +239,140 @@ def parse_tree_object(tree_hash):
     return entries
 
 
-def write_tree_from_directory(path="", ignore_patterns=None):
+def diff_trees(old_tree_id, new_tree_id, prefix=""):
+    """
+    Compare two tree objects, yielding only the entries that differ.
+    
+    Both trees are walked together in sorted-merge order. Subtrees with the
+    same hash on both sides are skipped without being read; subtrees present
+    on both sides with different hashes are compared recursively. A subtree
+    that exists on only one side is reported as a single entry.
+    
+    Args:
+        old_tree_id: SHA-1 hash of the old tree (None for an empty tree)
+        new_tree_id: SHA-1 hash of the new tree (None for an empty tree)
+        prefix: Path prepended to every reported name (default: "")
+        
+    Yields:
+        Tuples of (path, old_mode, old_hash, new_mode, new_hash); the
+        mode and hash of a missing side are None
+    """
+    if old_tree_id == new_tree_id:
+        return
+    
+    old_entries = parse_tree_object(old_tree_id) if old_tree_id else []
+    new_entries = parse_tree_object(new_tree_id) if new_tree_id else []
+    
+    old_index = 0
+    new_index = 0
+    while old_index < len(old_entries) or new_index < len(new_entries):
+        old_entry = old_entries[old_index] if old_index < len(old_entries) else None
+        new_entry = new_entries[new_index] if new_index < len(new_entries) else None
+        
+        if new_entry is None or (old_entry is not None and old_entry[1] < new_entry[1]):
+            # Only in the old tree
+            yield prefix + old_entry[1], old_entry[0], old_entry[2], None, None
+            old_index += 1
+        elif old_entry is None or new_entry[1] < old_entry[1]:
+            # Only in the new tree
+            yield prefix + new_entry[1], None, None, new_entry[0], new_entry[2]
+            new_index += 1
+        else:
+            old_mode, name, old_hash = old_entry
+            new_mode, _, new_hash = new_entry
+            if old_mode == "40000" and new_mode == "40000":
+                yield from diff_trees(old_hash, new_hash, prefix + name + "/")
+            elif old_mode != new_mode or old_hash != new_hash:
+                yield prefix + name, old_mode, old_hash, new_mode, new_hash
+            old_index += 1
+            new_index += 1
+
+
+def write_tree_from_directory(path="", ignore_patterns=None, jobs=1):
     """
     Create a tree object from a directory in the repository.
     
     Args:
         path: Relative path from repository root (default: "")
-        ignore_patterns: List of patterns to ignore (default: None)
+        ignore_patterns: IgnoreRules (or a list of patterns) for paths to
+            skip (default: None, the repository's rules)
+        jobs: Number of threads hashing files in parallel (default: 1)
         
     Returns:
         SHA-1 hash of the tree object
     """
-    directory_path = os.path.join(find_repo_root(path), path)
-    return create_tree_object(directory_path, ignore_patterns)
+    repo_root = find_repo_root(path)
+    directory_path = os.path.join(repo_root, path)
+    
+    # Index keys are '/'-separated paths relative to the repository root
+    prefix = os.path.relpath(directory_path, repo_root).replace(os.sep, "/")
+    prefix = "" if prefix == "." else prefix + "/"
+    
+    if ignore_patterns is None:
+        ignore_patterns = get_ignore_patterns()
+    
+    repo = get_repository()
+    index = repo.load_index()
+    changed_paths = None
+    monitor = repo.fsmonitor
+    if monitor is not None:
+        # Take the new token first: anything changing during the scan is
+        # reported again next time
+        token = monitor.token()
+        changed_paths = _monitored_changes(monitor, index)
+        if perf.enabled:
+            if changed_paths is None:
+                perf.count("fsmonitor_full_scans")
+            else:
+                perf.count("fsmonitor_changed_paths", len(changed_paths))
+    
+    with perf.phase("write-tree"):
+        tree_hash = create_tree_object(directory_path, ignore_patterns, index, prefix, jobs, changed_paths=changed_paths)
+    index.remove_unseen(prefix)
+    if monitor is not None and not prefix:
+        # Only a scan of the whole worktree brings every entry up to date
+        index.set_fsmonitor_token(token)
+    index.save()
+    
+    return tree_hash
+
+
+def get_monitored_changes(index):
+    """
+    Ask the repository's filesystem monitor what changed since the index
+    was last brought up to date.
+    
+    Args:
+        index: Loaded Index
+        
+    Returns:
+        Tuple of (changed paths, their parent directories), or None if no
+        monitor runs or the whole worktree has to be checked
+    """
+    monitor = get_repository().fsmonitor
+    if monitor is None:
+        return None
+    changed_paths = _monitored_changes(monitor, index)
+    if changed_paths is None:
+        return None
+    return changed_paths, _parent_directories(changed_paths)
+
+
+def _monitored_changes(monitor, index):
+    """
+    Get the paths changed since the index was last brought up to date.
+    
+    Returns:
+        Set of changed paths, or None if the whole worktree has to be scanned
+    """
+    changed_paths = monitor.changes_since(index.fsmonitor_token)
+    if changed_paths is None:
+        return None
+    # Edited ignore rules can change any path's status
+    for path in changed_paths:
+        if path == "ignore.txt" or path.rpartition("/")[2] == IGNORE_FILE_NAME:
+            return None
+    return changed_paths
 
 
 def list_tree_contents(path="", ignore_patterns=None, names_only=False, object_id=None):
@@ -96,7 +381,8 @@ def list_tree_contents(path="", ignore_patterns=None, names_only=False, object_i
     
     Args:
         path: Relative path from repository root (default: "")
-        ignore_patterns: List of patterns to ignore (default: None)
+        ignore_patterns: IgnoreRules (or a list of patterns) for paths to
+            skip (default: None, the repository's rules)
         names_only: If True, only return names, not full info (default: False)
         object_id: Specific tree hash to list (default: None, will compute from path)
         
@@ -104,12 +390,24 @@ def list_tree_contents(path="", ignore_patterns=None, names_only=False, object_i
         String with tree contents, one entry per line
     """
     if object_id:
-        tree_hash = object_id
+        entries = parse_tree_object(object_id)
     else:
-        directory_path = os.path.join(find_repo_root(path), path)
-        tree_hash = create_tree_object(directory_path, ignore_patterns)
-    
-    entries = parse_tree_object(tree_hash)
+        repo_root = find_repo_root(path)
+        directory_path = os.path.join(repo_root, path)
+        prefix = os.path.relpath(directory_path, repo_root).replace(os.sep, "/")
+        prefix = "" if prefix == "." else prefix + "/"
+        
+        # Listing the worktree must not leave new objects behind: hash the
+        # directory without writing, reusing (but not updating) the index
+        if ignore_patterns is None:
+            ignore_patterns = get_ignore_patterns()
+        
+        index = get_repository().load_index()
+        scanned = _scan_directory(directory_path, as_ignore_rules(ignore_patterns), index, prefix, None, write=False)
+        entries = [
+            [mode.decode("ascii"), name, entry_id]
+            for name, mode, entry_id in _collect_entries(scanned, index, write=False)[0]
+        ]
     
     result = []
     for entry in entries:
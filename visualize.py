@@ -9,12 +9,22 @@ from datetime import datetime
 # Add current directory to path
 sys.path.append(os.getcwd())
 
-try:
-    import matplotlib.pyplot as plt
-    import matplotlib.patches as patches
-except ImportError:
-    print("Error: matplotlib is required. Please install it with 'pip install matplotlib'.")
-    sys.exit(1)
+# matplotlib is only needed for drawing; it is imported on first use so that
+# loading this module (e.g. from the CLI) stays cheap
+plt = None
+patches = None
+
+
+def load_matplotlib():
+    """Import matplotlib on demand. Returns False if it isn't installed."""
+    global plt, patches
+    if plt is None:
+        try:
+            import matplotlib.pyplot as plt
+            import matplotlib.patches as patches
+        except ImportError:
+            return False
+    return True
 
 # Helper to read git objects directly if modules fail
 def read_git_object_fallback(object_hash):
@@ -30,10 +40,15 @@ def read_git_object_fallback(object_hash):
 try:
     from blob import read_git_object
     from help import find_repo_root
+    from commit_graph import get_commit_graph
+    from refs import BRANCH_PREFIX
+    from repository import get_repository
 except ImportError:
     # Fallback if running standalone without simplified path
     read_git_object = read_git_object_fallback
     find_repo_root = lambda: os.getcwd()
+    get_commit_graph = None
+    get_repository = None
 
 class CommitGraph:
     def __init__(self):
@@ -57,7 +72,11 @@ class CommitGraph:
 
         # 2. Read Branches
         refs_dir = os.path.join(".mygit", "refs", "heads")
-        if os.path.exists(refs_dir):
+        if get_repository:
+            # Loose and packed branches, read through the ref cache
+            for refname, commit_id in get_repository().refs.list_refs(BRANCH_PREFIX):
+                self.branches[refname[len(BRANCH_PREFIX):]] = commit_id
+        elif os.path.exists(refs_dir):
             for branch_name in os.listdir(refs_dir):
                 path = os.path.join(refs_dir, branch_name)
                 with open(path, "r") as f:
@@ -72,7 +91,7 @@ class CommitGraph:
                 if content.startswith("ref:"):
                     # HEAD points to branch
                     ref = content.split(" ")[1]
-                    branch_name = os.path.basename(ref)
+                    branch_name = ref[len("refs/heads/"):] if ref.startswith("refs/heads/") else os.path.basename(ref)
                     if branch_name in self.branches:
                         self.head_commit = self.branches[branch_name]
                 else:
@@ -87,6 +106,7 @@ class CommitGraph:
         
         queue = list(set(start_nodes)) # Unique
         visited = set()
+        graph = get_commit_graph() if get_commit_graph else None
 
         while queue:
             commit_id = queue.pop(0)
@@ -96,18 +116,21 @@ class CommitGraph:
 
             # Parse commit
             try:
-                data = read_git_object(commit_id)
-                if not data:
-                    continue
-                text = data.decode('utf-8', errors='replace')
-                
-                parents = []
-                lines = text.split('\n')
-                for line in lines:
-                    if line.startswith('parent '):
-                        parents.append(line.split(' ')[1])
-                    elif line == '':
-                        break
+                # The commit-graph answers without touching the object store
+                parents = graph.get_parents(commit_id) if graph else None
+                if parents is None:
+                    data = read_git_object(commit_id)
+                    if not data:
+                        continue
+                    text = data.decode('utf-8', errors='replace')
+                    
+                    parents = []
+                    lines = text.split('\n')
+                    for line in lines:
+                        if line.startswith('parent '):
+                            parents.append(line.split(' ')[1])
+                        elif line == '':
+                            break
                 
                 # Store
                 if commit_id not in self.commits:
@@ -128,6 +151,9 @@ class CommitGraph:
             except Exception as e:
                 print(f"Error reading commit {commit_id}: {e}")
 
+        if graph:
+            graph.save()
+
         # Post-process: Build children links and identify roots
         for cid, data in self.commits.items():
             if not data['parents']:
@@ -323,17 +349,22 @@ class CommitGraph:
             ax.set_ylim(min(ys) - 1, max(ys) + 1)
         
         plt.tight_layout()
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
         plt.savefig(output_path)
         print(f"Graph saved to {output_path}")
 
-def main():
+def main(output_path=None):
+    if not load_matplotlib():
+        print("Error: matplotlib is required. Please install it with 'pip install matplotlib'.")
+        sys.exit(1)
+
     graph = CommitGraph()
     graph.load()
     graph.layout()
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_path = os.path.join("commit_graph_images", f"a.png")
+    if output_path is None:
+        output_path = os.path.join("commit_graph_images", f"a.png")
     
     graph.draw(output_path)
 